@@ -0,0 +1,39 @@
+"""Index shipped cartons.
+
+Revision ID: b3f6d21c8e47
+Revises: 5c1e7a0f93b2
+Create Date: 2026-10-18 04:25:14.000000+00:00
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b3f6d21c8e47"
+down_revision = "5c1e7a0f93b2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Build the index without blocking label creation on a large table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_shipments_carton_number_shipped",
+            "shipments",
+            ["carton_number"],
+            unique=False,
+            postgresql_where=sa.text("status = 'shipped'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_shipments_carton_number_shipped",
+            table_name="shipments",
+            postgresql_where=sa.text("status = 'shipped'"),
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,39 @@
+"""Index in-flight cartons.
+
+Revision ID: 0e9d4a6b5f21
+Revises: b3f6d21c8e47
+Create Date: 2026-10-18 05:58:37.000000+00:00
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0e9d4a6b5f21"
+down_revision = "b3f6d21c8e47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Build the index without blocking label creation on a large table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_shipments_carton_number_in_flight",
+            "shipments",
+            ["carton_number"],
+            unique=False,
+            postgresql_where=sa.text("status = 'in_flight'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_shipments_carton_number_in_flight",
+            table_name="shipments",
+            postgresql_where=sa.text("status = 'in_flight'"),
+            postgresql_concurrently=True,
+        )
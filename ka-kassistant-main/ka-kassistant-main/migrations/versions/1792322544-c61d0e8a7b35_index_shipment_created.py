@@ -0,0 +1,36 @@
+"""Index shipment created time.
+
+Revision ID: c61d0e8a7b35
+Revises: 4f8b1c62e0a9
+Create Date: 2026-10-18 11:22:24.000000+00:00
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c61d0e8a7b35"
+down_revision = "4f8b1c62e0a9"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Build the index without blocking label creation on a large table
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_shipments_created",
+            "shipments",
+            ["created"],
+            unique=False,
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_shipments_created",
+            table_name="shipments",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,310 @@
+"""Partition shipments by month.
+
+Rebuilds `shipments` as a table partitioned by month on `created`, copying every shipment across,
+and adds the payload archive and the summary columns that stay behind when payloads are archived.
+
+Foreign keys can't reference a partitioned table by `id` alone, so the foreign keys from the tracking outbox
+and shipment labels are dropped.
+
+The copy rewrites the whole table, so run this migration while the app is stopped.
+
+Revision ID: 2d5f8a3e6b91
+Revises: 9e2b7d4c1a06
+Create Date: 2026-10-18 14:35:02.000000+00:00
+
+"""
+
+import json
+import zlib
+from datetime import UTC, datetime
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "2d5f8a3e6b91"
+down_revision = "9e2b7d4c1a06"
+branch_labels = None
+depends_on = None
+
+PARTITION_MONTHS_AHEAD = 3
+
+INDEXES = [
+    ("ix_shipments_created", ["created"], None),
+    ("ix_shipments_carton_number_shipped", ["carton_number"], "status = 'shipped'"),
+    ("ix_shipments_carton_number_in_flight", ["carton_number"], "status = 'in_flight'"),
+    ("ix_shipments_label_job_id", ["label_job_id"], "label_job_id IS NOT NULL"),
+]
+PAYLOAD_COLUMNS = ["fedex_create_label_request", "fedex_create_label_response", "kerp_tracking_upload_response"]
+SHARED_COLUMNS = [
+    "id",
+    "carton_number",
+    "tracking_number",
+    "status",
+    *PAYLOAD_COLUMNS,
+    "label_job_id",
+    "created",
+    "updated",
+    "deleted",
+]
+
+
+def create_indexes(extra_indexes: list[tuple[str, list[str], str | None]]) -> None:
+    for name, columns, where in [*INDEXES, *extra_indexes]:
+        op.create_index(
+            name,
+            "shipments",
+            columns,
+            unique=False,
+            postgresql_where=sa.text(where) if where else None,
+        )
+
+
+def drop_indexes(table_name: str, extra_indexes: list[tuple[str, list[str], str | None]]) -> None:
+    for name, _, _ in [*INDEXES, *extra_indexes]:
+        op.drop_index(name, table_name=table_name)
+
+
+def months(first: datetime, last: datetime) -> list[tuple[datetime, datetime]]:
+    bounds = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)  # noqa: PLR2004
+        bounds.append((datetime(year, month, 1, tzinfo=UTC), datetime(next_year, next_month, 1, tzinfo=UTC)))
+        year, month = next_year, next_month
+    return bounds
+
+
+def upgrade() -> None:
+    op.drop_constraint("kerp_tracking_outbox_shipment_id_fkey", "kerp_tracking_outbox", type_="foreignkey")
+    op.drop_constraint("shipment_labels_shipment_id_fkey", "shipment_labels", type_="foreignkey")
+
+    # Move the old table out of the way, freeing its index names
+    drop_indexes("shipments", [])
+    op.rename_table("shipments", "shipments_unpartitioned")
+    op.execute("ALTER TABLE shipments_unpartitioned RENAME CONSTRAINT shipments_pkey TO shipments_unpartitioned_pkey")
+
+    op.create_table(
+        "shipments",
+        sa.Column(
+            "id",
+            sa.UUID(),
+            server_default=sa.text("uuid_generate_v4()"),
+            nullable=False,
+            comment="Unique ID for this shipment",
+        ),
+        sa.Column(
+            "created",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="The date and time the object was created",
+        ),
+        sa.Column("carton_number", sa.String(), nullable=False, comment="K-ERP carton number"),
+        sa.Column("tracking_number", sa.String(), nullable=True, comment="FedEx tracking number"),
+        sa.Column("status", sa.String(), nullable=False, comment="Shipment status"),
+        sa.Column("service", sa.String(), nullable=True, comment="FedEx service type"),
+        sa.Column("ship_date", sa.Date(), nullable=True, comment="Ship date"),
+        sa.Column(
+            "fedex_create_label_request",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="FedEx label creation request data",
+        ),
+        sa.Column(
+            "fedex_create_label_response",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="FedEx label creation response data",
+        ),
+        sa.Column("kerp_tracking_upload_response", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column(
+            "label_job_id",
+            sa.UUID(),
+            nullable=True,
+            comment="Label job the shipment was created by (NULL if created directly)",
+        ),
+        sa.Column(
+            "archived_at",
+            sa.DateTime(timezone=True),
+            nullable=True,
+            comment="The date and time the payloads were moved to the archive (NULL if not archived)",
+        ),
+        sa.Column(
+            "updated",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="The date and time the object was last updated",
+        ),
+        sa.Column(
+            "deleted",
+            sa.DateTime(timezone=True),
+            nullable=True,
+            comment="The date and time the object was deleted (NULL if not deleted)",
+        ),
+        sa.ForeignKeyConstraint(["label_job_id"], ["label_jobs.id"]),
+        sa.PrimaryKeyConstraint("id", "created"),
+        postgresql_partition_by="RANGE (created)",
+    )
+
+    # One partition for every month with shipments, and a few months ahead.
+    # The app creates later months' partitions as it goes.
+    connection = op.get_bind()
+    now = datetime.now(tz=UTC)
+    first = connection.execute(sa.text("SELECT min(created) FROM shipments_unpartitioned")).scalar() or now
+    last = datetime(
+        now.year + (now.month + PARTITION_MONTHS_AHEAD - 1) // 12,
+        (now.month + PARTITION_MONTHS_AHEAD - 1) % 12 + 1,
+        1,
+        tzinfo=UTC,
+    )
+    for start, end in months(first.astimezone(UTC), last):
+        op.execute(
+            f"CREATE TABLE shipments_{start:%Y_%m} PARTITION OF shipments "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')",
+        )
+
+    # Fill in the summary columns from the stored label requests
+    columns = ", ".join(SHARED_COLUMNS)
+    op.execute(
+        f"INSERT INTO shipments ({columns}, service, ship_date) "  # noqa: S608
+        f"SELECT {columns}, "
+        "fedex_create_label_request #>> '{requestedShipment,serviceType}', "
+        "CAST(fedex_create_label_request #>> '{requestedShipment,shipDatestamp}' AS date) "
+        "FROM shipments_unpartitioned",
+    )
+    op.drop_table("shipments_unpartitioned")
+
+    # Indexes on the partitioned table are created on every partition
+    create_indexes([("ix_shipments_created_unarchived", ["created"], "archived_at IS NULL")])
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table(
+        "shipment_payload_archive",
+        sa.Column("shipment_id", sa.UUID(), nullable=False, comment="Shipment the payloads belong to"),
+        sa.Column(
+            "payloads",
+            sa.LargeBinary(),
+            nullable=False,
+            comment="zlib-compressed JSON of the shipment's FedEx request and response and K-ERP response",
+        ),
+        sa.Column(
+            "created",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="The date and time the object was created",
+        ),
+        sa.Column(
+            "updated",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="The date and time the object was last updated",
+        ),
+        sa.Column(
+            "deleted",
+            sa.DateTime(timezone=True),
+            nullable=True,
+            comment="The date and time the object was deleted (NULL if not deleted)",
+        ),
+        sa.PrimaryKeyConstraint("shipment_id"),
+    )
+    # ### end Alembic commands ###
+
+
+def downgrade() -> None:
+    # Put archived payloads back before the archive is dropped
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text("SELECT shipment_id, payloads FROM shipment_payload_archive").execution_options(yield_per=500),
+    )
+    for batch in rows.partitions():
+        connection.execute(
+            sa.text(
+                "UPDATE shipments SET "
+                "fedex_create_label_request = CAST(:fedex_create_label_request AS jsonb), "
+                "fedex_create_label_response = CAST(:fedex_create_label_response AS jsonb), "
+                "kerp_tracking_upload_response = CAST(:kerp_tracking_upload_response AS jsonb) "
+                "WHERE id = :shipment_id",
+            ),
+            [
+                {
+                    "shipment_id": shipment_id,
+                    **{
+                        column: None if payload is None else json.dumps(payload)
+                        for column, payload in json.loads(zlib.decompress(payloads)).items()
+                    },
+                }
+                for shipment_id, payloads in batch
+            ],
+        )
+    op.drop_table("shipment_payload_archive")
+
+    drop_indexes("shipments", [("ix_shipments_created_unarchived", ["created"], "archived_at IS NULL")])
+    op.rename_table("shipments", "shipments_partitioned")
+    op.execute("ALTER TABLE shipments_partitioned RENAME CONSTRAINT shipments_pkey TO shipments_partitioned_pkey")
+
+    op.create_table(
+        "shipments",
+        sa.Column(
+            "id",
+            sa.UUID(),
+            server_default=sa.text("uuid_generate_v4()"),
+            nullable=False,
+            comment="Unique ID for this shipment",
+        ),
+        sa.Column("carton_number", sa.String(), nullable=False, comment="K-ERP carton number"),
+        sa.Column("tracking_number", sa.String(), nullable=True, comment="FedEx tracking number"),
+        sa.Column("status", sa.String(), nullable=False, comment="Shipment status"),
+        sa.Column(
+            "fedex_create_label_request",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="FedEx label creation request data",
+        ),
+        sa.Column(
+            "fedex_create_label_response",
+            postgresql.JSONB(astext_type=sa.Text()),
+            nullable=True,
+            comment="FedEx label creation response data",
+        ),
+        sa.Column(
+            "created",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="The date and time the object was created",
+        ),
+        sa.Column(
+            "updated",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+            comment="The date and time the object was last updated",
+        ),
+        sa.Column(
+            "deleted",
+            sa.DateTime(timezone=True),
+            nullable=True,
+            comment="The date and time the object was deleted (NULL if not deleted)",
+        ),
+        sa.Column("kerp_tracking_upload_response", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column(
+            "label_job_id",
+            sa.UUID(),
+            nullable=True,
+            comment="Label job the shipment was created by (NULL if created directly)",
+        ),
+        sa.ForeignKeyConstraint(["label_job_id"], ["label_jobs.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    columns = ", ".join(SHARED_COLUMNS)
+    op.execute(f"INSERT INTO shipments ({columns}) SELECT {columns} FROM shipments_partitioned")  # noqa: S608
+    op.drop_table("shipments_partitioned")
+    create_indexes([])
+
+    op.create_foreign_key(None, "shipment_labels", "shipments", ["shipment_id"], ["id"])
+    op.create_foreign_key(None, "kerp_tracking_outbox", "shipments", ["shipment_id"], ["id"])
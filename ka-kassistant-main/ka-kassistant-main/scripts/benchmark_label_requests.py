@@ -0,0 +1,140 @@
+"""Measure the per-carton cost of building and serializing label creation requests.
+
+Compares building and validating a whole `FedExShipmentRequest` for every carton and dumping it twice,
+once for the HTTP call and once to store it, as labels used to be built,
+with filling each carton into a wave's `LabelRequestTemplate` and serializing it once.
+
+Run with `uv run python scripts/benchmark_label_requests.py`.
+"""
+
+import json
+import timeit
+
+from kerp_sdk.api_models import Carton
+
+from kassistant.fedex import (
+    Address,
+    Contact,
+    CustomerReference,
+    FedExShipmentRequest,
+    Recipient,
+    RequestedPackageLineItem,
+    RequestedShipment,
+    ShipmentSpecialServices,
+    Weight,
+)
+from kassistant.forms import LabelRequestForm
+from kassistant.orm import Settings
+from kassistant.run_labels import build_label_request_template
+
+CARTONS = 1000
+REPEATS = 5
+
+
+def validated_request(
+    carton: Carton,
+    shared: FedExShipmentRequest,
+    shipment_special_services: ShipmentSpecialServices,
+) -> tuple[str, str]:
+    """Build and validate a carton's whole request, and serialize it to send and to store."""
+    request = FedExShipmentRequest(
+        requestedShipment=RequestedShipment(
+            shipper=shared.requestedShipment.shipper,
+            recipients=[
+                Recipient(
+                    contact=Contact(personName=carton.company, phoneNumber=1234567890, companyName=carton.company),
+                    address=Address(
+                        streetLines=[carton.address1, carton.address2],
+                        city=carton.city,
+                        stateOrProvinceCode=carton.state,
+                        postalCode=carton.postal_code,
+                        countryCode="US",
+                    ),
+                ),
+            ],
+            shipDatestamp=shared.requestedShipment.shipDatestamp,
+            serviceType=shared.requestedShipment.serviceType,
+            shippingChargesPayment=shared.requestedShipment.shippingChargesPayment,
+            labelSpecification=shared.requestedShipment.labelSpecification,
+            requestedPackageLineItems=[
+                RequestedPackageLineItem(
+                    weight=Weight(value=carton.weight),
+                    customerReferences=[
+                        CustomerReference(customerReferenceType="CUSTOMER_REFERENCE", value=carton.carton_number),
+                        CustomerReference(customerReferenceType="DEPARTMENT_NUMBER", value=carton.carton_number),
+                        CustomerReference(
+                            customerReferenceType="INVOICE_NUMBER",
+                            value=f"{carton.control_number}-LN {carton.ps_line}",
+                        ),
+                        CustomerReference(
+                            customerReferenceType="P_O_NUMBER",
+                            value=carton.customer_purchase_order,
+                        ),
+                    ],
+                    shipmentSpecialServices=shipment_special_services,
+                ),
+            ],
+        ),
+        accountNumber=shared.accountNumber,
+    )
+    return json.dumps(request.model_dump()), json.dumps(request.model_dump())
+
+
+def main() -> None:
+    """Print the per-carton cost of each way of building requests."""
+    template = build_label_request_template(
+        LabelRequestForm(
+            ship_date="2026-10-19",
+            service="FEDEX_GROUND",
+            billing="SENDER",
+            third_party_account_number="",
+            air_auth=None,
+            carton_numbers="",
+        ),
+        Settings(
+            ship_from_company="Knights Apparel",
+            ship_from_name="Shipping",
+            ship_from_phone="5555550100",
+            ship_from_address_1="1 Main St",
+            ship_from_address_2="",
+            ship_from_city="Spartanburg",
+            ship_from_state="SC",
+            ship_from_postal_code="29301",
+            ship_from_country_code="US",
+            fedex_label_size="STOCK_4X6",
+        ),
+    )
+    cartons = [
+        Carton.model_construct(
+            carton_number=f"C{number:07d}",
+            company="Bookstore",
+            address1="2 College Ave",
+            address2="Suite 3",
+            city="Athens",
+            state="GA",
+            postal_code="30602",
+            weight=12.5,
+            control_number=str(number),
+            ps_line="1",
+            customer_purchase_order="PO-7",
+        )
+        for number in range(CARTONS)
+    ]
+
+    # The old way shared the wave's models between cartons too
+    shared = FedExShipmentRequest.model_validate(template.request)
+    shipment_special_services = ShipmentSpecialServices.model_validate(template.shipment_special_services)
+
+    builds = [
+        ("validated model per carton", lambda carton: validated_request(carton, shared, shipment_special_services)),
+        ("wave template", lambda carton: template.render([carton])),
+    ]
+    for name, build in builds:
+        seconds = min(
+            timeit.repeat(lambda build=build: [build(carton) for carton in cartons], number=1, repeat=REPEATS),
+        )
+        print(f"{name}: {seconds / CARTONS * 1_000_000:.1f} µs per carton")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Check recipients' addresses before their labels are bought, remembering which FedEx accepts."""
+
+import asyncio
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from http import HTTPStatus
+from logging import getLogger
+from typing import Protocol, Self
+
+from kerp_sdk.api_models import Carton
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from .constants import FedEx
+from .fedex import Address, AsyncFedExServices, FedExAddressValidationResponse, fedex_client
+from .orm import AddressValidation, Session
+
+__all__ = [
+    "AddressCache",
+    "AddressValidator",
+    "AddressVerdict",
+    "FedExAddressValidator",
+    "StaticAddressValidator",
+    "address_cache",
+    "address_key",
+    "carton_address",
+]
+
+logger = getLogger(__name__)
+
+
+def address_key(carton: Carton) -> str:
+    """Identify a carton's address, ignoring case and spacing."""
+    return "|".join(
+        " ".join((value or "").split()).casefold()
+        for value in (carton.address1, carton.address2, carton.city, carton.state, carton.postal_code)
+    )
+
+
+def carton_address(carton: Carton) -> Address:
+    """Build a carton's address as FedEx takes it."""
+    return Address(
+        streetLines=[line for line in (carton.address1, carton.address2) if line],
+        city=carton.city,
+        stateOrProvinceCode=carton.state,
+        postalCode=carton.postal_code,
+        countryCode="US",
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class AddressVerdict:
+    """Whether labels can be created for an address, and why not."""
+
+    valid: bool
+    message: str | None = None
+
+
+class AddressValidator(Protocol):
+    """Something to check addresses with."""
+
+    async def validate(self, addresses: Mapping[str, Address]) -> dict[str, AddressVerdict]:
+        """Check addresses, by their key, returning a verdict for each."""
+        ...
+
+
+class FedExAddressValidator:
+    """Check addresses with FedEx's address validation API, `batch_size` at a time."""
+
+    def __init__(self, client: AsyncFedExServices, batch_size: int = 100) -> None:
+        """Initialize the FedExAddressValidator class."""
+        self.client = client
+        self.batch_size = batch_size
+
+    async def validate_batch(self: Self, addresses: Mapping[str, Address]) -> dict[str, AddressVerdict]:
+        """Check up to `batch_size` addresses with one request."""
+        response = await self.client.validate_addresses(list(addresses.values()))
+        validation_response = FedExAddressValidationResponse.model_validate_json(response.content)
+        if response.status_code != HTTPStatus.OK or validation_response.output is None:
+            msg = f"FedEx could not validate addresses: {response.status_code} {validation_response.errors}"
+            raise ValueError(msg)
+
+        resolved_addresses = validation_response.output.resolvedAddresses
+        if len(resolved_addresses) != len(addresses):
+            msg = f"FedEx resolved {len(resolved_addresses)} of {len(addresses)} addresses"
+            raise ValueError(msg)
+
+        verdicts = {}
+        for (key, address), resolved_address in zip(addresses.items(), resolved_addresses, strict=True):
+            problem = resolved_address.problem(address)
+            verdicts[key] = AddressVerdict(valid=problem is None, message=problem)
+        return verdicts
+
+    async def validate(self: Self, addresses: Mapping[str, Address]) -> dict[str, AddressVerdict]:
+        """Check addresses with FedEx."""
+        items = list(addresses.items())
+        batches = await asyncio.gather(
+            *(
+                self.validate_batch(dict(items[start : start + self.batch_size]))
+                for start in range(0, len(items), self.batch_size)
+            ),
+        )
+        return {key: verdict for batch in batches for key, verdict in batch.items()}
+
+
+class StaticAddressValidator:
+    """Reject only the given addresses, by key, with their messages, and accept every other address.
+
+    A stand-in for FedEx, for tests and for environments without access to its address validation API.
+    """
+
+    def __init__(self, invalid: Mapping[str, str] | None = None) -> None:
+        """Initialize the StaticAddressValidator class."""
+        self.invalid = dict(invalid or {})
+
+    async def validate(self: Self, addresses: Mapping[str, Address]) -> dict[str, AddressVerdict]:
+        """Check addresses against the list of invalid ones."""
+        return {
+            key: AddressVerdict(valid=False, message=self.invalid[key])
+            if key in self.invalid
+            else AddressVerdict(valid=True)
+            for key in addresses
+        }
+
+
+class AddressCache:
+    """Check recipients' addresses with `validator`, remembering each verdict in the `address_validations` table.
+
+    Known-good addresses skip the check for `valid_ttl`, and known-bad ones fail at once for `invalid_ttl`,
+    rather than each wave buying, and failing, a label for them. An address fixed in K-ERP is a new address,
+    so it is checked again straight away.
+    If the validator fails, the addresses are assumed to be good, and left for FedEx to reject when labels are bought.
+    Without a validator, every address is assumed to be good.
+    Expired verdicts are pruned every `prune_interval`.
+    """
+
+    def __init__(
+        self,
+        validator: AddressValidator | None,
+        valid_ttl: timedelta = timedelta(days=90),
+        invalid_ttl: timedelta = timedelta(days=7),
+        prune_interval: float = 3600.0,
+    ) -> None:
+        """Initialize the AddressCache class."""
+        self.validator = validator
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self.prune_interval = prune_interval
+
+    async def check(self: Self, cartons: Sequence[Carton]) -> dict[str, str]:
+        """Find the cartons whose address FedEx would reject, returning why, by carton number."""
+        if self.validator is None or not cartons:
+            return {}
+
+        keys = {carton.carton_number: address_key(carton) for carton in cartons}
+        async with Session() as session:
+            rows = await session.execute(
+                select(AddressValidation.address_key, AddressValidation.valid, AddressValidation.message).where(
+                    AddressValidation.address_key.in_(set(keys.values())),
+                    AddressValidation.expires_at > func.now(),
+                ),
+            )
+            verdicts = {key: AddressVerdict(valid=valid, message=message) for key, valid, message in rows.tuples()}
+
+        unchecked = {keys[carton.carton_number]: carton_address(carton) for carton in cartons}
+        unchecked = {key: address for key, address in unchecked.items() if key not in verdicts}
+        if unchecked:
+            verdicts.update(await self.validate(unchecked))
+
+        return {
+            carton_number: verdicts[key].message or "FedEx rejected this address"
+            for carton_number, key in keys.items()
+            if key in verdicts and not verdicts[key].valid
+        }
+
+    async def validate(self: Self, addresses: Mapping[str, Address]) -> dict[str, AddressVerdict]:
+        """Check addresses that haven't been checked, and remember the verdicts, or return none if the check fails."""
+        if self.validator is None:
+            return {}
+        try:
+            verdicts = await self.validator.validate(addresses)
+        # However the check fails, the addresses are left for FedEx to reject when their labels are bought
+        except Exception:  # noqa: BLE001
+            logger.warning("Could not validate %s addresses, assuming they are good", len(addresses), exc_info=True)
+            return {}
+
+        now = datetime.now(tz=UTC)
+        statement = insert(AddressValidation)
+        async with Session() as session:
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[AddressValidation.address_key],
+                    set_={
+                        "valid": statement.excluded.valid,
+                        "message": statement.excluded.message,
+                        "expires_at": statement.excluded.expires_at,
+                        "updated": func.now(),
+                    },
+                ),
+                [
+                    {
+                        "address_key": key,
+                        "valid": verdict.valid,
+                        "message": verdict.message,
+                        "expires_at": now + (self.valid_ttl if verdict.valid else self.invalid_ttl),
+                    }
+                    for key, verdict in verdicts.items()
+                ],
+            )
+            await session.commit()
+        for key, verdict in verdicts.items():
+            if not verdict.valid:
+                logger.info("Address %s failed validation: %s", key, verdict.message)
+        return verdicts
+
+    async def prune(self: Self) -> int:
+        """Drop expired verdicts, returning how many were dropped."""
+        async with Session() as session:
+            result = await session.execute(delete(AddressValidation).where(AddressValidation.expires_at <= func.now()))
+            await session.commit()
+        return result.rowcount
+
+    async def run(self: Self) -> None:
+        """Prune the cache until cancelled."""
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            try:
+                await self.prune()
+            except Exception:
+                logger.exception("Could not prune the address validation cache")
+
+
+address_validator: AddressValidator | None
+match FedEx.address_validator:
+    case "fedex":
+        address_validator = FedExAddressValidator(fedex_client)
+    case "static":
+        address_validator = StaticAddressValidator()
+    case "off":
+        address_validator = None
+
+address_cache = AddressCache(
+    address_validator,
+    valid_ttl=timedelta(seconds=FedEx.address_valid_ttl),
+    invalid_ttl=timedelta(seconds=FedEx.address_invalid_ttl),
+    prune_interval=FedEx.address_cache_prune_interval,
+)
@@ -0,0 +1,175 @@
+"""Cache of cartons looked up in K-ERP, shared by every worker."""
+
+import asyncio
+from collections.abc import Collection, Sequence
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from typing import Self
+
+from kerp_sdk.api_models import Carton
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .constants import KERP
+from .kerp import async_kerp_client
+from .orm import KERPCarton, Session
+
+__all__ = [
+    "CartonCache",
+    "carton_cache",
+]
+
+logger = getLogger(__name__)
+
+
+class CartonCache:
+    """Cache cartons looked up in K-ERP for `ttl`, so rescanned cartons aren't looked up again.
+
+    Cartons are cached in the `kerp_carton_cache` table, so a carton prefetched by one worker
+    is cached for all of them. Only cartons that aren't cached are looked up in K-ERP.
+    Large lookups are split into chunks of `chunk_size`, up to `concurrency` of which are looked up at once,
+    and a chunk K-ERP fails to look up is retried on its own, up to `max_attempts` times in all.
+    Cartons K-ERP doesn't have aren't cached, so they're found as soon as they're added.
+    A carton that shipped, or that FedEx rejected and so will be fixed in K-ERP and rescanned,
+    is dropped from the cache in the same transaction as its shipment's outcome,
+    though a lookup that was already under way can cache it again until it expires.
+    Expired cartons are pruned every `prune_interval`, along with the oldest beyond `max_size`.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        ttl: timedelta = timedelta(minutes=15),
+        max_size: int = 20000,
+        prune_interval: float = 300.0,
+        *,
+        chunk_size: int = 100,
+        concurrency: int = 4,
+        max_attempts: int = 3,
+        retry_delay: float = 1.0,
+    ) -> None:
+        """Initialize the CartonCache class."""
+        self.ttl = ttl
+        self.max_size = max_size
+        self.prune_interval = prune_interval
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def lookup(
+        self: Self,
+        carton_numbers: Sequence[str],
+    ) -> list[tuple[Sequence[str], asyncio.Task[dict[str, Carton]]]]:
+        """Start getting cartons in chunks, returning each chunk's carton numbers and the task getting it, in order.
+
+        Earlier chunks are started first, so they can be used while later ones are still being looked up.
+        The caller must await or cancel every task.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def get_chunk(chunk: Sequence[str]) -> dict[str, Carton]:
+            async with semaphore:
+                return await self.get_cartons(chunk)
+
+        chunks = [
+            carton_numbers[start : start + self.chunk_size] for start in range(0, len(carton_numbers), self.chunk_size)
+        ]
+        return [(chunk, asyncio.create_task(get_chunk(chunk))) for chunk in chunks]
+
+    async def get_cartons(self: Self, carton_numbers: Sequence[str]) -> dict[str, Carton]:
+        """Get cartons by number, looking up those that aren't cached in K-ERP, and leaving out any it doesn't have."""
+        if not carton_numbers:
+            return {}
+
+        async with Session() as session:
+            rows = await session.execute(
+                select(KERPCarton.carton_number, KERPCarton.record).where(
+                    KERPCarton.carton_number.in_(carton_numbers),
+                    KERPCarton.expires_at > func.now(),
+                ),
+            )
+            cartons = {carton_number: Carton.model_validate(record) for carton_number, record in rows.tuples()}
+
+        misses = [carton_number for carton_number in carton_numbers if carton_number not in cartons]
+        if misses:
+            cartons.update(await self.fetch(misses))
+        return cartons
+
+    async def fetch(self: Self, carton_numbers: Sequence[str]) -> dict[str, Carton]:
+        """Look cartons up in K-ERP, retrying if it fails, and cache the ones it has."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                found_cartons = await async_kerp_client.get_cartons(carton_numbers)
+                break
+            except Exception:
+                if attempt == self.max_attempts:
+                    raise
+                logger.warning("Could not look up %s cartons in K-ERP, retrying", len(carton_numbers), exc_info=True)
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+        cartons = {carton.carton_number: carton for carton in found_cartons}
+        if not cartons:
+            return cartons
+
+        expires_at = datetime.now(tz=UTC) + self.ttl
+        statement = insert(KERPCarton)
+        async with Session() as session:
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[KERPCarton.carton_number],
+                    set_={
+                        "record": statement.excluded.record,
+                        "expires_at": statement.excluded.expires_at,
+                        "updated": func.now(),
+                    },
+                ),
+                [
+                    {
+                        "carton_number": carton_number,
+                        "record": carton.model_dump(mode="json"),
+                        "expires_at": expires_at,
+                    }
+                    for carton_number, carton in cartons.items()
+                ],
+            )
+            await session.commit()
+        return cartons
+
+    async def invalidate(self: Self, session: AsyncSession, carton_numbers: Collection[str]) -> None:
+        """Drop cartons from the cache when `session` commits."""
+        if carton_numbers:
+            await session.execute(delete(KERPCarton).where(KERPCarton.carton_number.in_(carton_numbers)))
+
+    async def prune(self: Self) -> int:
+        """Drop expired cartons, and the oldest cartons beyond `max_size`, returning how many were dropped."""
+        async with Session() as session:
+            expired = await session.execute(delete(KERPCarton).where(KERPCarton.expires_at <= func.now()))
+            oldest = await session.execute(
+                delete(KERPCarton).where(
+                    KERPCarton.carton_number.in_(
+                        select(KERPCarton.carton_number).order_by(KERPCarton.expires_at.desc()).offset(self.max_size),
+                    ),
+                ),
+            )
+            await session.commit()
+        return expired.rowcount + oldest.rowcount
+
+    async def run(self: Self) -> None:
+        """Prune the cache until cancelled."""
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            try:
+                await self.prune()
+            except Exception:
+                logger.exception("Could not prune the K-ERP carton cache")
+
+
+carton_cache = CartonCache(
+    ttl=timedelta(seconds=KERP.carton_cache_ttl),
+    max_size=KERP.carton_cache_max_size,
+    prune_interval=KERP.carton_cache_prune_interval,
+    chunk_size=KERP.carton_fetch_chunk_size,
+    concurrency=KERP.carton_fetch_concurrency,
+    max_attempts=KERP.carton_fetch_max_attempts,
+    retry_delay=KERP.carton_fetch_retry_delay,
+)
@@ -1,44 +1,116 @@
 """FedEx."""
 
+from datetime import timedelta
+
+import httpx
+
 from kassistant.constants import FedEx
 
-from .client import FedExServices
+from .auth import DatabaseTokenStore, FileTokenStore, TokenStore
+from .client import AsyncFedExServices, FedExServices
+from .governor import (
+    AdaptiveConcurrencyLimiter,
+    CallGovernor,
+    CircuitBreaker,
+    FedExUnavailableError,
+    TokenBucket,
+)
 from .models import (
     AccountNumber,
     Address,
     Contact,
     CustomerReference,
+    FedExAddressValidationResponse,
+    FedExError,
     FedExShipmentRequest,
+    FedExShipmentResponse,
     LabelSpecification,
+    PackageDocument,
     Payor,
+    PieceResponse,
     Recipient,
     RequestedPackageLineItem,
     RequestedShipment,
+    ResolvedAddress,
     ResponsibleParty,
     ShipmentSpecialServices,
     Shipper,
     ShippingChargesPayment,
+    TransactionShipment,
     Weight,
 )
 
-fedex_client = FedExServices(FedEx.base_url, FedEx.client_id, FedEx.client_secret)
+token_store: TokenStore | None
+match FedEx.token_store:
+    case "database":
+        token_store = DatabaseTokenStore(FedEx.client_id)
+    case "file":
+        token_store = FileTokenStore(FedEx.token_file)
+    case "memory":
+        token_store = None
+
+fedex_client = AsyncFedExServices(
+    FedEx.base_url,
+    FedEx.client_id,
+    FedEx.client_secret,
+    http2=FedEx.http2,
+    limits=httpx.Limits(
+        max_connections=FedEx.max_connections,
+        max_keepalive_connections=FedEx.max_keepalive_connections,
+        keepalive_expiry=FedEx.keepalive_expiry,
+    ),
+    timeout=httpx.Timeout(
+        FedEx.timeout,
+        connect=FedEx.connect_timeout,
+        pool=FedEx.pool_timeout,
+    ),
+    token_store=token_store,
+    token_refresh_margin=timedelta(seconds=FedEx.token_refresh_margin),
+    governor=CallGovernor(
+        TokenBucket(FedEx.rate_limit, FedEx.rate_burst),
+        AdaptiveConcurrencyLimiter(
+            FedEx.initial_concurrency,
+            FedEx.min_concurrency,
+            FedEx.max_concurrency,
+            FedEx.latency_target,
+        ),
+        CircuitBreaker(FedEx.circuit_failure_threshold, FedEx.circuit_reset_timeout),
+        max_attempts=FedEx.max_attempts,
+        retry_base_delay=FedEx.retry_base_delay,
+        retry_max_delay=FedEx.retry_max_delay,
+    ),
+)
 
 
 __all__ = [
     "AccountNumber",
+    "AdaptiveConcurrencyLimiter",
     "Address",
+    "AsyncFedExServices",
+    "CallGovernor",
+    "CircuitBreaker",
     "Contact",
     "CustomerReference",
+    "FedExAddressValidationResponse",
+    "FedExError",
+    "FedExServices",
     "FedExShipmentRequest",
+    "FedExShipmentResponse",
+    "FedExUnavailableError",
     "LabelSpecification",
+    "PackageDocument",
     "Payor",
+    "PieceResponse",
     "Recipient",
     "RequestedPackageLineItem",
     "RequestedShipment",
+    "ResolvedAddress",
     "ResponsibleParty",
     "ShipmentSpecialServices",
     "Shipper",
     "ShippingChargesPayment",
+    "TokenBucket",
+    "TransactionShipment",
     "Weight",
     "fedex_client",
 ]
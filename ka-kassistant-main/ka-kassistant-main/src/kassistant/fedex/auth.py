@@ -0,0 +1,173 @@
+"""OAuth token management for FedEx's API."""
+
+import asyncio
+import fcntl
+import json
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from pathlib import Path
+from typing import Protocol, Self
+
+from sqlalchemy import func, select
+
+from kassistant.orm import OAuthToken, Session
+
+__all__ = [
+    "AccessToken",
+    "DatabaseTokenStore",
+    "FileTokenStore",
+    "TokenManager",
+    "TokenStore",
+]
+
+logger = getLogger(__name__)
+
+type TokenFetcher = Callable[[], Awaitable["AccessToken"]]
+
+
+@dataclass(frozen=True, slots=True)
+class AccessToken:
+    """An OAuth access token and when it expires."""
+
+    value: str
+    expires_at: datetime
+
+    def is_due(self: Self, refresh_margin: timedelta) -> bool:
+        """Whether the token expires within `refresh_margin` and should be refreshed."""
+        return self.expires_at - refresh_margin <= datetime.now(tz=UTC)
+
+    def is_expired(self: Self) -> bool:
+        """Whether the token can no longer be used."""
+        return self.expires_at <= datetime.now(tz=UTC)
+
+
+class TokenStore(Protocol):
+    """Somewhere to share a token between worker processes."""
+
+    async def get_or_refresh(self, fetch: TokenFetcher, refresh_margin: timedelta) -> AccessToken:
+        """Return the shared token, calling `fetch` to replace it if it is due.
+
+        Implementations must hold a cross-process lock while refreshing,
+        so only one worker calls `fetch` at a time.
+        """
+        ...
+
+
+class DatabaseTokenStore:
+    """Share the token through a row in the `oauth_tokens` table."""
+
+    def __init__(self, client_id: str) -> None:
+        """Initialize the DatabaseTokenStore class."""
+        self.client_id = client_id
+
+    async def get_or_refresh(self, fetch: TokenFetcher, refresh_margin: timedelta) -> AccessToken:
+        """Return the shared token, refreshing it under a transaction-level advisory lock."""
+        async with Session() as session:
+            lock_key = func.hashtext(f"kassistant.oauth_tokens.{self.client_id}")
+            await session.execute(select(func.pg_advisory_xact_lock(lock_key)))
+
+            row = await session.get(OAuthToken, self.client_id)
+            if row is not None:
+                token = AccessToken(value=row.access_token, expires_at=row.expires_at)
+                if not token.is_due(refresh_margin):
+                    return token
+            else:
+                row = OAuthToken(client_id=self.client_id)
+
+            token = await fetch()
+            row.access_token = token.value
+            row.expires_at = token.expires_at
+            session.add(row)
+            await session.commit()
+            return token
+
+
+class FileTokenStore:
+    """Share the token through a JSON file guarded by an exclusive file lock."""
+
+    def __init__(self, path: Path) -> None:
+        """Initialize the FileTokenStore class."""
+        self.path = path
+        self.lock_path = path.with_suffix(path.suffix + ".lock")
+
+    def _read(self: Self) -> AccessToken | None:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return AccessToken(value=data["access_token"], expires_at=datetime.fromisoformat(data["expires_at"]))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _write(self: Self, token: AccessToken) -> None:
+        data = {"access_token": token.value, "expires_at": token.expires_at.isoformat()}
+        temporary_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        temporary_path.write_text(json.dumps(data), encoding="utf-8")
+        temporary_path.chmod(0o600)
+        temporary_path.replace(self.path)
+
+    async def get_or_refresh(self, fetch: TokenFetcher, refresh_margin: timedelta) -> AccessToken:
+        """Return the shared token, refreshing it while holding the lock file."""
+        with self.lock_path.open("a") as lock_file:
+            # Waiting on the lock blocks while another worker refreshes, so keep it off the event loop
+            await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+            try:
+                token = self._read()
+                if token is None or token.is_due(refresh_margin):
+                    token = await fetch()
+                    self._write(token)
+                return token
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class TokenManager:
+    """Hand out an OAuth token, refreshing it early and at most once at a time.
+
+    Once the token is within `refresh_margin` of expiring, callers keep getting the current token
+    while a single refresh runs in the background. Callers only wait when there is no usable token,
+    and then they all wait on the same refresh.
+    """
+
+    def __init__(
+        self,
+        fetch: TokenFetcher,
+        *,
+        store: TokenStore | None = None,
+        refresh_margin: timedelta = timedelta(minutes=5),
+    ) -> None:
+        """Initialize the TokenManager class."""
+        self.fetch = fetch
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.token: AccessToken | None = None
+        self._refresh_task: asyncio.Task[AccessToken] | None = None
+
+    async def get_token(self: Self) -> str:
+        """Get a usable access token."""
+        token = self.token
+        if token is None or token.is_expired():
+            token = await asyncio.shield(self._start_refresh())
+        elif token.is_due(self.refresh_margin):
+            self._start_refresh()
+        return token.value
+
+    def _start_refresh(self: Self) -> asyncio.Task[AccessToken]:
+        """Start a refresh, or join the one already in flight."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+            self._refresh_task.add_done_callback(self._log_refresh_failure)
+        return self._refresh_task
+
+    async def _refresh(self: Self) -> AccessToken:
+        if self.store is None:
+            token = await self.fetch()
+        else:
+            token = await self.store.get_or_refresh(self.fetch, self.refresh_margin)
+        self.token = token
+        return token
+
+    @staticmethod
+    def _log_refresh_failure(task: asyncio.Task[AccessToken]) -> None:
+        if not task.cancelled() and (exception := task.exception()) is not None:
+            logger.error("Could not refresh OAuth token", exc_info=exception)
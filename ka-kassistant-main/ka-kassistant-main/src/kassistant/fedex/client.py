@@ -1,12 +1,17 @@
 """Interacting with FedEx."""
 
+from collections.abc import Sequence
 from datetime import UTC, datetime, timedelta
 from typing import Self
 
 import httpx
 from httpx import Response
 
-from .models import FedExShipmentRequest
+from kassistant.serialization import encode_json
+
+from .auth import AccessToken, TokenManager, TokenStore
+from .governor import CallGovernor
+from .models import Address, FedExShipmentRequest
 
 
 class FedExServices:
@@ -46,13 +51,17 @@ class FedExServices:
         path: str,
         params: dict | None = None,  # type: ignore[type-arg]
         json: dict | None = None,  # type: ignore[type-arg]
+        content: bytes | None = None,
     ) -> Response:
-        """Make a request to FedEx's API."""
+        """Make a request to FedEx's API.
+
+        The body is either `json` to serialize, or `content` that is already serialized JSON.
+        """
         self._update_token()
 
         headers = {"Authorization": "Bearer " + self.token}
 
-        args = {
+        args: dict[str, object] = {
             "url": self.base_url + path,
             "method": method,
             "headers": headers,
@@ -62,14 +71,133 @@ class FedExServices:
             args["params"] = params
 
         if json is not None:
-            args["json"] = json
+            content = encode_json(json)
+
+        if content is not None:
+            headers["Content-Type"] = "application/json"
+            args["content"] = content
 
         return httpx.request(**args)  # type: ignore[arg-type]
 
-    def create_label(self, request: FedExShipmentRequest) -> Response:
-        """Create a label."""
+    def create_label(self, request: FedExShipmentRequest | bytes) -> Response:
+        """Create a label, from a request model or a request that is already serialized."""
+        if isinstance(request, bytes):
+            return self.make_request("POST", "/ship/v1/shipments", content=request)
         return self.make_request(
             "POST",
             "/ship/v1/shipments",
             json=request.model_dump(),
         )
+
+
+class AsyncFedExServices:
+    """An async variant of `FedExServices` that keeps one pooled HTTP client alive for the whole worker."""
+
+    def __init__(  # noqa: PLR0913
+        self,
+        base_url: str,
+        client_id: str,
+        client_secret: str,
+        *,
+        http2: bool = True,
+        limits: httpx.Limits | None = None,
+        timeout: httpx.Timeout | None = None,
+        token_store: TokenStore | None = None,
+        token_refresh_margin: timedelta = timedelta(minutes=5),
+        governor: CallGovernor | None = None,
+    ) -> None:
+        """Initialize the AsyncFedExServices class.
+
+        API requests (but not token fetches) are made through `governor`, if given.
+        """
+        self.base_url = base_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.http2 = http2
+        self.limits = limits or httpx.Limits()
+        self.timeout = timeout or httpx.Timeout(30.0)
+        self.token_manager = TokenManager(
+            self._fetch_token,
+            store=token_store,
+            refresh_margin=token_refresh_margin,
+        )
+        self.governor = governor
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self: Self) -> httpx.AsyncClient:
+        """The pooled HTTP client, created on first use."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self.http2,
+                limits=self.limits,
+                timeout=self.timeout,
+            )
+        return self._client
+
+    async def aclose(self: Self) -> None:
+        """Close the pooled HTTP client and its open connections."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_token(self: Self) -> AccessToken:
+        """Fetch a new OAUTH token."""
+        auth_dict = {
+            "grant_type": "client_credentials",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+        }
+        response = await self.client.post("/oauth/token", data=auth_dict)
+        response.raise_for_status()
+        data = response.json()
+        return AccessToken(
+            value=data["access_token"],
+            expires_at=datetime.now(tz=UTC) + timedelta(seconds=data["expires_in"]),
+        )
+
+    async def make_request(
+        self,
+        method: str,
+        path: str,
+        params: dict | None = None,  # type: ignore[type-arg]
+        json: dict | None = None,  # type: ignore[type-arg]
+        content: bytes | None = None,
+    ) -> Response:
+        """Make a request to FedEx's API.
+
+        The body is either `json` to serialize, or `content` that is already serialized JSON.
+        """
+        token = await self.token_manager.get_token()
+
+        headers = {"Authorization": "Bearer " + token}
+        if json is not None:
+            content = encode_json(json)
+        if content is not None:
+            headers["Content-Type"] = "application/json"
+
+        async def send() -> Response:
+            return await self.client.request(method, path, headers=headers, params=params, content=content)
+
+        if self.governor is None:
+            return await send()
+        return await self.governor.call(send)
+
+    async def create_label(self, request: FedExShipmentRequest | bytes) -> Response:
+        """Create a label, from a request model or a request that is already serialized."""
+        if isinstance(request, bytes):
+            return await self.make_request("POST", "/ship/v1/shipments", content=request)
+        return await self.make_request(
+            "POST",
+            "/ship/v1/shipments",
+            json=request.model_dump(),
+        )
+
+    async def validate_addresses(self, addresses: Sequence[Address]) -> Response:
+        """Check addresses, up to 100 at once, getting how FedEx resolves each of them."""
+        return await self.make_request(
+            "POST",
+            "/address/v1/addresses/resolve",
+            json={"addressesToValidate": [{"address": address.model_dump()} for address in addresses]},
+        )
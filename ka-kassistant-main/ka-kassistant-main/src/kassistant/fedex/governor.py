@@ -0,0 +1,283 @@
+"""Governance of calls to FedEx's API: rate limiting, adaptive concurrency, retries, and a circuit breaker."""
+
+import asyncio
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from logging import getLogger
+from typing import Final, Self
+
+import httpx
+
+__all__ = [
+    "RETRYABLE_STATUSES",
+    "AdaptiveConcurrencyLimiter",
+    "CallGovernor",
+    "CircuitBreaker",
+    "FedExUnavailableError",
+    "TokenBucket",
+    "retry_after",
+]
+
+logger = getLogger(__name__)
+
+type Clock = Callable[[], float]
+type Sleep = Callable[[float], Awaitable[None]]
+
+# FedEx turned these requests away without acting on them, so they are safe to send again
+RETRYABLE_STATUSES: Final[frozenset[int]] = frozenset({HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.SERVICE_UNAVAILABLE})
+# Errors raised before a request reaches FedEx, so it is safe to send again
+CONNECTION_ERRORS: Final = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class FedExUnavailableError(RuntimeError):
+    """FedEx is down or rate limiting us, so a request was not made, or was turned away every time it was tried."""
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """Get how many seconds a response asks us to wait before trying again, if it says."""
+    value: str | None = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    seconds: float
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            retry_at: datetime = parsedate_to_datetime(value)
+            seconds = (retry_at - datetime.now(tz=UTC)).total_seconds()
+        except (TypeError, ValueError):
+            # Not a date, or a date without a time zone
+            return None
+    return max(seconds, 0.0)
+
+
+class TokenBucket:
+    """Spend a token on every request, refilled at `rate` tokens a second up to `capacity`.
+
+    Requests wait, in order, for a token when the bucket is empty, which keeps bursts within our API quota.
+    """
+
+    def __init__(self, rate: float, capacity: int, clock: Clock = time.monotonic) -> None:
+        """Initialize the TokenBucket class."""
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self: Self) -> None:
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self: Self) -> None:
+        """Wait for a token and spend it."""
+        async with self._lock:
+            self._refill()
+            while self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def pause(self: Self, seconds: float) -> None:
+        """Empty the bucket so that no request is made for `seconds`, such as when FedEx asks us to wait."""
+        self._refill()
+        # The next token comes in `seconds`
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limit how many requests are in flight at once, adapting the limit to how FedEx is coping.
+
+    The limit grows by one for every `limit` requests that finish within `latency_target` seconds,
+    and is cut by `backoff` when a request is slower than that or is rate limited (additive increase,
+    multiplicative decrease). It is cut at most once per `latency_target`, so a burst of slow requests
+    started under the old limit only counts once.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        latency_target: float,
+        *,
+        backoff: float = 0.5,
+        clock: Clock = time.monotonic,
+    ) -> None:
+        """Initialize the AdaptiveConcurrencyLimiter class."""
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.clock = clock
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self: Self) -> AsyncIterator[None]:
+        """Hold one of the limited places for a request."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def record_latency(self: Self, latency: float) -> None:
+        """Adapt the limit to how long a request took."""
+        if latency > self.latency_target:
+            self.record_overload()
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def record_overload(self: Self) -> None:
+        """Cut the limit, because FedEx is rate limiting us or struggling."""
+        now = self.clock()
+        if now - self._last_decrease < self.latency_target:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        logger.info("FedEx is overloaded, lowering concurrency to %d", int(self.limit))
+
+
+class CircuitBreaker:
+    """Fail calls fast while FedEx is down, rather than each waiting to fail.
+
+    After `failure_threshold` failures in a row the circuit opens, and calls fail at once for `reset_timeout`
+    seconds. Then a single trial call is let through: if it succeeds the circuit closes, and if it fails
+    the circuit opens again. If the trial never finishes, another is let through after `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Clock = time.monotonic) -> None:
+        """Initialize the CircuitBreaker class."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial_started_at: float | None = None
+
+    def check(self: Self) -> None:
+        """Make sure a call may be made, raising `FedExUnavailableError` if the circuit is open."""
+        if self.opened_at is None:
+            return
+        now = self.clock()
+        waiting = now - self.opened_at < self.reset_timeout
+        trial_in_flight = self.trial_started_at is not None and now - self.trial_started_at < self.reset_timeout
+        if waiting or trial_in_flight:
+            msg = "FedEx is unavailable, so the request was not made"
+            raise FedExUnavailableError(msg)
+        self.trial_started_at = now
+
+    def record_success(self: Self) -> None:
+        """Close the circuit."""
+        if self.opened_at is not None:
+            logger.info("FedEx is available again")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+
+    def record_failure(self: Self) -> None:
+        """Count a failure, opening the circuit once there have been too many in a row."""
+        self.failures += 1
+        if self.trial_started_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("FedEx is unavailable, failing requests for %.0f seconds", self.reset_timeout)
+            self.opened_at = self.clock()
+            self.trial_started_at = None
+
+
+class CallGovernor:
+    """Make calls to FedEx's API within our quota, at a concurrency FedEx can cope with, retrying when safe.
+
+    Requests that FedEx turns away with a 429 or 503, or that never reach it, are retried up to `max_attempts`
+    times in all, after the delay given by `Retry-After`, or an exponential backoff with full jitter.
+    Other failures are never retried, since FedEx may have acted on the request, such as by creating a label.
+    Any 5xx response, and any error sending the request, counts as a failure towards opening the circuit.
+    When a request can't be made, `FedExUnavailableError` is raised.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        bucket: TokenBucket,
+        limiter: AdaptiveConcurrencyLimiter,
+        breaker: CircuitBreaker,
+        *,
+        max_attempts: int = 4,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 30.0,
+        clock: Clock = time.monotonic,
+        sleep: Sleep = asyncio.sleep,
+    ) -> None:
+        """Initialize the CallGovernor class."""
+        self.bucket = bucket
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.clock = clock
+        self.sleep = sleep
+
+    def backoff(self: Self, attempt: int) -> float:
+        """Get a random delay before trying again, growing with every attempt."""
+        # Not for security; jitter just keeps workers from retrying in step
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1)))  # noqa: S311
+
+    async def call(self: Self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send a request with `send`, retrying it if FedEx turns it away."""
+        reason = ""
+        for attempt in range(1, self.max_attempts + 1):
+            self.breaker.check()
+            await self.bucket.acquire()
+            async with self.limiter.slot():
+                started = self.clock()
+                try:
+                    response = await send()
+                except CONNECTION_ERRORS as exc:
+                    self.breaker.record_failure()
+                    reason = f"could not connect: {exc!r}"
+                    delay = self.backoff(attempt)
+                except httpx.TransportError:
+                    self.breaker.record_failure()
+                    raise
+                else:
+                    if response.status_code not in RETRYABLE_STATUSES:
+                        if response.is_server_error:
+                            # FedEx is failing, though the request isn't sent again, since FedEx may have acted on it
+                            self.breaker.record_failure()
+                            self.limiter.record_overload()
+                        else:
+                            self.breaker.record_success()
+                            self.limiter.record_latency(self.clock() - started)
+                        return response
+
+                    self.limiter.record_overload()
+                    reason = f"FedEx responded {response.status_code}"
+                    delay = retry_after(response) or self.backoff(attempt)
+                    if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+                        # FedEx is up, just busy, and everyone waits, not just this request
+                        self.breaker.record_success()
+                        self.bucket.pause(delay)
+                    else:
+                        self.breaker.record_failure()
+
+            if attempt == self.max_attempts or delay > self.retry_max_delay:
+                break
+            logger.info("Retrying FedEx request in %.1f seconds, %s", delay, reason)
+            await self.sleep(delay)
+
+        msg = f"FedEx request failed after {attempt} attempts, {reason}"
+        raise FedExUnavailableError(msg)
@@ -2,25 +2,34 @@
 
 # ruff: noqa: N815
 
-from typing import Literal, Self
+from base64 import b64decode
+from typing import Any, Final, Literal, Self
 
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel, ConfigDict, model_validator
 
 __all__ = [
+    "TRANSIENT_ERROR_CODES",
     "AccountNumber",
     "Address",
     "Contact",
     "CustomerReference",
+    "FedExAddressValidationResponse",
+    "FedExError",
     "FedExShipmentRequest",
+    "FedExShipmentResponse",
     "LabelSpecification",
+    "PackageDocument",
     "Payor",
+    "PieceResponse",
     "Recipient",
     "RequestedPackageLineItem",
     "RequestedShipment",
+    "ResolvedAddress",
     "ResponsibleParty",
     "ShipmentSpecialServices",
     "Shipper",
     "ShippingChargesPayment",
+    "TransactionShipment",
     "Weight",
 ]
 
@@ -132,6 +141,7 @@ class ShipmentSpecialServices(BaseModel):
 class RequestedPackageLineItem(BaseModel):
     """RequestedPackageLineItem."""
 
+    sequenceNumber: int | None = None
     weight: Weight
     customerReferences: list[CustomerReference]
     shipmentSpecialServices: ShipmentSpecialServices | None = None
@@ -202,6 +212,7 @@ class RequestedShipment(BaseModel):
     shippingChargesPayment: ShippingChargesPayment
     labelSpecification: LabelSpecification
     requestedPackageLineItems: list[RequestedPackageLineItem]
+    totalPackageCount: int | None = None
     packagingType: Literal[
         "YOUR_PACKAGING",
         "FEDEX_ENVELOPE",
@@ -230,3 +241,168 @@ class FedExShipmentRequest(BaseModel):
     requestedShipment: RequestedShipment
     accountNumber: AccountNumber
     labelResponseOptions: Literal["URL_ONLY", "LABEL"] = "LABEL"
+
+
+class _ResponseModel(BaseModel):
+    """A part of a FedEx response.
+
+    Fields that aren't modelled are kept, so the whole response can be stored.
+    """
+
+    model_config = ConfigDict(extra="allow")
+
+
+class PackageDocument(_ResponseModel):
+    """PackageDocument."""
+
+    contentType: str | None = None
+    docType: str | None = None
+    encodedLabel: str | None = None
+    url: str | None = None
+
+    def label(self: Self) -> str | None:
+        """Decode the label, if the document has one."""
+        if self.encodedLabel is None:
+            return None
+        return b64decode(self.encodedLabel).decode("utf-8")
+
+
+class PieceResponse(_ResponseModel):
+    """PieceResponse."""
+
+    trackingNumber: str
+    packageSequenceNumber: int | None = None
+    packageDocuments: list[PackageDocument] = []
+
+
+class TransactionShipment(_ResponseModel):
+    """TransactionShipment."""
+
+    masterTrackingNumber: str | None = None
+    serviceType: str | None = None
+    pieceResponses: list[PieceResponse]
+
+
+class ShipmentOutput(_ResponseModel):
+    """ShipmentOutput."""
+
+    transactionShipments: list[TransactionShipment]
+
+
+# Errors FedEx returns when it is down, rather than because of the request, so the request is safe to send again
+TRANSIENT_ERROR_CODES: Final[frozenset[str]] = frozenset(
+    {
+        "SERVICE.UNAVAILABLE.ERROR",
+        "SYSTEM.UNAVAILABLE.EXCEPTION",
+    },
+)
+
+
+class FedExError(_ResponseModel):
+    """FedExError.
+
+    FedEx doesn't always send an error's message.
+    """
+
+    code: str
+    message: str = ""
+
+
+class FedExShipmentResponse(_ResponseModel):
+    """FedExShipmentResponse.
+
+    Successful responses have `output`, and unsuccessful ones have `errors`.
+    """
+
+    transactionId: str | None = None
+    output: ShipmentOutput | None = None
+    errors: list[FedExError] = []
+
+    def pieces(self: Self) -> dict[int, PieceResponse]:
+        """Get the packages of the shipment, by their sequence number in the request, from 1."""
+        if self.output is None:
+            return {}
+        pieces = [piece for shipment in self.output.transactionShipments for piece in shipment.pieceResponses]
+        return {piece.packageSequenceNumber or number: piece for number, piece in enumerate(pieces, start=1)}
+
+    def master_tracking_number(self: Self) -> str | None:
+        """Get the tracking number of the whole shipment, if it has more than one package."""
+        if self.output is None or not self.output.transactionShipments:
+            return None
+        return self.output.transactionShipments[0].masterTrackingNumber
+
+    def transient(self: Self) -> bool:
+        """Check whether the request failed only because FedEx was down, so it can be sent again."""
+        return bool(self.errors) and all(error.code in TRANSIENT_ERROR_CODES for error in self.errors)
+
+    def payload(self: Self, sequence_number: int | None = None) -> dict[str, Any]:
+        """Dump the response as it was received, less its labels, which are stored on their own.
+
+        If `sequence_number` is given, only that package's piece response is included.
+        """
+        payload = self.model_dump(
+            mode="json",
+            exclude_unset=True,
+            exclude={
+                "output": {
+                    "transactionShipments": {
+                        "__all__": {"pieceResponses": {"__all__": {"packageDocuments": {"__all__": {"encodedLabel"}}}}},
+                    },
+                },
+            },
+        )
+        if sequence_number is not None and self.output is not None:
+            number = 0
+            for shipment in payload["output"]["transactionShipments"]:
+                pieces = []
+                for piece in shipment["pieceResponses"]:
+                    number += 1
+                    if piece.get("packageSequenceNumber", number) == sequence_number:
+                        pieces.append(piece)
+                shipment["pieceResponses"] = pieces
+        return payload
+
+
+class ResolvedAddress(_ResponseModel):
+    """ResolvedAddress.
+
+    FedEx gives its `attributes` as the strings `"true"` and `"false"`.
+    """
+
+    city: str | None = None
+    stateOrProvinceCode: str | None = None
+    postalCode: str | None = None
+    attributes: dict[str, Any] = {}
+
+    def problem(self: Self, address: Address) -> str | None:
+        """Get why FedEx would reject a shipment to the address this resolved, if it would.
+
+        Only problems that fail label creation count: an address FedEx couldn't match to a street
+        can still be shipped to, so it isn't a problem.
+        """
+        if str(self.attributes.get("ValidlyFormed", "")).lower() == "false":
+            return "FedEx says this address is incomplete or badly formed"
+        if self.stateOrProvinceCode and self.stateOrProvinceCode.upper() != address.stateOrProvinceCode.upper():
+            return (
+                f"FedEx puts postal code {address.postalCode} in {self.stateOrProvinceCode}, "
+                f"not {address.stateOrProvinceCode}"
+            )
+        return None
+
+
+class AddressValidationOutput(_ResponseModel):
+    """AddressValidationOutput."""
+
+    resolvedAddresses: list[ResolvedAddress] = []
+
+
+class FedExAddressValidationResponse(_ResponseModel):
+    """FedExAddressValidationResponse.
+
+    Successful responses have `output`, with the addresses in the order they were sent, and unsuccessful ones have
+    `errors`.
+    """
+
+    transactionId: str | None = None
+    output: AddressValidationOutput | None = None
+    errors: list[FedExError] = []
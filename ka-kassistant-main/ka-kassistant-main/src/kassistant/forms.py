@@ -31,15 +31,37 @@ class LabelRequestForm(BaseModel):
     air_auth: str | None
     carton_numbers: str
     saturday_delivery: bool | None = None
+    group_shipments: bool | None = None
+    station: str | None = None
 
 
 class HistoryForm(BaseModel):
     """HistoryForm."""
 
     ship_date: str = Field(alias="ship_date_history")
+    until: str | None = Field(default=None, alias="ship_date_history_until")
     detailed: str | None = None
 
 
+class StationForm(BaseModel):
+    """StationForm."""
+
+    station: str
+
+
+class ShipmentResolutionForm(BaseModel):
+    """ShipmentResolutionForm."""
+
+    outcome: Literal["shipped", "not_shipped"]
+    tracking_number: str = ""
+
+
+class CartonPrefetchForm(BaseModel):
+    """CartonPrefetchForm."""
+
+    carton_numbers: list[str]
+
+
 class SettingsForm(BaseModel):
     """SettingsForm."""
 
@@ -0,0 +1,121 @@
+"""Shipment history queries."""
+
+from collections.abc import AsyncIterator, Sequence
+from datetime import UTC, date, datetime, time, timedelta
+from typing import Any
+from uuid import UUID
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import ColumnElement, Select, and_, or_, select
+from sqlalchemy.orm import load_only
+
+from .constants import App
+from .orm import Session, Shipment
+
+__all__ = [
+    "HistoryCursor",
+    "created_between",
+    "decode_cursor",
+    "encode_cursor",
+    "export_rows",
+    "history_page",
+    "local_date_range",
+]
+
+# A position in the history, as the `created` and `id` of the last shipment shown
+type HistoryCursor = tuple[datetime, UUID]
+
+
+def local_date_range(start: date, end: date, time_zone: str) -> tuple[datetime, datetime]:
+    """Get the half-open range of UTC times covering the local dates `start` through `end`, inclusive."""
+    zone = ZoneInfo(time_zone)
+    return (
+        datetime.combine(start, time.min, tzinfo=zone).astimezone(UTC),
+        datetime.combine(end + timedelta(days=1), time.min, tzinfo=zone).astimezone(UTC),
+    )
+
+
+def created_between(start: date, end: date) -> ColumnElement[bool]:
+    """Filter for shipments created on the local dates `start` through `end`, inclusive.
+
+    Comparing `created` itself, rather than its local date, lets Postgres use the index on `created`.
+    """
+    created_from, created_until = local_date_range(start, end, App.time_zone)
+    return and_(Shipment.created >= created_from, Shipment.created < created_until)
+
+
+def encode_cursor(shipment: Shipment) -> str:
+    """Encode the position after `shipment` for use in a URL."""
+    return f"{shipment.created.isoformat()}_{shipment.id}"
+
+
+def decode_cursor(cursor: str) -> HistoryCursor:
+    """Decode a position encoded by `encode_cursor`, raising `ValueError` if it is invalid."""
+    created, _, shipment_id = cursor.rpartition("_")
+    return datetime.fromisoformat(created), UUID(shipment_id)
+
+
+def history_page(
+    start: date,
+    end: date,
+    page_size: int,
+    before: HistoryCursor | None = None,
+) -> Select[tuple[Shipment]]:
+    """Select a page of shipments created on the local dates `start` through `end`, newest first.
+
+    Only the columns shown in the history are loaded; the large JSONB columns are deferred.
+    Pages are found by keyset over `(created, id)`, starting `before` the last shipment of the previous page,
+    so every page costs the same no matter how deep into a busy day it is.
+    One more shipment than `page_size` is selected, to tell whether there is another page.
+    """
+    statement = (
+        select(Shipment)
+        .options(
+            load_only(
+                Shipment.id,
+                Shipment.created,
+                Shipment.carton_number,
+                Shipment.tracking_number,
+                Shipment.status,
+            ),
+        )
+        .where(created_between(start, end))
+        .order_by(Shipment.created.desc(), Shipment.id.desc())
+        .limit(page_size + 1)
+    )
+    if before is not None:
+        before_created, before_id = before
+        # The plain comparison on `created` is what lets Postgres seek the index
+        statement = statement.where(
+            Shipment.created <= before_created,
+            or_(Shipment.created < before_created, Shipment.id < before_id),
+        )
+    return statement
+
+
+async def export_rows(start: date, end: date, batch_size: int = 1000) -> AsyncIterator[Sequence[Sequence[Any]]]:
+    """Fetch the export rows for shipments created on the local dates `start` through `end`, newest first.
+
+    Rows are carton number, tracking number, status, service and ship date, and the local time the shipment
+    was created. These are all summary columns, so rows whose payloads have been archived are exported too.
+    Rows are fetched through a server-side cursor and yielded `batch_size` at a time,
+    so an export of any length is held in memory one batch at a time.
+    """
+    statement = (
+        select(
+            Shipment.carton_number,
+            Shipment.tracking_number,
+            Shipment.status,
+            Shipment.service,
+            Shipment.ship_date,
+            Shipment.created,
+        )
+        .where(created_between(start, end))
+        .order_by(Shipment.created.desc(), Shipment.id.desc())
+        .execution_options(yield_per=batch_size)
+    )
+    zone = ZoneInfo(App.time_zone)
+    async with Session() as session:
+        result = await session.stream(statement)
+        async for partition in result.partitions():
+            yield [(*row[:-1], row.created.astimezone(zone).replace(tzinfo=None)) for row in partition]
@@ -1,11 +1,126 @@
 """K-ERP."""
 
+import asyncio
+import time
+from collections import defaultdict
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Any, Self
+
 from kerp_sdk import KERPClient
+from kerp_sdk.api_models import Carton, TrackingUpdateRequest
 
 from kassistant.constants import KERP
 
+__all__ = [
+    "AsyncKERPClient",
+    "KERPCallMetrics",
+    "async_kerp_client",
+    "kerp_client",
+]
+
+
+@dataclass(slots=True)
+class KERPCallMetrics:
+    """Counts and timings of one kind of call to K-ERP, since the worker started."""
+
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    in_flight: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class AsyncKERPClient:
+    """Call the synchronous K-ERP client without blocking the event loop.
+
+    The SDK has no async transport, so calls run on a dedicated pool of `max_workers` threads,
+    sharing one client and its connections. Slow K-ERP calls then queue for that pool,
+    instead of using up the default executor the rest of the worker shares.
+
+    Each call has a timeout, which includes time spent queued for a thread. A call that times out
+    before it starts is dropped, but one already running can't be interrupted: it is abandoned,
+    and keeps its thread until K-ERP answers.
+    """
+
+    def __init__(
+        self,
+        client: KERPClient,
+        max_workers: int = 4,
+        get_cartons_timeout: float = 30.0,
+        publish_tracking_timeout: float = 60.0,
+    ) -> None:
+        """Initialize the AsyncKERPClient class."""
+        self.client = client
+        self.get_cartons_timeout = get_cartons_timeout
+        self.publish_tracking_timeout = publish_tracking_timeout
+        self.metrics: defaultdict[str, KERPCallMetrics] = defaultdict(KERPCallMetrics)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kerp")
+
+    async def _call[T](self: Self, name: str, function: Callable[[], T], seconds: float) -> T:
+        """Run a call to the K-ERP client on the pool, recording its metrics."""
+        metrics = self.metrics[name]
+        metrics.calls += 1
+        metrics.in_flight += 1
+        started = time.monotonic()
+        try:
+            return await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(self._executor, function),
+                timeout=seconds,
+            )
+        except TimeoutError as exc:
+            metrics.timeouts += 1
+            msg = f"K-ERP {name} took longer than {seconds} seconds"
+            raise TimeoutError(msg) from exc
+        except Exception:
+            metrics.errors += 1
+            raise
+        finally:
+            metrics.in_flight -= 1
+            elapsed = time.monotonic() - started
+            metrics.total_seconds += elapsed
+            metrics.max_seconds = max(metrics.max_seconds, elapsed)
+
+    async def get_cartons(self: Self, carton_numbers: Sequence[str]) -> list[Carton]:
+        """Look cartons up by number, leaving out any K-ERP doesn't have."""
+        cartons_header = await self._call(
+            "get_cartons",
+            partial(self.client.shipping.get_cartons, list(carton_numbers)),
+            self.get_cartons_timeout,
+        )
+        cartons: list[Carton] = cartons_header.data
+        return cartons
+
+    async def publish_tracking(self: Self, tracking_updates: Sequence[TrackingUpdateRequest]) -> dict[str, Any]:
+        """Write tracking numbers back to K-ERP, returning its response."""
+        response = await self._call(
+            "publish_tracking",
+            partial(self.client.shipping.publish_tracking, list(tracking_updates)),
+            self.publish_tracking_timeout,
+        )
+        response_data: dict[str, Any] = response.model_dump()
+        return response_data
+
+    def snapshot(self: Self) -> dict[str, dict[str, Any]]:
+        """Get the metrics of every kind of call made so far."""
+        return {name: asdict(metrics) for name, metrics in self.metrics.items()}
+
+    def close(self: Self) -> None:
+        """Stop the thread pool, dropping queued calls."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
 kerp_client = KERPClient(
     username="",
     password="",
     cartons_api_key=KERP.api_key,
 )
+async_kerp_client = AsyncKERPClient(
+    kerp_client,
+    max_workers=KERP.max_workers,
+    get_cartons_timeout=KERP.get_cartons_timeout,
+    publish_tracking_timeout=KERP.publish_tracking_timeout,
+)
@@ -0,0 +1,140 @@
+"""Run label jobs in the background."""
+
+import asyncio
+from contextlib import suppress
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from typing import Final, Self
+from uuid import UUID
+
+from sqlalchemy import func, or_, select, update
+
+from .constants import App
+from .forms import LabelRequestForm
+from .notifications import notification_listener
+from .orm import LabelJob, Session
+from .run_labels import run_labels
+
+__all__ = [
+    "LABEL_JOBS_CHANNEL",
+    "LabelJobRunner",
+    "label_job_runner",
+]
+
+LABEL_JOBS_CHANNEL: Final[str] = "kassistant_label_jobs"
+
+logger = getLogger(__name__)
+
+
+class LabelJobRunner:
+    """Claim queued label jobs and create their labels, one job at a time per worker.
+
+    Jobs are claimed with `FOR UPDATE SKIP LOCKED`, and held with a lease the runner renews while the job runs.
+    If a worker dies mid-job, its lease runs out and another worker resumes the job,
+    reprinting the labels it already created instead of buying them again.
+    """
+
+    def __init__(
+        self,
+        lease: float = 60.0,
+        poll_interval: float = 30.0,
+        max_attempts: int = 3,
+    ) -> None:
+        """Initialize the LabelJobRunner class."""
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wakeup = asyncio.Event()
+
+    def wake(self: Self, _: str | None = None) -> None:
+        """Look for jobs now instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    async def claim(self: Self) -> LabelJob | None:
+        """Claim the oldest job that is queued, or whose worker stopped checking in."""
+        async with Session() as session:
+            while True:
+                job = (
+                    await session.scalars(
+                        select(LabelJob)
+                        .where(
+                            LabelJob.status.in_(("queued", "running")),
+                            or_(LabelJob.locked_until.is_(None), LabelJob.locked_until < func.now()),
+                        )
+                        .order_by(LabelJob.created)
+                        .limit(1)
+                        .with_for_update(skip_locked=True),
+                    )
+                ).first()
+                if job is None:
+                    return None
+
+                if job.attempts < self.max_attempts:
+                    job.status = "running"
+                    job.attempts += 1
+                    job.locked_until = datetime.now(tz=UTC) + timedelta(seconds=self.lease)
+                    await session.commit()
+                    return job
+
+                job.status = "failed"
+                job.locked_until = None
+                job.last_error = f"Gave up after {job.attempts} attempts"
+                await session.commit()
+
+    async def _renew_lease(self: Self, job_id: UUID) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                async with Session() as session:
+                    await session.execute(
+                        update(LabelJob)
+                        .where(LabelJob.id == job_id)
+                        .values(locked_until=datetime.now(tz=UTC) + timedelta(seconds=self.lease)),
+                    )
+                    await session.commit()
+            except Exception:
+                # Keep trying: until the lease runs out, there's still time to renew it
+                logger.exception("Could not renew the lease on label job %s", job_id)
+
+    async def run_job(self: Self, job: LabelJob) -> None:
+        """Create a claimed job's labels, and record its result."""
+        renew_lease = asyncio.create_task(self._renew_lease(job.id))
+        try:
+            result = await run_labels(LabelRequestForm.model_validate(job.form_data), label_job_id=job.id)
+        except Exception as exc:
+            logger.exception("Label job %s failed", job.id)
+            values = {"status": "failed", "last_error": repr(exc)}
+        else:
+            values = {"status": "done", "result": result}
+        finally:
+            # If we're cancelled, the lease runs out and the job is resumed by another worker
+            renew_lease.cancel()
+
+        async with Session() as session:
+            await session.execute(update(LabelJob).where(LabelJob.id == job.id).values(locked_until=None, **values))
+            await session.commit()
+
+    async def run(self: Self) -> None:
+        """Run jobs until cancelled."""
+        while True:
+            try:
+                job = await self.claim()
+                if job is not None:
+                    await self.run_job(job)
+            except Exception:
+                logger.exception("Could not run label jobs")
+                job = None
+
+            # Look for another job straight away after finishing one
+            if job is None:
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                self._wakeup.clear()
+
+
+label_job_runner = LabelJobRunner(
+    lease=App.label_job_lease,
+    poll_interval=App.label_job_poll_interval,
+    max_attempts=App.label_job_max_attempts,
+)
+notification_listener.subscribe(LABEL_JOBS_CHANNEL, label_job_runner.wake)
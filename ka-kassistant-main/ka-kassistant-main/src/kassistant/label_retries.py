@@ -0,0 +1,271 @@
+"""Retry, in the background, the labels of cartons that failed while FedEx was down."""
+
+import asyncio
+from collections.abc import Iterable
+from contextlib import suppress
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime, timedelta
+from logging import getLogger
+from typing import Any, Final, Self
+from uuid import UUID
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .constants import App
+from .fedex import FedExShipmentResponse, FedExUnavailableError
+from .labels import label_cache
+from .locks import carton_locks
+from .orm import LabelRetry, RawJSON, Session
+from .run_labels import create_shipment_labels, find_existing_shipments
+from .serialization import encode_json
+from .shipment_writer import ShipmentWriter
+
+__all__ = [
+    "UNKNOWN_ERROR_CODE",
+    "FailureGroup",
+    "LabelRetrier",
+    "claim_station_labels",
+    "group_failures",
+    "label_retrier",
+]
+
+# Failures whose stored response has no FedEx error are grouped under this code
+UNKNOWN_ERROR_CODE: Final[str] = "UNKNOWN"
+
+logger = getLogger(__name__)
+
+
+class LabelRetrier:
+    """Create the labels of cartons that failed while FedEx was down, retrying them with backoff.
+
+    Due retries are claimed with `FOR UPDATE SKIP LOCKED`, and their next attempt is pushed back as they are claimed,
+    so a retry whose worker dies is tried again later rather than lost.
+    Each carton is locked like a scanned one, and its retry is dropped if it has been rescanned since.
+    Recovered labels wait in the queue of the station that scanned the carton.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        batch_size: int = 20,
+        poll_interval: float = 30.0,
+        max_attempts: int = 8,
+        *,
+        base_delay: float = 30.0,
+        max_delay: float = 1800.0,
+        concurrency: int = 4,
+    ) -> None:
+        """Initialize the LabelRetrier class."""
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = concurrency
+        self._wakeup = asyncio.Event()
+
+    def wake(self: Self) -> None:
+        """Look for due retries now instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def retry_delay(self: Self, attempts: int) -> timedelta:
+        """How long to wait before retrying a label that has been retried `attempts` times."""
+        return timedelta(seconds=min(self.base_delay * 2**attempts, self.max_delay))
+
+    async def claim(self: Self) -> list[LabelRetry]:
+        """Claim a batch of due retries, counting the attempt and scheduling the next."""
+        async with Session() as session:
+            retries = (
+                await session.scalars(
+                    select(LabelRetry)
+                    .where(LabelRetry.status == "pending", LabelRetry.next_attempt_at <= func.now())
+                    .order_by(LabelRetry.next_attempt_at)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True),
+                )
+            ).all()
+            for retry in retries:
+                retry.attempts += 1
+                retry.next_attempt_at = datetime.now(tz=UTC) + self.retry_delay(retry.attempts)
+            await session.commit()
+            return list(retries)
+
+    def still_unavailable(self: Self, retry: LabelRetry, reason: str) -> dict[str, Any]:
+        """Leave a retry to be tried again, or give up on it once it has been tried too many times."""
+        if retry.attempts >= self.max_attempts:
+            return {"status": "failed", "last_error": f"Gave up after {retry.attempts} attempts: {reason}"}
+        return {"last_error": reason}
+
+    async def create_label(self: Self, retry: LabelRetry) -> dict[str, Any]:
+        """Create a locked carton's label, recording the attempt as a shipment, and return how to update the retry."""
+        request_body = encode_json(retry.request)
+        requested_shipment = retry.request["requestedShipment"]
+        async with ShipmentWriter(flush_size=1) as writer:
+            # Recorded before the label is bought, like a scanned carton
+            (shipment_id,) = await writer.insert(
+                [
+                    {
+                        "carton_number": retry.carton_number,
+                        "tracking_number": None,
+                        "status": "in_flight",
+                        "service": requested_shipment["serviceType"],
+                        "ship_date": date.fromisoformat(requested_shipment["shipDatestamp"]),
+                        "fedex_create_label_request": RawJSON(request_body),
+                    },
+                ],
+            )
+            try:
+                ((_, outcome),) = await create_shipment_labels(
+                    [retry.carton_number],
+                    request_body,
+                    [retry.tracking_update],
+                )
+            except FedExUnavailableError as exc:
+                await writer.update(shipment_id, status="fedex_unavailable")
+                return self.still_unavailable(retry, str(exc))
+            except Exception as exc:
+                # FedEx may have created the label, so the shipment is left in flight, blocking rescans,
+                # for someone to check rather than retried
+                logger.exception("Could not retry the label for carton %s", retry.carton_number)
+                return {"status": "failed", "last_error": f"FedEx may have created the label: {exc!r}"}
+            await writer.update(shipment_id, **outcome)
+
+        if outcome["status"] == "shipped":
+            logger.info("Recovered the label for carton %s", retry.carton_number)
+            return {"status": "recovered", "recovered_shipment_id": shipment_id, "last_error": None}
+
+        if outcome["status"] == "in_flight":
+            return {"status": "failed", "last_error": "FedEx created the shipment but didn't send its label"}
+
+        reason = f"FedEx error {failure_code(outcome['fedex_create_label_response'])}"
+        if outcome["status"] == "fedex_unavailable":
+            return self.still_unavailable(retry, reason)
+        return {"status": "failed", "last_error": reason}
+
+    async def retry_label(self: Self, retry: LabelRetry) -> dict[str, Any]:
+        """Try creating a claimed retry's label again, returning how to update the retry."""
+        async with carton_locks([retry.carton_number]) as locked_carton_numbers:
+            if not locked_carton_numbers:
+                # A station is shipping the carton right now, so leave it for the next attempt
+                return {}
+
+            existing_shipments = await find_existing_shipments([retry.carton_number])
+            if retry.carton_number in existing_shipments:
+                status, _ = existing_shipments[retry.carton_number]
+                return {"status": "superseded", "last_error": f"The carton was rescanned, and is now {status}"}
+
+            return await self.create_label(retry)
+
+    async def retry_batch(self: Self) -> int:
+        """Retry one batch of due labels, returning how many were claimed."""
+        retries = await self.claim()
+        if not retries:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def retry_bounded_label(retry: LabelRetry) -> dict[str, Any]:
+            async with semaphore:
+                return await self.retry_label(retry)
+
+        results = await asyncio.gather(*(retry_bounded_label(retry) for retry in retries), return_exceptions=True)
+        async with Session() as session:
+            for retry, result in zip(retries, results, strict=True):
+                if isinstance(result, BaseException):
+                    # It stays pending, and is tried again at its next attempt
+                    logger.error("Could not retry the label for carton %s", retry.carton_number, exc_info=result)
+                elif result:
+                    await session.execute(update(LabelRetry).where(LabelRetry.id == retry.id).values(**result))
+            await session.commit()
+        return len(retries)
+
+    async def run(self: Self) -> None:
+        """Retry labels until cancelled."""
+        while True:
+            try:
+                claimed = await self.retry_batch()
+            except Exception:
+                logger.exception("Could not retry labels")
+                claimed = 0
+
+            # A full batch means there's probably more due
+            if claimed < self.batch_size:
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                self._wakeup.clear()
+
+
+def failure_code(response: dict[str, Any] | None) -> str:
+    """Get the code of the first FedEx error in a stored label creation response."""
+    if not response:
+        return UNKNOWN_ERROR_CODE
+    errors = FedExShipmentResponse.model_validate(response).errors
+    return errors[0].code if errors else UNKNOWN_ERROR_CODE
+
+
+@dataclass(frozen=True, slots=True)
+class FailureGroup:
+    """Failed shipments that FedEx rejected with the same error code."""
+
+    code: str
+    message: str
+    shipments: list[tuple[UUID, str, datetime]] = field(default_factory=list)
+
+
+def group_failures(shipments: Iterable[tuple[UUID, str, datetime, dict[str, Any] | None]]) -> list[FailureGroup]:
+    """Group failed shipments by the FedEx error in their stored response, most common first.
+
+    Takes each shipment's ID, carton number, creation time and label creation response.
+    Failures that happened only because FedEx was down are left out, since they aren't a problem with the carton.
+    """
+    groups: dict[str, FailureGroup] = {}
+    for shipment_id, carton_number, created, response in shipments:
+        shipment_response = FedExShipmentResponse.model_validate(response or {})
+        if shipment_response.transient():
+            continue
+        if shipment_response.errors:
+            code, message = shipment_response.errors[0].code, shipment_response.errors[0].message
+        else:
+            code, message = UNKNOWN_ERROR_CODE, "FedEx didn't say what went wrong"
+        group = groups.setdefault(code, FailureGroup(code=code, message=message))
+        group.shipments.append((shipment_id, carton_number, created))
+    return sorted(groups.values(), key=lambda group: len(group.shipments), reverse=True)
+
+
+async def claim_station_labels(session: AsyncSession, station: str) -> list[str]:
+    """Take the recovered labels waiting to be printed at a station, oldest first, marking them printed.
+
+    The caller must commit the session.
+    """
+    retries = (
+        await session.scalars(
+            select(LabelRetry)
+            .where(
+                LabelRetry.station == station,
+                LabelRetry.status == "recovered",
+                LabelRetry.printed_at.is_(None),
+            )
+            .order_by(LabelRetry.updated)
+            .with_for_update(skip_locked=True),
+        )
+    ).all()
+
+    label_strs = []
+    for retry in retries:
+        if retry.recovered_shipment_id is None:
+            continue
+        label_str = await label_cache.get(retry.recovered_shipment_id)
+        if label_str is not None:
+            label_strs.append(label_str)
+            retry.printed_at = datetime.now(tz=UTC)
+    return label_strs
+
+
+label_retrier = LabelRetrier(
+    batch_size=App.label_retry_batch_size,
+    poll_interval=App.label_retry_poll_interval,
+    max_attempts=App.label_retry_max_attempts,
+    base_delay=App.label_retry_base_delay,
+    max_delay=App.label_retry_max_delay,
+    concurrency=App.label_retry_concurrency,
+)
@@ -0,0 +1,65 @@
+"""Compressed label storage, with an in-process cache of recently used labels."""
+
+import zlib
+from collections import OrderedDict
+from typing import Self
+from uuid import UUID
+
+from sqlalchemy import select
+
+from .constants import App
+from .orm import Session, ShipmentLabel
+
+__all__ = [
+    "LabelCache",
+    "compress_label",
+    "decompress_label",
+    "label_cache",
+]
+
+
+def compress_label(label: str) -> bytes:
+    """Compress label ZPL for storage."""
+    return zlib.compress(label.encode("utf-8"))
+
+
+def decompress_label(data: bytes) -> str:
+    """Decompress label ZPL compressed by `compress_label`."""
+    return zlib.decompress(data).decode("utf-8")
+
+
+class LabelCache:
+    """Cache the most recently used labels, loading others from the `shipment_labels` table.
+
+    Labels never change once they're created, so cached labels never go stale.
+    """
+
+    def __init__(self, max_size: int = 512) -> None:
+        """Initialize the LabelCache class."""
+        self.max_size = max_size
+        self._labels: OrderedDict[UUID, str] = OrderedDict()
+
+    def put(self: Self, shipment_id: UUID, label: str) -> None:
+        """Cache a shipment's label, evicting the least recently used label if the cache is full."""
+        self._labels[shipment_id] = label
+        self._labels.move_to_end(shipment_id)
+        while len(self._labels) > self.max_size:
+            self._labels.popitem(last=False)
+
+    async def get(self: Self, shipment_id: UUID) -> str | None:
+        """Get a shipment's label, or `None` if it doesn't have one."""
+        if (label := self._labels.get(shipment_id)) is not None:
+            self._labels.move_to_end(shipment_id)
+            return label
+
+        async with Session() as session:
+            data = await session.scalar(select(ShipmentLabel.label).where(ShipmentLabel.shipment_id == shipment_id))
+        if data is None:
+            return None
+
+        label = decompress_label(data)
+        self.put(shipment_id, label)
+        return label
+
+
+label_cache = LabelCache(App.label_cache_size)
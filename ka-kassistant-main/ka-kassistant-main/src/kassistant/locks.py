@@ -0,0 +1,41 @@
+"""Postgres advisory locks shared by every worker."""
+
+from collections.abc import AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from typing import Final
+
+from sqlalchemy import String, column, func, select
+
+from .orm import engine
+
+__all__ = ["carton_locks"]
+
+# First key of the two-key advisory lock functions, to keep carton locks apart from other advisory locks
+CARTON_LOCK_NAMESPACE: Final[int] = 0x4B41_0001
+
+
+@asynccontextmanager
+async def carton_locks(carton_numbers: Sequence[str]) -> AsyncIterator[set[str]]:
+    """Lock cartons so only one station can buy their labels at a time.
+
+    Yields the carton numbers that were locked.
+    Cartons already locked by another station are left out rather than waited on.
+    The locks are held on a dedicated connection until the context exits.
+    """
+    if not carton_numbers:
+        yield set()
+        return
+
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        carton_number = column("carton_number", String)
+        try:
+            rows = await connection.execute(
+                select(
+                    carton_number,
+                    func.pg_try_advisory_lock(CARTON_LOCK_NAMESPACE, func.hashtext(carton_number)),
+                ).select_from(func.unnest(list(carton_numbers)).table_valued("carton_number")),
+            )
+            yield {locked_carton_number for locked_carton_number, locked in rows if locked}
+        finally:
+            await connection.execute(select(func.pg_advisory_unlock_all()))
@@ -0,0 +1,74 @@
+"""Postgres LISTEN/NOTIFY, to tell every worker when shared state changes."""
+
+import asyncio
+from collections import defaultdict
+from collections.abc import Callable
+from logging import getLogger
+from typing import Self
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .constants import App
+
+__all__ = [
+    "NotificationListener",
+    "notification_listener",
+    "notify",
+]
+
+logger = getLogger(__name__)
+
+# Called with the notification payload, or `None` when notifications may have been missed
+type NotificationCallback = Callable[[str | None], None]
+
+
+async def notify(session: AsyncSession, channel: str, payload: str = "") -> None:
+    """Queue a notification, sent to every listening worker when the session commits."""
+    await session.execute(select(func.pg_notify(channel, payload)))
+
+
+class NotificationListener:
+    """Listen for notifications on a dedicated connection and dispatch them to callbacks."""
+
+    def __init__(self, database_url: str, reconnect_delay: float = 5.0) -> None:
+        """Initialize the NotificationListener class."""
+        # psycopg wants a libpq connection string rather than a SQLAlchemy URL
+        self.conninfo = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.reconnect_delay = reconnect_delay
+        self.callbacks: defaultdict[str, list[NotificationCallback]] = defaultdict(list)
+
+    def subscribe(self: Self, channel: str, callback: NotificationCallback) -> None:
+        """Call `callback` for every notification on `channel`."""
+        self.callbacks[channel].append(callback)
+
+    def _dispatch(self: Self, channel: str, payload: str | None) -> None:
+        for callback in self.callbacks[channel]:
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception("Notification callback for %s failed", channel)
+
+    async def run(self: Self) -> None:
+        """Listen until cancelled, reconnecting if the connection drops."""
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.conninfo, autocommit=True) as connection:
+                    for channel in self.callbacks:
+                        await connection.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+
+                    # Anything could have changed while we weren't listening
+                    for channel in self.callbacks:
+                        self._dispatch(channel, None)
+
+                    async for notification in connection.notifies():
+                        self._dispatch(notification.channel, notification.payload)
+            except psycopg.OperationalError:
+                logger.exception("Lost notification connection, reconnecting in %s seconds", self.reconnect_delay)
+                await asyncio.sleep(self.reconnect_delay)
+
+
+notification_listener = NotificationListener(App.database_url)
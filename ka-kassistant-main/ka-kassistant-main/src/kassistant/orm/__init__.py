@@ -1,20 +1,43 @@
 """ORM."""
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from kassistant.constants import App
 
+from .address_validations import AddressValidation
+from .base import RawJSON, serialize_json
+from .kerp_cartons import KERPCarton
+from .label_jobs import LabelJob
+from .label_retries import LabelRetry
+from .oauth_tokens import OAuthToken
 from .settings import Settings
+from .shipment_labels import ShipmentLabel
+from .shipment_payload_archive import ShipmentPayloadArchive
 from .shipments import Shipment
+from .tracking_updates import TrackingUpdate
 
 __all__ = [
+    "AddressValidation",
+    "KERPCarton",
+    "LabelJob",
+    "LabelRetry",
+    "OAuthToken",
+    "RawJSON",
     "Session",
     "Settings",
     "Shipment",
+    "ShipmentLabel",
+    "ShipmentPayloadArchive",
+    "TrackingUpdate",
     "engine",
 ]
 
 
-engine = create_engine(App.database_url, connect_args={"options": "-c timezone=utc"})
-Session = sessionmaker(engine)
+engine = create_async_engine(
+    App.database_url,
+    pool_size=App.database_pool_size,
+    max_overflow=App.database_max_overflow,
+    connect_args={"options": "-c timezone=utc"},
+    json_serializer=serialize_json,
+)
+Session = async_sessionmaker(engine, expire_on_commit=False)
@@ -0,0 +1,24 @@
+"""Model: AddressValidation."""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class AddressValidation(Base, TimestampsMixin):
+    """A recipient address checked before its labels were bought, so it isn't checked again until it expires."""
+
+    __tablename__ = "address_validations"
+    __table_args__ = (Index("ix_address_validations_expires_at", "expires_at"),)
+
+    address_key: Mapped[str] = mapped_column(primary_key=True, comment="Normalized recipient address")
+    valid: Mapped[bool] = mapped_column(comment="Whether labels can be created for the address")
+    message: Mapped[str | None] = mapped_column(comment="Why labels can't be created for the address")
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        comment="The date and time the address must be checked again by",
+    )
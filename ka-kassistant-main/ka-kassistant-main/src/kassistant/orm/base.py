@@ -4,6 +4,8 @@ from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.orm import DeclarativeBase
 
+from kassistant.serialization import encode_json
+
 
 class Base(DeclarativeBase):
     """Classes that inherit this class will be automatically mapped using declarative mapping."""
@@ -11,3 +13,19 @@ class Base(DeclarativeBase):
     type_annotation_map = {  # noqa: RUF012
         dict: MutableDict.as_mutable(JSONB),
     }
+
+
+class RawJSON(bytes):
+    """JSON that has already been serialized, to store in a JSON column as it is.
+
+    Only bulk inserts and updates accept it, since mapped attributes only accept dicts.
+    """
+
+    __slots__ = ()
+
+
+def serialize_json(value: object) -> bytes:
+    """Serialize a value for a JSON column, passing `RawJSON` through untouched."""
+    if isinstance(value, RawJSON):
+        return value
+    return encode_json(value)
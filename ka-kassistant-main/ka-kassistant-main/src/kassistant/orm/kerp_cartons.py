@@ -0,0 +1,29 @@
+"""Model: KERPCarton."""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class KERPCarton(Base, TimestampsMixin):
+    """A carton looked up in K-ERP, cached for every worker until it ships or expires.
+
+    The table is unlogged, since it is only a cache: it is emptied if Postgres crashes.
+    """
+
+    __tablename__ = "kerp_carton_cache"
+    __table_args__ = (
+        Index("ix_kerp_carton_cache_expires_at", "expires_at"),
+        {"prefixes": ["UNLOGGED"]},
+    )
+
+    carton_number: Mapped[str] = mapped_column(primary_key=True, comment="K-ERP carton number")
+    record: Mapped[dict] = mapped_column(comment="K-ERP carton data")  # type: ignore[type-arg]
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        comment="The date and time the carton must be looked up again by",
+    )
@@ -0,0 +1,43 @@
+"""Model: LabelJob."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, func, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class LabelJob(Base, TimestampsMixin):
+    """A wave of cartons queued to have labels created in the background."""
+
+    __tablename__ = "label_jobs"
+    __table_args__ = (
+        Index(
+            "ix_label_jobs_unfinished",
+            "created",
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=func.uuid_generate_v4(),
+        comment="Unique ID for this label job",
+    )
+
+    form_data: Mapped[dict] = mapped_column(comment="Label request form data")  # type: ignore[type-arg]
+
+    status: Mapped[str] = mapped_column(default="queued", comment="Job status: queued, running, done or failed")
+    attempts: Mapped[int] = mapped_column(default=0, comment="Number of times the job has been started")
+    locked_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        default=None,
+        comment="The date and time the worker running the job must check in by (NULL if not running)",
+    )
+    last_error: Mapped[str | None] = mapped_column(default=None, comment="Error the job failed with")
+    result: Mapped[str | None] = mapped_column(default=None, comment="Label ZPL in scan order, once the job is done")
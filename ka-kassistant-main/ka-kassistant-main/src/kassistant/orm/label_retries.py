@@ -0,0 +1,71 @@
+"""Model: LabelRetry."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, func, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class LabelRetry(Base, TimestampsMixin):
+    """A carton whose label failed while FedEx was down, to be tried again in the background.
+
+    Recovered labels wait here to be printed at the station that scanned the carton.
+    """
+
+    __tablename__ = "label_retries"
+    __table_args__ = (
+        Index(
+            "ix_label_retries_pending",
+            "next_attempt_at",
+            postgresql_where=text("status = 'pending'"),
+        ),
+        Index(
+            "ix_label_retries_unprinted",
+            "station",
+            postgresql_where=text("status = 'recovered' AND printed_at IS NULL"),
+        ),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=func.uuid_generate_v4(),
+        comment="Unique ID for this label retry",
+    )
+
+    shipment_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        comment="Shipment whose label failed",
+    )
+    carton_number: Mapped[str] = mapped_column(comment="K-ERP carton number")
+    station: Mapped[str] = mapped_column(comment="Packing station that scanned the carton")
+    request: Mapped[dict] = mapped_column(comment="FedEx label creation request for the carton alone")  # type: ignore[type-arg]
+    tracking_update: Mapped[dict] = mapped_column(  # type: ignore[type-arg]
+        comment="K-ERP tracking update request data, less the tracking number",
+    )
+
+    status: Mapped[str] = mapped_column(
+        default="pending",
+        comment="Retry status: pending, recovered, failed or superseded",
+    )
+    attempts: Mapped[int] = mapped_column(default=0, comment="Number of times the label has been retried")
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        comment="The date and time to next try creating the label",
+    )
+    last_error: Mapped[str | None] = mapped_column(default=None, comment="Why the label last failed")
+    recovered_shipment_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True),
+        default=None,
+        comment="Shipment created by the retry that succeeded (NULL if not recovered)",
+    )
+    printed_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        default=None,
+        comment="The date and time the recovered label was sent to the station (NULL if not sent)",
+    )
@@ -0,0 +1,22 @@
+"""Model: OAuthToken."""
+
+from datetime import datetime
+
+from sqlalchemy import DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class OAuthToken(Base, TimestampsMixin):
+    """OAuth access token shared by every worker."""
+
+    __tablename__ = "oauth_tokens"
+
+    client_id: Mapped[str] = mapped_column(primary_key=True, comment="OAuth client ID the token was issued to")
+    access_token: Mapped[str] = mapped_column(comment="OAuth access token")
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        comment="The date and time the access token expires",
+    )
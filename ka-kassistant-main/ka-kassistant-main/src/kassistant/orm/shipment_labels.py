@@ -0,0 +1,23 @@
+"""Model: ShipmentLabel."""
+
+import uuid
+
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class ShipmentLabel(Base, TimestampsMixin):
+    """A shipment's label, stored apart from the shipment so the label isn't loaded with it."""
+
+    __tablename__ = "shipment_labels"
+
+    shipment_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        comment="Shipment the label belongs to",
+    )
+
+    label: Mapped[bytes] = mapped_column(comment="zlib-compressed label ZPL")
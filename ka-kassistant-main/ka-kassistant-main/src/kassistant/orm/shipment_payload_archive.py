@@ -0,0 +1,25 @@
+"""Model: ShipmentPayloadArchive."""
+
+import uuid
+
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class ShipmentPayloadArchive(Base, TimestampsMixin):
+    """A shipment's payloads, compressed and moved out of the `shipments` table once they're old."""
+
+    __tablename__ = "shipment_payload_archive"
+
+    shipment_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        comment="Shipment the payloads belong to",
+    )
+
+    payloads: Mapped[bytes] = mapped_column(
+        comment="zlib-compressed JSON of the shipment's FedEx request and response and K-ERP response",
+    )
@@ -1,19 +1,56 @@
 """Model: Shipment."""
 
 import uuid
+from datetime import date, datetime
+from typing import Any
 
-from sqlalchemy import func
+from sqlalchemy import DateTime, ForeignKey, Index, func, text
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.orm import Mapped, declared_attr, mapped_column
 
 from .base import Base
 from .mixins.timestamps import TimestampsMixin
 
 
 class Shipment(Base, TimestampsMixin):
-    """Shipment."""
+    """Shipment.
+
+    The table is partitioned by month on `created`.
+    """
 
     __tablename__ = "shipments"
+    __table_args__ = (
+        Index("ix_shipments_created", "created"),
+        Index(
+            "ix_shipments_created_unarchived",
+            "created",
+            postgresql_where=text("archived_at IS NULL"),
+        ),
+        Index(
+            "ix_shipments_carton_number_shipped",
+            "carton_number",
+            postgresql_where=text("status = 'shipped'"),
+        ),
+        Index(
+            "ix_shipments_carton_number_in_flight",
+            "carton_number",
+            postgresql_where=text("status = 'in_flight'"),
+        ),
+        Index(
+            "ix_shipments_label_job_id",
+            "label_job_id",
+            postgresql_where=text("label_job_id IS NOT NULL"),
+        ),
+        {"postgresql_partition_by": "RANGE (created)"},
+    )
+
+    @declared_attr.directive
+    def __mapper_args__(cls) -> dict[str, Any]:  # noqa: N805
+        """Identify shipments by `id` alone.
+
+        The table's primary key has to include the partition key, `created`, but `id` is unique by itself.
+        """
+        return {"primary_key": [cls.__table__.c.id]}
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
@@ -22,10 +59,23 @@ class Shipment(Base, TimestampsMixin):
         comment="Unique ID for this shipment",
     )
 
+    created: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        primary_key=True,
+        server_default=func.now(),
+        comment="The date and time the object was created",
+    )
+
     carton_number: Mapped[str] = mapped_column(comment="K-ERP carton number")
     tracking_number: Mapped[str | None] = mapped_column(comment="FedEx tracking number")
+    master_tracking_number: Mapped[str | None] = mapped_column(
+        default=None,
+        comment="FedEx master tracking number of the carton's multi-piece shipment (NULL if shipped alone)",
+    )
 
     status: Mapped[str] = mapped_column(comment="Shipment status")
+    service: Mapped[str | None] = mapped_column(default=None, comment="FedEx service type")
+    ship_date: Mapped[date | None] = mapped_column(default=None, comment="Ship date")
 
     fedex_create_label_request: Mapped[dict | None] = mapped_column(  # type: ignore[type-arg]
         default=None,
@@ -38,3 +88,15 @@ class Shipment(Base, TimestampsMixin):
     )
 
     kerp_tracking_upload_response: Mapped[dict | None] = mapped_column(default=None)  # type: ignore[type-arg]
+
+    label_job_id: Mapped[uuid.UUID | None] = mapped_column(
+        ForeignKey("label_jobs.id"),
+        default=None,
+        comment="Label job the shipment was created by (NULL if created directly)",
+    )
+
+    archived_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        default=None,
+        comment="The date and time the payloads were moved to the archive (NULL if not archived)",
+    )
@@ -0,0 +1,69 @@
+"""Model: TrackingUpdate."""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import DateTime, Index, func, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+from .mixins.timestamps import TimestampsMixin
+
+
+class TrackingUpdate(Base, TimestampsMixin):
+    """Outbox of tracking numbers waiting to be written back to K-ERP."""
+
+    __tablename__ = "kerp_tracking_outbox"
+    __table_args__ = (
+        Index(
+            "ix_kerp_tracking_outbox_unsent",
+            "next_attempt_at",
+            postgresql_where=text("sent_at IS NULL AND abandoned_at IS NULL"),
+        ),
+        Index(
+            "ix_kerp_tracking_outbox_abandoned",
+            "abandoned_at",
+            postgresql_where=text("abandoned_at IS NOT NULL"),
+        ),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        primary_key=True,
+        server_default=func.uuid_generate_v4(),
+        comment="Unique ID for this tracking update",
+    )
+
+    shipment_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        comment="Shipment the tracking number belongs to",
+    )
+    payload: Mapped[dict] = mapped_column(comment="K-ERP tracking update request data")  # type: ignore[type-arg]
+
+    attempts: Mapped[int] = mapped_column(default=0, comment="Number of times sending the update has failed")
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        comment="The date and time to next try sending the update",
+    )
+    last_error: Mapped[str | None] = mapped_column(default=None, comment="Error from the last failed attempt")
+    claimed_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        default=None,
+        comment="The date and time a worker's claim on the update lapses (NULL if not claimed)",
+    )
+    abandoned_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        default=None,
+        comment="The date and time sending the update was given up on (NULL if not given up on)",
+    )
+    response: Mapped[dict | None] = mapped_column(  # type: ignore[type-arg]
+        default=None,
+        comment="K-ERP's response to the update (NULL if not sent)",
+    )
+    sent_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True),
+        default=None,
+        comment="The date and time the update was sent to K-ERP (NULL if not sent)",
+    )
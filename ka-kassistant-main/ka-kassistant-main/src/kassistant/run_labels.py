@@ -1,38 +1,63 @@
 """Run labels for cartons."""
 
-from base64 import b64decode
-from collections.abc import Sequence
-from datetime import datetime
+import asyncio
+import csv
+from collections import deque
+from collections.abc import (
+    AsyncGenerator,
+    AsyncIterator,
+    Callable,
+    Container,
+    Coroutine,
+    Iterable,
+    Iterator,
+    Sequence,
+)
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import UTC, date, datetime, timedelta
 from http import HTTPStatus
-from io import BytesIO
+from io import StringIO
 from logging import getLogger
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, Self
+from uuid import UUID
 
+import httpx
 import xlsxwriter
 from kerp_sdk.api_models import Carton, TrackingUpdateRequest
-from sqlalchemy import select
+from pydantic import ValidationError
+from sqlalchemy import select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from .constants import FedEx
+from .address_cache import address_cache
+from .carton_cache import carton_cache
+from .constants import App, FedEx
 from .fedex import (
     AccountNumber,
     Address,
     Contact,
-    CustomerReference,
     FedExShipmentRequest,
+    FedExShipmentResponse,
+    FedExUnavailableError,
     LabelSpecification,
     Payor,
-    Recipient,
-    RequestedPackageLineItem,
     RequestedShipment,
     ResponsibleParty,
     ShipmentSpecialServices,
     Shipper,
     ShippingChargesPayment,
-    Weight,
     fedex_client,
 )
 from .forms import LabelRequestForm
-from .kerp import kerp_client
-from .orm import Session, Settings, Shipment
+from .history import export_rows
+from .labels import decompress_label
+from .locks import carton_locks
+from .orm import RawJSON, Session, Settings, Shipment, ShipmentLabel, TrackingUpdate
+from .serialization import encode_json
+from .settings_cache import settings_cache
+from .shipment_archive import load_payloads
+from .shipment_writer import ShipmentWriter
 
 ERROR_LABEL_TEMPLATE = r"""
 ^XA
@@ -72,234 +97,1041 @@ API_BILLING_NAME_TO_WRITEBACK_BILLING_NAME = {
 REPORT_COLUMN_HEADERS = [
     "CartonNumber",
     "TrackingNumber",
+    "Status",
+    "Service",
+    "ShipDate",
+    "Created",
 ]
+# Exports smaller than this are built in memory, and larger ones in a temporary file
+EXPORT_SPOOL_SIZE = 16 * 1024 * 1024
+EXPORT_CHUNK_SIZE = 64 * 1024
 logger = getLogger(__name__)
 
 
-def build_label_request_body(carton: Carton, form_data: LabelRequestForm) -> FedExShipmentRequest:
-    """Build a label creation request."""
-    with Session() as session:
-        settings = session.scalars(select(Settings)).first()
-        if settings is None:
-            # This SHOULD be unreachable,
-            # because the shipping route is redirected to the settings setup page if settings are not found.
-            msg = (
-                "Settings not found in database. "
-                "Please set up the settings in the application. "
-                "See https://impressdesigns.dev/knights-apparel-kerp-shipping/user/setup/getting-started"
-            )
-            raise ValueError(msg)
+@dataclass(frozen=True, slots=True)
+class LabelRequestTemplate:
+    """A label request with everything but the carton's recipient and package, shared by every carton in a wave.
+
+    The shared parts are validated and dumped once, so each carton only fills in its own parts.
+    """
+
+    request: dict[str, Any]
+    shipment_special_services: dict[str, Any]
+    customer_reference: str | None
+
+    def package(self: Self, sequence_number: int, carton: Carton) -> dict[str, Any]:
+        """Build a carton's package in a label creation request."""
+        customer_references = [
+            ("CUSTOMER_REFERENCE", self.customer_reference or carton.carton_number),
+            ("DEPARTMENT_NUMBER", carton.carton_number),
+            ("INVOICE_NUMBER", f"{carton.control_number}-LN {carton.ps_line}"),
+            ("P_O_NUMBER", carton.customer_purchase_order),
+        ]
+        return {
+            "sequenceNumber": sequence_number,
+            "weight": {"value": float(carton.weight), "units": "LB"},
+            "customerReferences": [
+                {"customerReferenceType": reference_type, "value": value}
+                for reference_type, value in customer_references
+            ],
+            "shipmentSpecialServices": self.shipment_special_services,
+        }
+
+    def render(self: Self, cartons: Sequence[Carton]) -> bytes:
+        """Build the label creation request for a shipment of one or more cartons, as the JSON to send and to store.
+
+        The cartons must all be going to the same recipient, which is taken from the first.
+        """
+        recipient = cartons[0]
+        return encode_json(
+            {
+                **self.request,
+                "requestedShipment": {
+                    **self.request["requestedShipment"],
+                    "recipients": [
+                        {
+                            "contact": {
+                                "personName": recipient.company,
+                                "phoneNumber": 1234567890,
+                                "companyName": recipient.company,
+                            },
+                            "address": {
+                                "streetLines": [recipient.address1, recipient.address2],
+                                "city": recipient.city,
+                                "stateOrProvinceCode": recipient.state,
+                                "postalCode": recipient.postal_code,
+                                "countryCode": "US",
+                            },
+                        },
+                    ],
+                    "requestedPackageLineItems": [
+                        self.package(sequence_number, carton) for sequence_number, carton in enumerate(cartons, start=1)
+                    ],
+                    "totalPackageCount": len(cartons),
+                },
+            },
+        )
+
+
+def build_label_request_template(form_data: LabelRequestForm, settings: Settings) -> LabelRequestTemplate:
+    """Build the parts of a label request that are shared by every carton in a wave."""
+    shipping_charges_payment = ShippingChargesPayment(
+        paymentType=form_data.billing,
+        payor=Payor(
+            responsibleParty=ResponsibleParty(
+                accountNumber=AccountNumber(value=form_data.third_party_account_number),
+            ),
+        ),
+    )
 
-        shipping_charges_payment = ShippingChargesPayment(
-            paymentType=form_data.billing,
-            payor=Payor(
-                responsibleParty=ResponsibleParty(
-                    accountNumber=AccountNumber(value=form_data.third_party_account_number),
+    shipment_special_services = ShipmentSpecialServices(
+        specialServiceTypes=[],
+    )
+    if form_data.saturday_delivery:
+        shipment_special_services.specialServiceTypes.append("SATURDAY_DELIVERY")
+
+    street_lines = [settings.ship_from_address_1]
+    if settings.ship_from_address_2:
+        street_lines.append(settings.ship_from_address_2)
+
+    # Each carton fills in its recipient and package
+    request = FedExShipmentRequest(
+        requestedShipment=RequestedShipment(
+            shipper=Shipper(
+                contact=Contact(
+                    personName=settings.ship_from_name,
+                    phoneNumber=settings.ship_from_phone,
+                    companyName=settings.ship_from_company,
+                ),
+                address=Address(
+                    streetLines=street_lines,
+                    city=settings.ship_from_city,
+                    stateOrProvinceCode=settings.ship_from_state,
+                    postalCode=settings.ship_from_postal_code,
+                    countryCode=settings.ship_from_country_code,
                 ),
             ),
+            recipients=[],
+            shipDatestamp=form_data.ship_date,
+            serviceType=form_data.service,
+            shippingChargesPayment=shipping_charges_payment,
+            labelSpecification=LabelSpecification(labelStockType=settings.fedex_label_size),
+            requestedPackageLineItems=[],
+        ),
+        accountNumber=AccountNumber(
+            value=FedEx.account,
+        ),
+    )
+
+    return LabelRequestTemplate(
+        request=request.model_dump(),
+        shipment_special_services=shipment_special_services.model_dump(),
+        customer_reference=form_data.air_auth,
+    )
+
+
+@dataclass(frozen=True, slots=True)
+class LabelRequestContext:
+    """The parts of a label request that are shared by every carton in a wave."""
+
+    form_data: LabelRequestForm
+    template: LabelRequestTemplate
+
+
+async def build_label_request_context(form_data: LabelRequestForm) -> LabelRequestContext:
+    """Build the parts of a label request that are shared by every carton in a wave.
+
+    Raises `ValueError` if a carton was scanned twice, or settings haven't been set up,
+    so a request that can't be run is turned away before any label is created.
+    """
+    scanned_carton_numbers(form_data)
+    settings = await settings_cache.get()
+    if settings is None:
+        # This SHOULD be unreachable,
+        # because the shipping route is redirected to the settings setup page if settings are not found.
+        msg = (
+            "Settings not found in database. "
+            "Please set up the settings in the application. "
+            "See https://impressdesigns.dev/knights-apparel-kerp-shipping/user/setup/getting-started"
         )
+        raise ValueError(msg)
+
+    return LabelRequestContext(form_data=form_data, template=build_label_request_template(form_data, settings))
+
 
-        shipment_special_services = ShipmentSpecialServices(
-            specialServiceTypes=[],
+async def find_existing_shipments(carton_numbers: Sequence[str]) -> dict[str, tuple[str, str | None]]:
+    """Find cartons that already have a label, or whose label request was interrupted.
+
+    Returns each carton's status and tracking number.
+    """
+    if not carton_numbers:
+        return {}
+
+    # One query per status, so each can use its partial index
+    statement = union_all(
+        *(
+            select(Shipment.carton_number, Shipment.status, Shipment.tracking_number).where(
+                Shipment.carton_number.in_(carton_numbers),
+                Shipment.status == status,
+            )
+            for status in ("shipped", "in_flight")
+        ),
+    )
+    async with Session() as session:
+        rows = await session.execute(statement)
+        return {carton_number: (status, tracking_number) for carton_number, status, tracking_number in rows.tuples()}
+
+
+async def find_label_job_labels(label_job_id: UUID) -> dict[str, str]:
+    """Find the labels a label job has already created, by carton number."""
+    async with Session() as session:
+        rows = await session.execute(
+            select(Shipment.carton_number, ShipmentLabel.label)
+            .join(ShipmentLabel, ShipmentLabel.shipment_id == Shipment.id)
+            .where(Shipment.label_job_id == label_job_id, Shipment.status == "shipped"),
         )
-        if form_data.saturday_delivery:
-            shipment_special_services.specialServiceTypes.append("SATURDAY_DELIVERY")
-
-        street_lines = [settings.ship_from_address_1]
-        if settings.ship_from_address_2:
-            street_lines.append(settings.ship_from_address_2)
-
-        return FedExShipmentRequest(
-            requestedShipment=RequestedShipment(
-                shipper=Shipper(
-                    contact=Contact(
-                        personName=settings.ship_from_name,
-                        phoneNumber=settings.ship_from_phone,
-                        companyName=settings.ship_from_company,
-                    ),
-                    address=Address(
-                        streetLines=street_lines,
-                        city=settings.ship_from_city,
-                        stateOrProvinceCode=settings.ship_from_state,
-                        postalCode=settings.ship_from_postal_code,
-                        countryCode=settings.ship_from_country_code,
-                    ),
+        return {carton_number: decompress_label(label) for carton_number, label in rows.tuples()}
+
+
+def existing_shipment_error_label(carton_number: str, status: str, tracking_number: str | None) -> str:
+    """Build the error label for a carton that can't be shipped again."""
+    if status == "in_flight":
+        error_message = "A previous label request for this carton was interrupted. Check its history before shipping."
+    else:
+        error_message = f"Label already created for this carton: {tracking_number}"
+    return ERROR_LABEL_TEMPLATE.format(carton_number=carton_number, error_message=error_message)
+
+
+def unshipped_carton_label(
+    carton_number: str,
+    locked_carton_numbers: Container[str],
+    job_labels: dict[str, str],
+    existing_shipments: dict[str, tuple[str, str | None]],
+    invalid_addresses: dict[str, str],
+) -> str:
+    """Get the label to print for a carton that isn't being shipped: a label job's reprint, or an error label."""
+    if carton_number not in locked_carton_numbers:
+        return ERROR_LABEL_TEMPLATE.format(
+            carton_number=carton_number,
+            error_message="Carton is being processed at another station",
+        )
+
+    if carton_number in job_labels:
+        return job_labels[carton_number]
+
+    if carton_number in invalid_addresses:
+        return ERROR_LABEL_TEMPLATE.format(
+            carton_number=carton_number,
+            error_message=f"Bad address: {invalid_addresses[carton_number]}. Fix it in K-ERP, then rescan this carton.",
+        )
+
+    return existing_shipment_error_label(carton_number, *existing_shipments[carton_number])
+
+
+def kerp_tracking_update(carton: Carton, form_data: LabelRequestForm) -> dict[str, Any]:
+    """Build the tracking update to write back to K-ERP for a carton, less the tracking number it gets once shipped."""
+    kerp_update = TrackingUpdateRequest(
+        tracking_number="",
+        reference=form_data.air_auth or carton.carton_number,
+        department=carton.carton_number,
+        ship_date=datetime.strptime(form_data.ship_date, "%Y-%m-%d").date(),  # noqa: DTZ007
+        service=API_SERVICE_NAME_TO_WRITEBACK_SERVICE_NAME[form_data.service],
+        payment_type=API_BILLING_NAME_TO_WRITEBACK_BILLING_NAME[form_data.billing],
+    )
+    tracking_update: dict[str, Any] = kerp_update.model_dump(mode="json", exclude={"tracking_number"})
+    return tracking_update
+
+
+def resolved_tracking_update(carton_number: str, request: dict[str, Any], tracking_number: str) -> dict[str, Any]:
+    """Build the tracking update to write back to K-ERP for a carton, from its stored label creation request."""
+    requested_shipment = request["requestedShipment"]
+    references = next(
+        references
+        for item in requested_shipment["requestedPackageLineItems"]
+        if (
+            references := {
+                reference["customerReferenceType"]: reference["value"] for reference in item["customerReferences"]
+            }
+        ).get("DEPARTMENT_NUMBER")
+        == carton_number
+    )
+    kerp_update = TrackingUpdateRequest(
+        tracking_number=tracking_number,
+        reference=references["CUSTOMER_REFERENCE"],
+        department=carton_number,
+        ship_date=date.fromisoformat(requested_shipment["shipDatestamp"]),
+        service=API_SERVICE_NAME_TO_WRITEBACK_SERVICE_NAME[requested_shipment["serviceType"]],
+        payment_type=API_BILLING_NAME_TO_WRITEBACK_BILLING_NAME[
+            requested_shipment["shippingChargesPayment"]["paymentType"]
+        ],
+    )
+    tracking_update: dict[str, Any] = kerp_update.model_dump(mode="json")
+    return tracking_update
+
+
+async def resolve_in_flight_shipment(session: AsyncSession, shipment_id: UUID, tracking_number: str | None) -> bool:
+    """Record what became of a shipment left in flight, once someone has checked FedEx.
+
+    With a `tracking_number`, the label was bought: the shipment is recorded as shipped,
+    and its tracking number is queued for K-ERP. Without one, it is recorded as `not_shipped`,
+    so the carton can be rescanned.
+    Only shipments in flight for longer than `App.in_flight_stale_minutes` can be resolved,
+    so a label that is still being created can't be. Returns whether the shipment was resolved.
+    The caller must commit the session.
+    """
+    shipment = await session.scalar(
+        select(Shipment)
+        .where(
+            Shipment.id == shipment_id,
+            Shipment.status == "in_flight",
+            Shipment.created <= datetime.now(tz=UTC) - timedelta(minutes=App.in_flight_stale_minutes),
+        )
+        .with_for_update(),
+    )
+    if shipment is None:
+        return False
+
+    if tracking_number is None:
+        shipment.status = "not_shipped"
+        return True
+
+    request = (await load_payloads(session, shipment))["fedex_create_label_request"]
+    shipment.status = "shipped"
+    shipment.tracking_number = tracking_number
+    session.add(
+        TrackingUpdate(
+            shipment_id=shipment.id,
+            payload=resolved_tracking_update(shipment.carton_number, request, tracking_number),
+        ),
+    )
+    await carton_cache.invalidate(session, [shipment.carton_number])
+    return True
+
+
+async def create_shipment_labels(
+    carton_numbers: Sequence[str],
+    request_body: bytes,
+    tracking_updates: Sequence[dict[str, Any]],
+) -> list[tuple[str | None, dict[str, Any]]]:
+    """Create the labels for a shipment of one or more cartons, with one FedEx request.
+
+    The caller must hold the cartons' locks, and have checked the cartons haven't shipped already.
+    `tracking_updates` are the cartons' tracking updates for K-ERP, which are filled in with their tracking numbers.
+    Returns, for each carton, the label (or error label) ZPL to print, if any, and the shipment's outcome to record,
+    including the tracking update to write back to K-ERP and the label to store.
+    A shipment of more than one carton is a multi-piece shipment, with a master tracking number,
+    and each carton gets its own package tracking number and label.
+    If FedEx fails the request only because it is down, the outcome's status is `fedex_unavailable`
+    rather than `fedex_error`, since the request can be sent again.
+    If FedEx created the shipment but didn't send a label for every carton, the labels may have been bought,
+    so the outcome is left `in_flight`, which blocks rescans, with the response and any tracking numbers it has.
+    A failed request whose response can't be read is recorded as `fedex_error`, with the response's status and text.
+    """
+    label_response = await fedex_client.create_label(request_body)
+    # Parsed once, for the labels, the tracking numbers, the error, and the record of the response
+    try:
+        shipment_response = FedExShipmentResponse.model_validate_json(label_response.content)
+    except ValidationError:
+        # A successful response that can't be read may still have bought the labels, so the cartons stay in flight
+        if label_response.status_code == HTTPStatus.OK:
+            raise
+        return unreadable_error_labels(carton_numbers, label_response)
+
+    if label_response.status_code == HTTPStatus.OK:
+        pieces = shipment_response.pieces()
+        if set(pieces) != set(range(1, len(carton_numbers) + 1)) or any(
+            not p.packageDocuments for p in pieces.values()
+        ):
+            return incomplete_shipment_labels(carton_numbers, shipment_response)
+
+        master_tracking_number = shipment_response.master_tracking_number() if len(carton_numbers) > 1 else None
+        results = []
+        for sequence_number, tracking_update in enumerate(tracking_updates, start=1):
+            piece = pieces[sequence_number]
+            label_str = piece.packageDocuments[0].label()
+            results.append(
+                (
+                    label_str,
+                    {
+                        "tracking_number": piece.trackingNumber,
+                        "master_tracking_number": master_tracking_number,
+                        "status": "shipped",
+                        # Labels are stored on their own, and each carton keeps only its own package
+                        "fedex_create_label_response": shipment_response.payload(sequence_number),
+                        "tracking_update": {**tracking_update, "tracking_number": piece.trackingNumber},
+                        "label": label_str,
+                    },
                 ),
-                recipients=[
-                    Recipient(
-                        contact=Contact(
-                            personName=carton.company,
-                            phoneNumber=1234567890,
-                            companyName=carton.company,
-                        ),
-                        address=Address(
-                            streetLines=[
-                                carton.address1,
-                                carton.address2,
-                            ],
-                            city=carton.city,
-                            stateOrProvinceCode=carton.state,
-                            postalCode=carton.postal_code,
-                            countryCode="US",
-                        ),
-                    ),
-                ],
-                shipDatestamp=form_data.ship_date,
-                serviceType=form_data.service,
-                shippingChargesPayment=shipping_charges_payment,
-                labelSpecification=LabelSpecification(labelStockType=settings.fedex_label_size),
-                requestedPackageLineItems=[
-                    RequestedPackageLineItem(
-                        weight=Weight(value=carton.weight),
-                        customerReferences=[
-                            CustomerReference(
-                                customerReferenceType="CUSTOMER_REFERENCE",
-                                value=form_data.air_auth if form_data.air_auth else carton.carton_number,
-                            ),
-                            CustomerReference(
-                                customerReferenceType="DEPARTMENT_NUMBER",
-                                value=carton.carton_number,
-                            ),
-                            CustomerReference(
-                                customerReferenceType="INVOICE_NUMBER",
-                                value=f"{carton.control_number}-LN {carton.ps_line}",
-                            ),
-                            CustomerReference(
-                                customerReferenceType="P_O_NUMBER",
-                                value=carton.customer_purchase_order,
-                            ),
-                        ],
-                        shipmentSpecialServices=shipment_special_services,
-                    ),
-                ],
+            )
+        return results
+
+    error_message = None
+    if label_response.status_code == HTTPStatus.BAD_REQUEST and shipment_response.errors:
+        error = shipment_response.errors[0]
+        error_message = f"{error.code}: {error.message}" if error.message else error.code
+
+    outcome = {
+        "tracking_number": None,
+        "master_tracking_number": None,
+        "status": "fedex_unavailable" if shipment_response.transient() else "fedex_error",
+        "fedex_create_label_response": shipment_response.payload(),
+        "tracking_update": None,
+        "label": None,
+    }
+    return [
+        (
+            ERROR_LABEL_TEMPLATE.format(carton_number=carton_number, error_message=error_message)
+            if error_message
+            else None,
+            outcome,
+        )
+        for carton_number in carton_numbers
+    ]
+
+
+def unreadable_error_labels(
+    carton_numbers: Sequence[str],
+    label_response: httpx.Response,
+) -> list[tuple[str | None, dict[str, Any]]]:
+    """Build the error labels and outcomes of a shipment FedEx rejected with a response that can't be read.
+
+    The response may not be JSON at all, such as a gateway's error page, so its status and text are recorded as is.
+    """
+    outcome = {
+        "tracking_number": None,
+        "master_tracking_number": None,
+        "status": "fedex_error",
+        "fedex_create_label_response": {"status_code": label_response.status_code, "text": label_response.text},
+        "tracking_update": None,
+        "label": None,
+    }
+    return [
+        (
+            ERROR_LABEL_TEMPLATE.format(
+                carton_number=carton_number,
+                error_message=f"FedEx rejected this label with an unreadable {label_response.status_code} response",
             ),
-            accountNumber=AccountNumber(
-                value=FedEx.account,
+            outcome,
+        )
+        for carton_number in carton_numbers
+    ]
+
+
+def incomplete_shipment_labels(
+    carton_numbers: Sequence[str],
+    shipment_response: FedExShipmentResponse,
+) -> list[tuple[str | None, dict[str, Any]]]:
+    """Build the labels and outcomes of a shipment FedEx created without sending a label for every carton.
+
+    The outcomes stay `in_flight`, so the cartons can't be rescanned and bought again until someone checks them.
+    """
+    logger.error(
+        "FedEx created the shipment for cartons %s but didn't send a label for each of them",
+        ", ".join(carton_numbers),
+    )
+    pieces = shipment_response.pieces()
+    return [
+        (
+            ERROR_LABEL_TEMPLATE.format(
+                carton_number=carton_number,
+                error_message="FedEx created this carton's shipment but didn't send every label. "
+                "Check its history before shipping. Do not rescan it.",
             ),
+            {
+                "tracking_number": pieces[sequence_number].trackingNumber if sequence_number in pieces else None,
+                "master_tracking_number": shipment_response.master_tracking_number(),
+                "status": "in_flight",
+                "fedex_create_label_response": shipment_response.payload(),
+                "tracking_update": None,
+                "label": None,
+            },
         )
+        for sequence_number, carton_number in enumerate(carton_numbers, start=1)
+    ]
 
 
-async def run_labels(
-    form_data: LabelRequestForm,
-) -> str:
-    """Create labels for cartons."""
-    label_strs = []
+async def schedule_retries(  # noqa: PLR0913
+    writer: ShipmentWriter,
+    shipment: Sequence[Carton],
+    shipment_ids: Sequence[UUID],
+    *,
+    outcome: dict[str, Any],
+    reason: str,
+    context: LabelRequestContext,
+) -> list[str | None]:
+    """Record that FedEx was down for a shipment, and have its cartons retried on their own in the background.
+
+    Their labels are printed at the wave's station once they are created.
+    Returns the error label to print for each carton in the meantime.
+    """
+    station = context.form_data.station
+    next_attempt_at = datetime.now(tz=UTC) + timedelta(seconds=App.label_retry_base_delay)
+    for carton, shipment_id in zip(shipment, shipment_ids, strict=True):
+        await writer.update(
+            shipment_id,
+            retry={
+                "carton_number": carton.carton_number,
+                "station": station,
+                "request": RawJSON(context.template.render([carton])),
+                "tracking_update": kerp_tracking_update(carton, context.form_data),
+                "next_attempt_at": next_attempt_at,
+                "last_error": reason,
+            },
+            **outcome,
+        )
+    logger.warning("Retrying cartons %s in the background: %s", carton_numbers(shipment), reason)
+    return [
+        ERROR_LABEL_TEMPLATE.format(
+            carton_number=carton.carton_number,
+            error_message=f"FedEx is unavailable. This carton's label will be printed at station {station} "
+            "once FedEx is back. Do not rescan it.",
+        )
+        for carton in shipment
+    ]
+
+
+async def record_shipment_outcomes(
+    writer: ShipmentWriter,
+    shipment: Sequence[Carton],
+    shipment_ids: Sequence[UUID],
+    results: Sequence[tuple[str | None, dict[str, Any]]],
+    context: LabelRequestContext,
+) -> list[str | None]:
+    """Record the outcome of each carton in a shipment, having it retried in the background if FedEx was down.
+
+    Returns the label (or error label) to print for each carton, if any.
+    """
+    outcome = results[0][1]
+    if outcome["status"] == "fedex_unavailable" and context.form_data.station:
+        codes = ", ".join(error["code"] for error in outcome["fedex_create_label_response"]["errors"])
+        return await schedule_retries(
+            writer,
+            shipment,
+            shipment_ids,
+            outcome=outcome,
+            reason=f"FedEx error {codes}",
+            context=context,
+        )
+
+    for shipment_id, (_, carton_outcome) in zip(shipment_ids, results, strict=True):
+        await writer.update(shipment_id, **carton_outcome)
+    return [label_str for label_str, _ in results]
+
+
+async def record_shipment_failure(
+    writer: ShipmentWriter,
+    shipment: Sequence[Carton],
+    shipment_ids: Sequence[UUID],
+    exc: Exception,
+    context: LabelRequestContext,
+) -> list[str | None]:
+    """Record a shipment whose labels couldn't be created, having it retried in the background if FedEx was down.
+
+    Only `FedExUnavailableError` means FedEx never acted on the request, so only then can the cartons be rescanned,
+    or retried. After any other failure, such as a timeout reading the response, FedEx may have bought the labels,
+    so the cartons are left `in_flight`, which blocks rescans until someone checks them.
+    Returns the error label to print for each carton.
+    """
+    if not isinstance(exc, FedExUnavailableError):
+        logger.error("FedEx may have created labels for cartons %s", carton_numbers(shipment), exc_info=exc)
+        return [
+            ERROR_LABEL_TEMPLATE.format(
+                carton_number=carton.carton_number,
+                error_message="FedEx may have created this carton's label. "
+                "Check its history before shipping. Do not rescan it.",
+            )
+            for carton in shipment
+        ]
 
+    if context.form_data.station:
+        return await schedule_retries(
+            writer,
+            shipment,
+            shipment_ids,
+            outcome={"status": "fedex_unavailable"},
+            reason=str(exc),
+            context=context,
+        )
+
+    # Don't leave the cartons looking interrupted, so they can be rescanned
+    for shipment_id in shipment_ids:
+        await writer.update(shipment_id, status="fedex_unavailable")
+    logger.warning("Could not create labels for cartons %s: %s", carton_numbers(shipment), exc)
+    return [
+        ERROR_LABEL_TEMPLATE.format(
+            carton_number=carton.carton_number,
+            error_message="FedEx is busy or unavailable. Please rescan this carton shortly.",
+        )
+        for carton in shipment
+    ]
+
+
+def carton_numbers(cartons: Sequence[Carton]) -> str:
+    """List cartons' numbers, for logging."""
+    return ", ".join(carton.carton_number for carton in cartons)
+
+
+def shipment_labels(cartons: Sequence[Carton], result: list[str | None] | BaseException) -> list[str | None]:
+    """Get the ZPL to print for each carton in a shipment, turning an unexpected failure into error labels.
+
+    Failures creating labels are recorded by `record_shipment_failure`, so an unexpected failure is something else,
+    and the cartons may be left in flight.
+    """
+    if isinstance(result, BaseException):
+        logger.error("Could not create labels for cartons %s", carton_numbers(cartons), exc_info=result)
+        return [
+            ERROR_LABEL_TEMPLATE.format(
+                carton_number=carton.carton_number,
+                error_message="Unexpected error while creating label. Check this carton's history before rescanning.",
+            )
+            for carton in cartons
+        ]
+    return result
+
+
+def recipient_key(carton: Carton) -> tuple[str, ...]:
+    """Identify where a carton is going, ignoring case and surrounding spaces."""
+    return tuple(
+        (value or "").strip().casefold()
+        for value in (
+            carton.company,
+            carton.address1,
+            carton.address2,
+            carton.city,
+            carton.state,
+            carton.postal_code,
+        )
+    )
+
+
+def group_shipments(
+    cartons: Sequence[Carton],
+    shippable_carton_numbers: Container[str],
+    max_pieces: int,
+) -> list[list[Carton]]:
+    """Group cartons into shipments, in the order of each shipment's first carton.
+
+    Shippable cartons going to the same recipient are shipped together, up to `max_pieces` to a shipment.
+    Every other carton is on its own. With a `max_pieces` of 1, every carton is on its own.
+    """
+    shipments: list[list[Carton]] = []
+    open_shipments: dict[tuple[str, ...], list[Carton]] = {}
+    for carton in cartons:
+        if max_pieces == 1 or carton.carton_number not in shippable_carton_numbers:
+            shipments.append([carton])
+            continue
+
+        key = recipient_key(carton)
+        shipment = open_shipments.get(key)
+        if shipment is None or len(shipment) >= max_pieces:
+            shipment = open_shipments[key] = []
+            shipments.append(shipment)
+        shipment.append(carton)
+    return shipments
+
+
+def build_shipment_requests(
+    shipments: Sequence[Sequence[Carton]],
+    shippable_carton_numbers: Container[str],
+    template: LabelRequestTemplate,
+) -> dict[str, bytes]:
+    """Build the label creation request of each shipment that can be shipped, filed under its first carton."""
+    return {
+        shipment[0].carton_number: template.render(shipment)
+        for shipment in shipments
+        if shipment[0].carton_number in shippable_carton_numbers
+    }
+
+
+async def labels_in_order(
+    shipments: Iterator[Sequence[Carton]],
+    create_labels: Callable[[Sequence[Carton]], Coroutine[Any, Any, list[str | None]]],
+    window: int,
+) -> AsyncGenerator[str]:
+    """Create labels concurrently, yielding them in the order of `shipments` as soon as each shipment is ready.
+
+    No more than `window` shipments are started ahead of the next shipment to yield,
+    so a slow shipment holds back a bounded number of finished labels.
+    Shipments are taken from `shipments` only as they are started, so the caller can tell which never were.
+    If the generator is closed early, labels that were already started are still awaited.
+    """
+    started: deque[tuple[Sequence[Carton], asyncio.Task[list[str | None]]]] = deque()
+    try:
+        while True:
+            while len(started) < window and (shipment := next(shipments, None)) is not None:
+                started.append((shipment, asyncio.create_task(create_labels(shipment))))
+            if not started:
+                return
+
+            shipment, task = started.popleft()
+            # Unlike awaiting the task, `wait` doesn't raise its exception, or cancel it if we are cancelled
+            await asyncio.wait([task])
+            for label_str in shipment_labels(shipment, task.exception() or task.result()):
+                if label_str is not None:
+                    yield label_str
+    finally:
+        if started:
+            await asyncio.wait([task for _, task in started])
+            for shipment, task in started:
+                if not task.cancelled() and (exception := task.exception()) is not None:
+                    logger.error("Could not create labels for cartons %s", carton_numbers(shipment), exc_info=exception)
+
+
+def scanned_carton_numbers(form_data: LabelRequestForm) -> list[str]:
+    """Get the scanned carton numbers, in scan order."""
     raw_text = form_data.carton_numbers
     carton_numbers = [line.strip() for line in raw_text.split("\n") if line.strip()]
     if len(carton_numbers) != len(set(carton_numbers)):
         msg = "Duplicate cartons scanned!"
         raise ValueError(msg)
+    return carton_numbers
 
-    cartons_header = kerp_client.shipping.get_cartons(carton_numbers)
-    cartons_map = {carton.carton_number: carton for carton in cartons_header.data}
 
-    # Maintain insertion order for users
-    cartons = []
-    not_found_carton_numbers = []
-    for carton_number in carton_numbers:
-        if carton_number in cartons_map:
-            cartons.append(cartons_map[carton_number])
-        else:
-            not_found_carton_numbers.append(carton_number)
+async def find_cartons(form_data: LabelRequestForm) -> AsyncGenerator[tuple[list[Carton], list[str], list[str]]]:
+    """Look up the scanned cartons in K-ERP, or the carton cache, in chunks.
 
-    with Session() as session:
-        for carton_number in not_found_carton_numbers:
-            session.add(
-                Shipment(
-                    carton_number=carton_number,
-                    tracking_number=None,
-                    status="not_found_in_kerp",
+    Yields the cartons that were found, the numbers of those that weren't, and the numbers of those
+    that couldn't be looked up, all in scan order, a chunk at a time, as soon as the chunk and those before it
+    have been looked up. Later chunks are looked up in the meantime.
+    A chunk whose lookup fails doesn't stop the others, since earlier chunks may already have bought labels.
+    If the form asks to group shipments, every carton is yielded at once, since any two may be grouped.
+    """
+    lookups = carton_cache.lookup(scanned_carton_numbers(form_data))
+    try:
+        cartons: list[Carton] = []
+        not_found_carton_numbers: list[str] = []
+        failed_carton_numbers: list[str] = []
+        for chunk_carton_numbers, lookup in lookups:
+            try:
+                cartons_map = await lookup
+            except Exception:
+                logger.exception("Could not look up cartons %s in K-ERP", ", ".join(chunk_carton_numbers))
+                failed_carton_numbers.extend(chunk_carton_numbers)
+            else:
+                for carton_number in chunk_carton_numbers:
+                    if carton_number in cartons_map:
+                        cartons.append(cartons_map[carton_number])
+                    else:
+                        not_found_carton_numbers.append(carton_number)
+
+            if not form_data.group_shipments:
+                yield cartons, not_found_carton_numbers, failed_carton_numbers
+                cartons, not_found_carton_numbers, failed_carton_numbers = [], [], []
+
+        if cartons or not_found_carton_numbers or failed_carton_numbers:
+            yield cartons, not_found_carton_numbers, failed_carton_numbers
+    finally:
+        for _, lookup in lookups:
+            lookup.cancel()
+        # Retrieve any failures, so they aren't reported as never retrieved
+        await asyncio.gather(*(lookup for _, lookup in lookups), return_exceptions=True)
+
+
+async def cancel_shipments(
+    writer: ShipmentWriter,
+    shipments: Iterable[Sequence[Carton]],
+    shipment_ids: dict[str, UUID],
+) -> None:
+    """Record the recorded cartons of shipments that were never started as cancelled, so they can be rescanned."""
+    for shipment in shipments:
+        for carton in shipment:
+            if carton.carton_number in shipment_ids:
+                await writer.update(shipment_ids[carton.carton_number], status="cancelled")
+
+
+async def stream_labels(
+    form_data: LabelRequestForm,
+    concurrency: int | None = None,
+    label_job_id: UUID | None = None,
+    *,
+    context: LabelRequestContext | None = None,
+) -> AsyncGenerator[str]:
+    """Create labels for cartons, yielding each carton's label in scan order as soon as it is ready.
+
+    Up to `concurrency` shipments (`App.label_concurrency` by default) are processed at once,
+    and up to twice that many are started ahead of the next label to yield.
+    Use a concurrency of 1 to process cartons one at a time.
+
+    If the form asks to group shipments, cartons going to the same recipient are shipped together
+    as multi-piece shipments of up to `App.shipment_max_pieces` cartons, with one FedEx request each.
+    Their labels are yielded together, where the shipment's first carton was scanned.
+
+    Cartons are looked up in K-ERP in chunks, and each chunk's labels are started as soon as it arrives,
+    rather than waiting for the whole wave to be looked up. Cartons are locked and recorded a chunk at a time.
+    Grouped waves wait for every chunk, since any two cartons in the wave may be grouped.
+    Cartons in a chunk K-ERP couldn't look up get an error label, and the rest of the wave carries on.
+
+    If the stream is closed early, labels already being created are finished and recorded,
+    and cartons that were never started are recorded as cancelled, or not at all if they were never looked up,
+    so they can be rescanned.
+
+    If FedEx is down, and the form names the scanning station, the cartons are retried in the background,
+    and their labels are printed at that station once they are created, rather than having to be rescanned.
+
+    Cartons whose address FedEx would reject, by the address cache, are recorded as `invalid_address`
+    and get an error label, without a label being bought.
+
+    Shipments created for a label job are tagged with `label_job_id`, and recorded as soon as each carton finishes.
+    Running the same job again resumes it: labels the job already created are reprinted rather than bought again.
+
+    Pass the wave's `context` if it has already been built, such as to check the request before streaming.
+    """
+    # Settings and form data are the same for the whole wave
+    context = context or await build_label_request_context(form_data)
+
+    concurrency = concurrency or App.label_concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create_bounded_labels(shipment: Sequence[Carton]) -> list[str | None]:
+        # Only shippable cartons are grouped, so any other carton is on its own
+        carton = shipment[0]
+        if carton.carton_number not in request_bodies:
+            return [
+                unshipped_carton_label(
+                    carton.carton_number,
+                    locked_carton_numbers,
+                    job_labels,
+                    existing_shipments,
+                    invalid_addresses,
                 ),
-            )
-        session.commit()
+            ]
 
-    for carton in cartons:
-        with Session() as session:
-            existing_shipment = session.scalars(
-                select(Shipment).where(Shipment.carton_number == carton.carton_number, Shipment.status == "shipped"),
-            ).first()
-            if existing_shipment is not None:
-                label_strs.append(
-                    ERROR_LABEL_TEMPLATE.format(
-                        carton_number=existing_shipment.carton_number,
-                        error_message=f"Label already created for this carton: {existing_shipment.tracking_number}",
-                    ),
+        shipment_row_ids = [shipment_ids[carton.carton_number] for carton in shipment]
+        tracking_updates = [kerp_tracking_update(carton, form_data) for carton in shipment]
+        try:
+            async with semaphore:
+                results = await create_shipment_labels(
+                    [carton.carton_number for carton in shipment],
+                    request_bodies[carton.carton_number],
+                    tracking_updates,
                 )
-                continue
-
-            request_body = build_label_request_body(carton, form_data)
-            label_response = fedex_client.create_label(request_body)
-            if label_response.status_code == HTTPStatus.OK:
-                status = "shipped"
-                headless_label_data = label_response.json()["output"]["transactionShipments"][0]["pieceResponses"][0]
-                tracking_number = headless_label_data["trackingNumber"]
-                label_zpl_str = b64decode(headless_label_data["packageDocuments"][0]["encodedLabel"]).decode("utf-8")
-                label_strs.append(label_zpl_str)
-
-                kerp_update = TrackingUpdateRequest(
-                    tracking_number=tracking_number,
-                    reference=form_data.air_auth if form_data.air_auth else carton.carton_number,
-                    department=carton.carton_number,
-                    ship_date=datetime.strptime(form_data.ship_date, "%Y-%m-%d").date(),  # noqa: DTZ007
-                    service=API_SERVICE_NAME_TO_WRITEBACK_SERVICE_NAME[form_data.service],
-                    payment_type=API_BILLING_NAME_TO_WRITEBACK_BILLING_NAME[form_data.billing],
+        except Exception as exc:  # noqa: BLE001
+            return await record_shipment_failure(writer, shipment, shipment_row_ids, exc, context)
+
+        try:
+            return await record_shipment_outcomes(writer, shipment, shipment_row_ids, results, context)
+        except Exception:
+            # The labels were bought, so they are printed anyway; the cartons stay in flight until someone checks them
+            logger.exception("Could not record the outcome of cartons %s", carton_numbers(shipment))
+            return [label_str for label_str, _ in results]
+
+    async with (
+        # A job checkpoints every carton, so a resumed job can reprint every label it bought
+        ShipmentWriter(flush_size=1 if label_job_id else None) as writer,
+        aclosing(find_cartons(form_data)) as carton_chunks,
+    ):
+        job_labels = await find_label_job_labels(label_job_id) if label_job_id else {}
+        async for cartons, not_found_carton_numbers, failed_carton_numbers in carton_chunks:
+            # Nothing was done for cartons that couldn't be looked up, so they can simply be rescanned
+            for carton_number in failed_carton_numbers:
+                yield ERROR_LABEL_TEMPLATE.format(
+                    carton_number=carton_number,
+                    error_message="K-ERP lookup failed. Rescan this carton.",
                 )
-                kerp_update_response = kerp_client.shipping.publish_tracking([kerp_update]).model_dump()
 
-            else:
-                status = "fedex_error"
-                tracking_number = None
-
-                if label_response.status_code == HTTPStatus.BAD_REQUEST:
-                    try:
-                        error_code = label_response.json()["errors"][0]["code"]
-                        error_message = label_response.json()["errors"][0]["message"]
-                        label_strs.append(
-                            ERROR_LABEL_TEMPLATE.format(
-                                carton_number=carton.carton_number,
-                                error_message=f"{error_code}: {error_message}",
-                            ),
-                        )
-                    # Don't bail on printing the valid labels if there's an error in the error label template
-                    except Exception:
-                        logger.exception("Could not format error label template")
-
-                kerp_update_response = None
-
-            session.add(
-                Shipment(
-                    carton_number=carton.carton_number,
-                    tracking_number=tracking_number,
-                    status=status,
-                    fedex_create_label_request=request_body.model_dump(),
-                    fedex_create_label_response=label_response.json(),
-                    kerp_tracking_upload_response=kerp_update_response,
-                ),
-            )
+            # Check for existing labels only once the cartons are locked, so no other station can ship them in between
+            async with carton_locks([carton.carton_number for carton in cartons]) as locked_carton_numbers:
+                existing_shipments = await find_existing_shipments(list(locked_carton_numbers))
+                shippable_carton_numbers = {
+                    number for number in locked_carton_numbers if number not in existing_shipments
+                }
+                # Cartons FedEx would reject for their address fail now, rather than when their labels are bought
+                invalid_addresses = await address_cache.check(
+                    [carton for carton in cartons if carton.carton_number in shippable_carton_numbers],
+                )
+                shippable_carton_numbers -= invalid_addresses.keys()
+                shipments = group_shipments(
+                    cartons,
+                    shippable_carton_numbers,
+                    App.shipment_max_pieces if form_data.group_shipments else 1,
+                )
+                request_bodies = build_shipment_requests(shipments, shippable_carton_numbers, context.template)
+                shipped_cartons = [
+                    (carton.carton_number, request_bodies[shipment[0].carton_number])
+                    for shipment in shipments
+                    if shipment[0].carton_number in request_bodies
+                    for carton in shipment
+                ]
+
+                # Every carton is recorded before any label is bought, in case the wave is interrupted
+                ship_date = date.fromisoformat(form_data.ship_date)
+                shipment_rows = (
+                    [
+                        {
+                            "carton_number": carton_number,
+                            "tracking_number": None,
+                            "status": "not_found_in_kerp",
+                            "service": form_data.service,
+                            "ship_date": ship_date,
+                            "label_job_id": label_job_id,
+                        }
+                        for carton_number in not_found_carton_numbers
+                    ]
+                    + [
+                        {
+                            "carton_number": carton_number,
+                            "tracking_number": None,
+                            "status": "invalid_address",
+                            "service": form_data.service,
+                            "ship_date": ship_date,
+                            "label_job_id": label_job_id,
+                        }
+                        for carton_number in invalid_addresses
+                    ]
+                    + [
+                        {
+                            "carton_number": carton_number,
+                            "tracking_number": None,
+                            "status": "in_flight",
+                            "service": form_data.service,
+                            "ship_date": ship_date,
+                            # Stored exactly as it's sent, with every carton in a multi-piece shipment
+                            "fedex_create_label_request": RawJSON(request_body),
+                            "label_job_id": label_job_id,
+                        }
+                        for carton_number, request_body in shipped_cartons
+                    ]
+                )
+                inserted_ids = await writer.insert(shipment_rows)
+                shipment_ids = dict(
+                    zip(
+                        [carton_number for carton_number, _ in shipped_cartons],
+                        inserted_ids[len(not_found_carton_numbers) + len(invalid_addresses) :],
+                        strict=True,
+                    ),
+                )
 
-            session.commit()
+                unstarted_shipments = iter(shipments)
+                try:
+                    async with aclosing(
+                        labels_in_order(unstarted_shipments, create_bounded_labels, window=2 * concurrency),
+                    ) as label_strs:
+                        async for label_str in label_strs:
+                            yield label_str
+                finally:
+                    await cancel_shipments(writer, unstarted_shipments, shipment_ids)
 
-    return "\n".join(label_strs)
 
+async def run_labels(
+    form_data: LabelRequestForm,
+    concurrency: int | None = None,
+    label_job_id: UUID | None = None,
+    *,
+    context: LabelRequestContext | None = None,
+) -> str:
+    """Create labels for cartons, returning them as one ZPL document in scan order.
 
-def build_excel_export(shipments: Sequence[Shipment]) -> BytesIO:
-    """Build an excel export."""
-    bytes_io = BytesIO()
-    workbook = xlsxwriter.Workbook(bytes_io)
+    See `stream_labels`.
+    """
+    return "\n".join(
+        [label_str async for label_str in stream_labels(form_data, concurrency, label_job_id, context=context)],
+    )
+
+
+# Waves running in their own task, kept so they aren't garbage collected before they finish
+detached_waves: set[asyncio.Task[None]] = set()
+
+
+def detached_wave_done(task: asyncio.Task[None]) -> None:
+    """Forget a finished detached wave, logging any failure no one was left to read."""
+    detached_waves.discard(task)
+    if not task.cancelled() and (exception := task.exception()) is not None:
+        logger.error("A detached label wave failed", exc_info=exception)
+
+
+async def detach_labels(labels: AsyncGenerator[str], buffer_size: int = 16) -> AsyncGenerator[str]:
+    """Run a wave's labels in their own task, yielding each label the wave yields.
+
+    A streamed response is cancelled through an anyio cancel scope when its client disconnects,
+    and that scope cancels every await in the wave's cleanup too, cutting it short.
+    In its own task, the wave is cancelled once, as asyncio cancels, so its cleanup runs to completion:
+    labels already being created are recorded, cartons never started are recorded as cancelled,
+    and the cartons' locks are released. Closing this generator only cancels the wave, without waiting for it.
+
+    Up to `buffer_size` labels are held for a slow client, and then the wave waits for it.
+    Once the client is gone, labels are dropped rather than held, since they are already stored.
+    """
+    queue: asyncio.Queue[str | Exception | None] = asyncio.Queue(maxsize=buffer_size)
+    closed = False
+
+    async def run_wave() -> None:
+        try:
+            async with aclosing(labels):
+                async for label_str in labels:
+                    if not closed:
+                        await queue.put(label_str)
+        except Exception as exc:
+            if closed:
+                raise
+            await queue.put(exc)
+        else:
+            if not closed:
+                await queue.put(None)
+
+    task = asyncio.create_task(run_wave())
+    detached_waves.add(task)
+    task.add_done_callback(detached_wave_done)
+    try:
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        closed = True
+        task.cancel()
+
+
+async def build_excel_export(start: date, end: date) -> SpooledTemporaryFile[bytes]:
+    """Build an excel export of shipments created on the local dates `start` through `end`.
+
+    Rows are written as they are fetched, with xlsxwriter in constant memory mode,
+    into a file that is only spooled to disk once it is large. The file is returned rewound, ready to stream.
+    """
+    export_file = SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE)  # noqa: SIM115
+    workbook = xlsxwriter.Workbook(export_file, {"constant_memory": True})
     worksheet = workbook.add_worksheet(name="Shipments")
+    date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+    datetime_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+
+    worksheet.write_row(0, 0, REPORT_COLUMN_HEADERS)
+
+    row_count = 0
+    async for rows in export_rows(start, end):
+        for *values, ship_date, created in rows:
+            row_count += 1
+            worksheet.write_row(row_count, 0, [value or "" for value in values])
+            if ship_date is None:
+                worksheet.write_blank(row_count, len(values), None)
+            else:
+                worksheet.write_datetime(row_count, len(values), ship_date, date_format)
+            worksheet.write_datetime(row_count, len(values) + 1, created, datetime_format)
+
+    # Tables aren't supported in constant memory mode, so filter the header row instead
+    worksheet.autofilter(0, 0, row_count, len(REPORT_COLUMN_HEADERS) - 1)
+    worksheet.freeze_panes(1, 0)
+
+    # Closing zips up the whole workbook, so keep it off the event loop
+    await asyncio.to_thread(workbook.close)
+    export_file.seek(0)
+    return export_file
+
 
-    for column_index, header in enumerate(REPORT_COLUMN_HEADERS):
-        worksheet.write(0, column_index, header)
+async def stream_file(file: IO[bytes]) -> AsyncIterator[bytes]:
+    """Stream a file in chunks, closing it once it has been sent."""
+    with file:
+        while chunk := file.read(EXPORT_CHUNK_SIZE):
+            yield chunk
 
-    for row_index, shipment in enumerate(shipments, start=1):
-        worksheet.write(row_index, 0, shipment.carton_number)
-        worksheet.write(row_index, 1, shipment.tracking_number or "")
 
-    # Create a table in the sheet
-    column_settings = [{"header": header} for header in REPORT_COLUMN_HEADERS]
-    worksheet.add_table(0, 0, len(shipments), len(REPORT_COLUMN_HEADERS) - 1, {"columns": column_settings})
+async def stream_csv_export(start: date, end: date) -> AsyncIterator[str]:
+    """Stream a CSV export of shipments created on the local dates `start` through `end`, a batch at a time."""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(REPORT_COLUMN_HEADERS)
+    yield buffer.getvalue()
 
-    workbook.close()
-    bytes_io.seek(0, 0)
-    return bytes_io
+    async for rows in export_rows(start, end):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
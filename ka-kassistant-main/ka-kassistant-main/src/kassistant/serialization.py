@@ -0,0 +1,18 @@
+"""Serialize JSON straight to bytes."""
+
+import msgspec
+
+__all__ = [
+    "encode_json",
+]
+
+
+def encode_json(value: object, *, indent: int = 0) -> bytes:
+    """Serialize a value to JSON, pretty printed with `indent` spaces if given.
+
+    Besides JSON's own types, UUIDs, dates, and datetimes are serialized as ISO strings.
+    """
+    data = msgspec.json.encode(value)
+    if indent:
+        return msgspec.json.format(data, indent=indent)
+    return data
@@ -1,17 +1,34 @@
 """API server definition."""
 
+import asyncio
+from collections.abc import AsyncIterator, Callable, Coroutine
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, suppress
 from pathlib import Path
+from typing import Any
 
 import sentry_sdk
 from litestar import Litestar, get
 from litestar.contrib.jinja import JinjaTemplateEngine
+from litestar.di import Provide
 from litestar.openapi.config import OpenAPIConfig
 from litestar.openapi.plugins import ScalarRenderPlugin
 from litestar.response import Template
 from litestar.static_files import create_static_files_router
 from litestar.template.config import TemplateConfig
 
+from kassistant.address_cache import address_cache
+from kassistant.carton_cache import carton_cache
 from kassistant.constants import Sentry
+from kassistant.fedex import fedex_client
+from kassistant.kerp import async_kerp_client
+from kassistant.label_jobs import label_job_runner
+from kassistant.label_retries import label_retrier
+from kassistant.notifications import notification_listener
+from kassistant.orm import engine
+from kassistant.shipment_archive import shipment_archiver
+from kassistant.tracking_outbox import tracking_outbox
+from kassistant.web.dependencies import provide_db_session
+from kassistant.web.kerp import KERPController
 from kassistant.web.settings import SettingsController
 from kassistant.web.shipping import router as shipping_router
 
@@ -42,6 +59,51 @@ async def homepage() -> Template:
     )
 
 
+@asynccontextmanager
+async def fedex_http_client(_: Litestar) -> AsyncIterator[None]:
+    """Close the pooled FedEx HTTP client when the worker shuts down."""
+    try:
+        yield
+    finally:
+        await fedex_client.aclose()
+
+
+@asynccontextmanager
+async def kerp_thread_pool(_: Litestar) -> AsyncIterator[None]:
+    """Stop the K-ERP client's thread pool when the worker shuts down."""
+    try:
+        yield
+    finally:
+        async_kerp_client.close()
+
+
+@asynccontextmanager
+async def database_engine(_: Litestar) -> AsyncIterator[None]:
+    """Close the database connection pool when the worker shuts down."""
+    try:
+        yield
+    finally:
+        await engine.dispose()
+
+
+def background_task(
+    run: Callable[[], Coroutine[Any, Any, None]],
+) -> Callable[[Litestar], AbstractAsyncContextManager[None]]:
+    """Run a task in the background for as long as the worker runs."""
+
+    @asynccontextmanager
+    async def lifespan(_: Litestar) -> AsyncIterator[None]:
+        task = asyncio.create_task(run())
+        try:
+            yield
+        finally:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
+    return lifespan
+
+
 app = Litestar(
     route_handlers=[
         # Home
@@ -50,9 +112,31 @@ app = Litestar(
         shipping_router,
         # Settings
         SettingsController,
+        # K-ERP
+        KERPController,
         # Static files
         create_static_files_router(path="/static", directories=["static"]),
     ],
+    dependencies={"db_session": Provide(provide_db_session)},
+    lifespan=[
+        database_engine,
+        fedex_http_client,
+        kerp_thread_pool,
+        # Listen for notifications from other workers
+        background_task(notification_listener.run),
+        # Write tracking numbers back to K-ERP
+        background_task(tracking_outbox.run),
+        # Create labels for queued jobs
+        background_task(label_job_runner.run),
+        # Retry labels that failed while FedEx was down
+        background_task(label_retrier.run),
+        # Create shipment partitions ahead of time, and archive old payloads
+        background_task(shipment_archiver.run),
+        # Drop expired cartons from the K-ERP carton cache
+        background_task(carton_cache.run),
+        # Drop expired verdicts from the address validation cache
+        background_task(address_cache.run),
+    ],
     debug=True,
     template_config=TemplateConfig(
         directory=Path("templates"),
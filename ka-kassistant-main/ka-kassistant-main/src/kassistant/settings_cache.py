@@ -0,0 +1,52 @@
+"""In-process cache of the settings row."""
+
+from typing import Final, Self
+
+from sqlalchemy import select
+
+from .notifications import notification_listener
+from .orm import Session, Settings
+
+__all__ = [
+    "SETTINGS_CHANNEL",
+    "SettingsCache",
+    "settings_cache",
+]
+
+SETTINGS_CHANNEL: Final[str] = "kassistant_settings"
+
+
+class SettingsCache:
+    """Cache the settings row until any worker saves new settings.
+
+    The cached row is detached from its session, and must not be modified.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the SettingsCache class."""
+        self._settings: Settings | None = None
+        self._generation = 0
+
+    async def get(self: Self) -> Settings | None:
+        """Get the settings, or `None` if they haven't been set up yet."""
+        if self._settings is not None:
+            return self._settings
+
+        generation = self._generation
+        async with Session() as session:
+            settings = (await session.scalars(select(Settings))).first()
+
+        # Settings that are missing aren't cached, so they're picked up as soon as they're set up.
+        # Neither are settings that were replaced while they were loading.
+        if generation == self._generation:
+            self._settings = settings
+        return settings
+
+    def invalidate(self: Self, _: str | None = None) -> None:
+        """Forget the cached settings."""
+        self._settings = None
+        self._generation += 1
+
+
+settings_cache = SettingsCache()
+notification_listener.subscribe(SETTINGS_CHANNEL, settings_cache.invalidate)
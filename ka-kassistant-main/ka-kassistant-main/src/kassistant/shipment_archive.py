@@ -0,0 +1,207 @@
+"""Monthly partitions of the shipments table, and archival of old shipments' payloads."""
+
+import asyncio
+import zlib
+from collections.abc import Sequence
+from datetime import UTC, date, datetime, timedelta
+from logging import getLogger
+from typing import Any, Final, Self
+from uuid import UUID
+
+import msgspec
+from sqlalchemy import exists, func, insert, null, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
+
+from .constants import App
+from .orm import Session, Shipment, ShipmentPayloadArchive, TrackingUpdate
+from .serialization import encode_json
+
+__all__ = [
+    "PAYLOAD_COLUMNS",
+    "ShipmentArchiver",
+    "ensure_shipment_partitions",
+    "load_payloads",
+    "load_payloads_batch",
+    "month_partitions",
+    "shipment_archiver",
+]
+
+logger = getLogger(__name__)
+
+# The large JSONB columns that are moved to the archive
+PAYLOAD_COLUMNS: Final[tuple[str, ...]] = (
+    "fedex_create_label_request",
+    "fedex_create_label_response",
+    "kerp_tracking_upload_response",
+)
+
+
+def month_partitions(start: date, months: int) -> list[tuple[str, datetime, datetime]]:
+    """Name and bound the monthly partitions of the shipments table, for `months` months from `start`'s month.
+
+    Months run from midnight UTC on the first of the month.
+    """
+    partitions = []
+    year, month = start.year, start.month
+    for _ in range(months):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)  # noqa: PLR2004
+        partitions.append(
+            (
+                f"shipments_{year:04}_{month:02}",
+                datetime(year, month, 1, tzinfo=UTC),
+                datetime(next_year, next_month, 1, tzinfo=UTC),
+            ),
+        )
+        year, month = next_year, next_month
+    return partitions
+
+
+async def ensure_shipment_partitions(months_ahead: int) -> None:
+    """Create any missing partitions of the shipments table, from this month through `months_ahead` months ahead."""
+    async with Session() as session:
+        # Every worker does this, so take turns
+        await session.execute(select(func.pg_advisory_xact_lock(func.hashtext("kassistant.shipment_partitions"))))
+        for name, start, end in month_partitions(datetime.now(tz=UTC).date(), months_ahead + 1):
+            # The name and bounds are generated from dates, not user input
+            await session.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF shipments "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')",
+                ),
+            )
+        await session.commit()
+
+
+def compress_payloads(payloads: dict[str, Any]) -> bytes:
+    """Compress a shipment's payloads for the archive."""
+    return zlib.compress(encode_json(payloads))
+
+
+def decompress_payloads(data: bytes) -> dict[str, Any]:
+    """Decompress a shipment's payloads from the archive."""
+    payloads: dict[str, Any] = msgspec.json.decode(zlib.decompress(data))
+    return payloads
+
+
+async def load_payloads(session: AsyncSession, shipment: Shipment) -> dict[str, Any]:
+    """Get a shipment's payloads, by column name, from the archive if they've been moved there."""
+    if shipment.archived_at is None:
+        return {column: getattr(shipment, column) for column in PAYLOAD_COLUMNS}
+
+    data = await session.scalar(
+        select(ShipmentPayloadArchive.payloads).where(ShipmentPayloadArchive.shipment_id == shipment.id),
+    )
+    if data is None:
+        return dict.fromkeys(PAYLOAD_COLUMNS)
+    return decompress_payloads(data)
+
+
+async def load_payloads_batch(session: AsyncSession, shipments: Sequence[Shipment]) -> dict[UUID, dict[str, Any]]:
+    """Get many shipments' payloads, by shipment ID, with one query for all of those that have been archived."""
+    archived_ids = [shipment.id for shipment in shipments if shipment.archived_at is not None]
+    archived = {}
+    if archived_ids:
+        rows = await session.execute(
+            select(ShipmentPayloadArchive.shipment_id, ShipmentPayloadArchive.payloads).where(
+                ShipmentPayloadArchive.shipment_id.in_(archived_ids),
+            ),
+        )
+        archived = {shipment_id: decompress_payloads(data) for shipment_id, data in rows.tuples()}
+
+    return {
+        shipment.id: (
+            archived.get(shipment.id, dict.fromkeys(PAYLOAD_COLUMNS))
+            if shipment.archived_at is not None
+            else {column: getattr(shipment, column) for column in PAYLOAD_COLUMNS}
+        )
+        for shipment in shipments
+    }
+
+
+class ShipmentArchiver:
+    """Keep the shipments table's partitions created ahead of time, and archive old shipments' payloads.
+
+    Payloads older than `retention` are compressed into the `shipment_payload_archive` table, and cleared
+    from the shipment, leaving the summary columns where they are. Old partitions then shrink to just those
+    columns, and stop changing, which keeps vacuum and backups quick.
+    Batches are claimed with `FOR UPDATE SKIP LOCKED`, so every worker can run the archiver.
+    Only shipped cartons whose tracking numbers have been written back to K-ERP, or given up on, are archived,
+    since anything still to be written to a shipment's payloads would be hidden behind the archived copy.
+    """
+
+    def __init__(
+        self,
+        retention: timedelta = timedelta(days=90),
+        batch_size: int = 500,
+        interval: float = 3600.0,
+        partition_months_ahead: int = 3,
+    ) -> None:
+        """Initialize the ShipmentArchiver class."""
+        self.retention = retention
+        self.batch_size = batch_size
+        self.interval = interval
+        self.partition_months_ahead = partition_months_ahead
+
+    async def archive_batch(self: Self) -> int:
+        """Archive one batch of old payloads, returning how many shipments were archived."""
+        cutoff = datetime.now(tz=UTC) - self.retention
+        async with Session() as session:
+            shipments = (
+                await session.scalars(
+                    select(Shipment)
+                    .options(load_only(Shipment.id, Shipment.created, *(getattr(Shipment, c) for c in PAYLOAD_COLUMNS)))
+                    .where(
+                        Shipment.created < cutoff,
+                        Shipment.archived_at.is_(None),
+                        Shipment.status == "shipped",
+                        ~exists().where(
+                            TrackingUpdate.shipment_id == Shipment.id,
+                            TrackingUpdate.sent_at.is_(None),
+                            TrackingUpdate.abandoned_at.is_(None),
+                        ),
+                    )
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True),
+                )
+            ).all()
+            if not shipments:
+                return 0
+
+            await session.execute(
+                insert(ShipmentPayloadArchive),
+                [
+                    {
+                        "shipment_id": shipment.id,
+                        "payloads": compress_payloads({c: getattr(shipment, c) for c in PAYLOAD_COLUMNS}),
+                    }
+                    for shipment in shipments
+                ],
+            )
+            await session.execute(
+                update(Shipment)
+                .where(Shipment.id.in_([shipment.id for shipment in shipments]), Shipment.created < cutoff)
+                .values(archived_at=func.now(), **dict.fromkeys(PAYLOAD_COLUMNS, null()))
+                .execution_options(synchronize_session=False),
+            )
+            await session.commit()
+            return len(shipments)
+
+    async def run(self: Self) -> None:
+        """Maintain partitions and archive payloads until cancelled."""
+        while True:
+            try:
+                await ensure_shipment_partitions(self.partition_months_ahead)
+                while await self.archive_batch() == self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("Could not maintain the shipments table")
+            await asyncio.sleep(self.interval)
+
+
+shipment_archiver = ShipmentArchiver(
+    retention=timedelta(days=App.shipment_payload_retention_days),
+    batch_size=App.shipment_archive_batch_size,
+    interval=App.shipment_archive_interval,
+    partition_months_ahead=App.shipment_partition_months_ahead,
+)
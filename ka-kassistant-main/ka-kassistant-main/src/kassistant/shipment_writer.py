@@ -0,0 +1,173 @@
+"""Bulk persistence of shipments."""
+
+from collections.abc import Sequence
+from logging import getLogger
+from types import TracebackType
+from typing import TYPE_CHECKING, Any, Final, Self
+from uuid import UUID
+
+from sqlalchemy import insert, update
+
+from .carton_cache import carton_cache
+from .constants import App
+from .labels import compress_label, label_cache
+from .orm import LabelRetry, Session, Shipment, ShipmentLabel, TrackingUpdate
+from .tracking_outbox import tracking_outbox
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+__all__ = ["UNCACHED_STATUSES", "ShipmentWriter"]
+
+# Cartons with these outcomes are dropped from the K-ERP carton cache: shipped cartons change in K-ERP,
+# and cartons FedEx rejected are fixed in K-ERP before they're rescanned, so the rescan must see the fix
+UNCACHED_STATUSES: Final[frozenset[str]] = frozenset({"shipped", "invalid_address", "fedex_error"})
+
+logger = getLogger(__name__)
+
+
+class ShipmentWriter:
+    """Write a wave's shipments in bulk.
+
+    Rows are inserted up front with `insert`, before any label is bought,
+    so every carton is in the history even if the worker dies mid-wave.
+    Outcomes with anything FedEx sent back, such as a bought label and its tracking number, are written at once,
+    so a worker dying can't lose them. If that fails, they stay buffered to be written by the next flush.
+    Other outcomes, such as cancelled cartons, are buffered with `update`, and written every `flush_size` updates
+    and when the writer is closed.
+    Labels are compressed into the `shipment_labels` table, tracking updates for K-ERP are queued in the outbox,
+    and retries of failed labels are scheduled, in the same transaction as their shipment's outcome.
+    Cartons with an outcome in `UNCACHED_STATUSES` are dropped from the K-ERP carton cache in that transaction too.
+    """
+
+    def __init__(self, flush_size: int | None = None) -> None:
+        """Initialize the ShipmentWriter class."""
+        self.flush_size = flush_size or App.shipment_flush_size
+        self.pending_updates: list[dict[str, Any]] = []
+        self.pending_tracking_updates: list[dict[str, Any]] = []
+        self.pending_labels: list[tuple[UUID, str]] = []
+        self.pending_retries: list[dict[str, Any]] = []
+        # The table is partitioned on `created`, so updates need it to find their row
+        self.created: dict[UUID, datetime] = {}
+        self.carton_numbers: dict[UUID, str] = {}
+
+    async def __aenter__(self: Self) -> Self:
+        """Start writing shipments."""
+        return self
+
+    async def __aexit__(
+        self: Self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Write any buffered updates, even if the wave failed."""
+        await self.flush()
+
+    async def insert(self: Self, rows: Sequence[dict[str, Any]]) -> list[UUID]:
+        """Insert shipments with one multi-row INSERT, returning their IDs in the same order."""
+        if not rows:
+            return []
+
+        async with Session() as session:
+            inserted = (
+                (
+                    await session.execute(
+                        insert(Shipment).returning(Shipment.id, Shipment.created, sort_by_parameter_order=True),
+                        rows,
+                    )
+                )
+                .tuples()
+                .all()
+            )
+            await carton_cache.invalidate(
+                session,
+                {row["carton_number"] for row in rows if row.get("status") in UNCACHED_STATUSES},
+            )
+            await session.commit()
+        self.created.update(inserted)
+        self.carton_numbers.update(
+            (shipment_id, row["carton_number"]) for (shipment_id, _), row in zip(inserted, rows, strict=True)
+        )
+        return [shipment_id for shipment_id, _ in inserted]
+
+    async def update(
+        self: Self,
+        shipment_id: UUID,
+        tracking_update: dict[str, Any] | None = None,
+        label: str | None = None,
+        retry: dict[str, Any] | None = None,
+        **values: Any,  # noqa: ANN401
+    ) -> None:
+        """Buffer an update to a shipment, with its K-ERP tracking update, label and retry, writing once full.
+
+        An update with a label or FedEx response is written at once, along with everything buffered before it.
+        The shipment must have been inserted by this writer.
+        """
+        self.pending_updates.append({"id": shipment_id, "created": self.created[shipment_id], **values})
+        if tracking_update is not None:
+            self.pending_tracking_updates.append({"shipment_id": shipment_id, "payload": tracking_update})
+        if label is not None:
+            self.pending_labels.append((shipment_id, label))
+        if retry is not None:
+            self.pending_retries.append({"shipment_id": shipment_id, **retry})
+
+        if label is not None or "fedex_create_label_response" in values:
+            try:
+                await self.flush()
+            except Exception:
+                # FedEx has answered, so the caller carries on; the outcome is kept for the next flush
+                logger.exception(
+                    "Could not write the outcome of shipment %s, retrying with the next flush",
+                    shipment_id,
+                )
+        elif len(self.pending_updates) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self: Self) -> None:
+        """Write buffered updates in a single transaction."""
+        if not self.pending_updates:
+            return
+
+        # Take the buffers before writing, so updates made while this flush is in progress go into the next one
+        pending_updates, self.pending_updates = self.pending_updates, []
+        pending_tracking_updates, self.pending_tracking_updates = self.pending_tracking_updates, []
+        pending_labels, self.pending_labels = self.pending_labels, []
+        pending_retries, self.pending_retries = self.pending_retries, []
+        try:
+            async with Session() as session:
+                await session.execute(update(Shipment), pending_updates)
+                if pending_tracking_updates:
+                    await session.execute(insert(TrackingUpdate), pending_tracking_updates)
+                if pending_labels:
+                    await session.execute(
+                        insert(ShipmentLabel),
+                        [
+                            {"shipment_id": shipment_id, "label": compress_label(label)}
+                            for shipment_id, label in pending_labels
+                        ],
+                    )
+                if pending_retries:
+                    await session.execute(insert(LabelRetry), pending_retries)
+                await carton_cache.invalidate(
+                    session,
+                    {
+                        self.carton_numbers[values["id"]]
+                        for values in pending_updates
+                        if values.get("status") in UNCACHED_STATUSES
+                    },
+                )
+                await session.commit()
+        except BaseException:
+            # Put them back to be retried by the next flush
+            self.pending_updates[:0] = pending_updates
+            self.pending_tracking_updates[:0] = pending_tracking_updates
+            self.pending_labels[:0] = pending_labels
+            self.pending_retries[:0] = pending_retries
+            raise
+
+        if pending_tracking_updates:
+            tracking_outbox.wake()
+        # Labels are most likely to be reprinted soon after they're created
+        for shipment_id, label in pending_labels:
+            label_cache.put(shipment_id, label)
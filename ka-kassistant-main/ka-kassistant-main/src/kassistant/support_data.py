@@ -0,0 +1,105 @@
+"""Support data for FedEx tickets: each shipment's summary with its FedEx and K-ERP payloads."""
+
+import io
+import zipfile
+from collections.abc import AsyncIterator, Sequence
+from typing import Any, Self
+from uuid import UUID
+
+from sqlalchemy import select
+
+from .orm import Session, Shipment
+from .serialization import encode_json
+from .shipment_archive import load_payloads_batch
+
+__all__ = [
+    "SUPPORT_DATA_BATCH_SIZE",
+    "iter_support_data",
+    "shipment_support_data",
+    "stream_support_data_ndjson",
+    "stream_support_data_zip",
+    "support_data_filename",
+]
+
+SUPPORT_DATA_BATCH_SIZE = 100
+
+
+def shipment_support_data(shipment: Shipment, payloads: dict[str, Any]) -> dict[str, Any]:
+    """Gather a shipment's support data."""
+    return {
+        "id": shipment.id,
+        "carton_number": shipment.carton_number,
+        "tracking_number": shipment.tracking_number,
+        "status": shipment.status,
+        **payloads,
+    }
+
+
+def support_data_filename(shipment_id: UUID) -> str:
+    """Name a shipment's support data file."""
+    return f"kassistant-shipment-{shipment_id}.json"
+
+
+async def iter_support_data(
+    shipment_ids: Sequence[UUID],
+    batch_size: int = SUPPORT_DATA_BATCH_SIZE,
+) -> AsyncIterator[dict[str, Any]]:
+    """Load the support data of many shipments, in the order of `shipment_ids`, `batch_size` shipments at a time.
+
+    Shipments that don't exist are included as their ID and an error, so they aren't silently left out.
+    """
+    async with Session() as session:
+        for offset in range(0, len(shipment_ids), batch_size):
+            batch = shipment_ids[offset : offset + batch_size]
+            shipments = (await session.scalars(select(Shipment).where(Shipment.id.in_(batch)))).all()
+            payloads = await load_payloads_batch(session, shipments)
+            shipments_by_id = {shipment.id: shipment for shipment in shipments}
+
+            for shipment_id in batch:
+                if (shipment := shipments_by_id.get(shipment_id)) is None:
+                    yield {"id": shipment_id, "error": "shipment not found"}
+                else:
+                    yield shipment_support_data(shipment, payloads[shipment_id])
+
+            # Only one batch is held in memory at a time
+            session.expunge_all()
+
+
+async def stream_support_data_ndjson(shipment_ids: Sequence[UUID]) -> AsyncIterator[bytes]:
+    """Stream the support data of many shipments as newline-delimited JSON, one shipment per line."""
+    async for data in iter_support_data(shipment_ids):
+        yield encode_json(data) + b"\n"
+
+
+class _ZipStream(io.RawIOBase):
+    """A write-only, unseekable file that hands over what has been written to it, so a zip file can be streamed."""
+
+    def __init__(self) -> None:
+        """Initialize the _ZipStream class."""
+        self._chunks: list[bytes] = []
+
+    def writable(self: Self) -> bool:
+        """Accept writes."""
+        return True
+
+    def write(self: Self, data: Any) -> int:  # noqa: ANN401
+        """Keep written data until it is taken."""
+        self._chunks.append(bytes(data))
+        return len(self._chunks[-1])
+
+    def take(self: Self) -> bytes:
+        """Take everything written since the last time."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_support_data_zip(shipment_ids: Sequence[UUID]) -> AsyncIterator[bytes]:
+    """Stream the support data of many shipments as a zip file, with a pretty printed JSON file per shipment."""
+    output = _ZipStream()
+    # Zip files written to an unseekable file put each file's size after its data, so nothing is rewritten
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for data in iter_support_data(shipment_ids):
+            archive.writestr(support_data_filename(data["id"]), encode_json(data, indent=4))
+            yield output.take()
+    yield output.take()
@@ -0,0 +1,219 @@
+"""Drain the K-ERP tracking outbox in the background."""
+
+import asyncio
+import time
+import uuid
+from collections.abc import Mapping, Sequence
+from contextlib import suppress
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from typing import Any, Self
+
+from kerp_sdk.api_models import TrackingUpdateRequest
+from pydantic import ValidationError
+from sqlalchemy import func, or_, select, update
+
+from .constants import KERP
+from .kerp import async_kerp_client
+from .orm import Session, Shipment, TrackingUpdate
+
+__all__ = [
+    "TrackingOutboxDrainer",
+    "item_responses",
+    "tracking_outbox",
+]
+
+logger = getLogger(__name__)
+
+
+def item_responses(response: dict[str, Any], count: int) -> list[dict[str, Any]]:
+    """Split K-ERP's response to a batch of `count` updates into each update's own response.
+
+    K-ERP answers with one result per update, in order, under `data`.
+    A response without them is kept whole for every update in the batch.
+    """
+    data = response.get("data")
+    if isinstance(data, list) and len(data) == count:
+        return [{**response, "data": item} for item in data]
+    return [response] * count
+
+
+class TrackingOutboxDrainer:
+    """Send queued tracking updates to K-ERP in batches, retrying failed updates with backoff.
+
+    Batches are claimed with `FOR UPDATE SKIP LOCKED`, and the claim is committed as a `lease`
+    before anything is sent, so every worker can drain the same outbox without holding locks
+    while K-ERP answers. If a worker stops before recording what was sent, its updates are sent
+    again once the lease lapses.
+    A batch K-ERP rejects is split in half, and the halves sent again, until the updates it rejects are found.
+    Updates that have failed `max_attempts` times are given up on, and listed on the failures page.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        poll_interval: float = 30.0,
+        max_attempts: int = 10,
+        lease: float = 600.0,
+    ) -> None:
+        """Initialize the TrackingOutboxDrainer class."""
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.lease = timedelta(seconds=lease)
+        self._wakeup = asyncio.Event()
+
+    def wake(self: Self) -> None:
+        """Drain now instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    def retry_delay(self: Self, attempts: int) -> timedelta:
+        """How long to wait before retrying an update that has failed `attempts` times."""
+        return min(timedelta(seconds=15 * 2 ** (attempts - 1)), timedelta(hours=1))
+
+    async def claim(self: Self) -> dict[uuid.UUID, dict[str, Any]]:
+        """Claim a batch of due updates, returning their payloads by ID."""
+        async with Session() as session:
+            claimed = (
+                await session.execute(
+                    select(TrackingUpdate.id, TrackingUpdate.payload)
+                    .where(
+                        TrackingUpdate.sent_at.is_(None),
+                        TrackingUpdate.abandoned_at.is_(None),
+                        TrackingUpdate.next_attempt_at <= func.now(),
+                        or_(TrackingUpdate.claimed_until.is_(None), TrackingUpdate.claimed_until <= func.now()),
+                    )
+                    .order_by(TrackingUpdate.next_attempt_at)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True),
+                )
+            ).tuples()
+            claimed_updates = {tracking_update_id: dict(payload) for tracking_update_id, payload in claimed}
+            if claimed_updates:
+                await session.execute(
+                    update(TrackingUpdate)
+                    .where(TrackingUpdate.id.in_(list(claimed_updates)))
+                    .values(claimed_until=func.now() + self.lease),
+                )
+                await session.commit()
+        return claimed_updates
+
+    async def send(
+        self: Self,
+        requests: Sequence[tuple[uuid.UUID, TrackingUpdateRequest]],
+        deadline: float,
+    ) -> dict[uuid.UUID, dict[str, Any] | Exception]:
+        """Send updates to K-ERP, returning each one's response, or why it failed, by ID.
+
+        Updates that can't be sent before `deadline`, on the monotonic clock, are left out, to be claimed again.
+        """
+        if time.monotonic() + async_kerp_client.publish_tracking_timeout > deadline:
+            return {}
+
+        try:
+            response = await async_kerp_client.publish_tracking([request for _, request in requests])
+        # Whatever K-ERP fails with is recorded against the updates, and retried
+        except Exception as exc:  # noqa: BLE001
+            # A timeout says nothing about which updates are at fault, so the batch isn't split for one
+            if len(requests) == 1 or isinstance(exc, TimeoutError):
+                logger.warning("Could not send %s tracking updates to K-ERP", len(requests), exc_info=True)
+                return dict.fromkeys((tracking_update_id for tracking_update_id, _ in requests), exc)
+            logger.warning("K-ERP rejected %s tracking updates, splitting them", len(requests), exc_info=True)
+            middle = len(requests) // 2
+            return await self.send(requests[:middle], deadline) | await self.send(requests[middle:], deadline)
+
+        return {
+            tracking_update_id: item_response
+            for (tracking_update_id, _), item_response in zip(
+                requests,
+                item_responses(response, len(requests)),
+                strict=True,
+            )
+        }
+
+    async def record(
+        self: Self,
+        tracking_update_ids: Sequence[uuid.UUID],
+        results: Mapping[uuid.UUID, dict[str, Any] | Exception],
+    ) -> int:
+        """Record what became of claimed updates, by ID, and release them, returning how many were sent.
+
+        Updates without a result weren't sent, and are released to be claimed again.
+        """
+        now = datetime.now(tz=UTC)
+        sent = 0
+        async with Session() as session:
+            tracking_updates = await session.scalars(
+                select(TrackingUpdate).where(TrackingUpdate.id.in_(tracking_update_ids)),
+            )
+            for tracking_update in tracking_updates:
+                tracking_update.claimed_until = None
+                result = results.get(tracking_update.id)
+                if result is None:
+                    continue
+
+                if isinstance(result, Exception):
+                    tracking_update.attempts += 1
+                    tracking_update.last_error = repr(result)
+                    tracking_update.next_attempt_at = now + self.retry_delay(tracking_update.attempts)
+                    if tracking_update.attempts >= self.max_attempts:
+                        tracking_update.abandoned_at = now
+                        logger.error(
+                            "Gave up writing shipment %s's tracking number back to K-ERP after %s attempts: %r",
+                            tracking_update.shipment_id,
+                            tracking_update.attempts,
+                            result,
+                        )
+                    continue
+
+                tracking_update.sent_at = now
+                tracking_update.response = result
+                await session.execute(
+                    update(Shipment)
+                    .where(Shipment.id == tracking_update.shipment_id)
+                    .values(kerp_tracking_upload_response=result),
+                )
+                sent += 1
+            await session.commit()
+        return sent
+
+    async def drain_batch(self: Self) -> int:
+        """Send one batch of due updates, returning how many were sent."""
+        claimed = await self.claim()
+        if not claimed:
+            return 0
+
+        requests = []
+        results: dict[uuid.UUID, dict[str, Any] | Exception] = {}
+        for tracking_update_id, payload in claimed.items():
+            try:
+                requests.append((tracking_update_id, TrackingUpdateRequest.model_validate(payload)))
+            except ValidationError as exc:
+                results[tracking_update_id] = exc
+        if requests:
+            results |= await self.send(requests, deadline=time.monotonic() + self.lease.total_seconds())
+
+        return await self.record(list(claimed), results)
+
+    async def run(self: Self) -> None:
+        """Drain the outbox until cancelled."""
+        while True:
+            try:
+                sent = await self.drain_batch()
+            except Exception:
+                logger.exception("Could not drain the K-ERP tracking outbox")
+                sent = 0
+
+            # A full batch means there's probably more waiting
+            if sent < self.batch_size:
+                with suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                self._wakeup.clear()
+
+
+tracking_outbox = TrackingOutboxDrainer(
+    batch_size=KERP.tracking_batch_size,
+    poll_interval=KERP.tracking_poll_interval,
+    max_attempts=KERP.tracking_max_attempts,
+    lease=KERP.tracking_lease,
+)
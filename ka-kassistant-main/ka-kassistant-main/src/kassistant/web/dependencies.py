@@ -0,0 +1,13 @@
+"""Web dependencies."""
+
+from collections.abc import AsyncIterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from kassistant.orm import Session
+
+
+async def provide_db_session() -> AsyncIterator[AsyncSession]:
+    """Provide a database session for the length of a request."""
+    async with Session() as session:
+        yield session
@@ -0,0 +1,18 @@
+"""Web K-ERP."""
+
+from typing import Any
+
+from litestar import Controller, get
+
+from kassistant.kerp import async_kerp_client
+
+
+class KERPController(Controller):
+    """K-ERP controller."""
+
+    path = "/kerp"
+
+    @get("/metrics")
+    async def kerp_metrics(self) -> dict[str, Any]:
+        """Show this worker's counts and timings of calls to K-ERP."""
+        return {"calls": async_kerp_client.snapshot()}
@@ -7,9 +7,12 @@ from litestar.enums import RequestEncodingType
 from litestar.params import Body
 from litestar.response import Redirect, Template
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from kassistant.forms import SettingsForm
-from kassistant.orm import Session, Settings
+from kassistant.notifications import notify
+from kassistant.orm import Settings
+from kassistant.settings_cache import SETTINGS_CHANNEL, settings_cache
 
 
 class SettingsController(Controller):
@@ -20,39 +23,40 @@ class SettingsController(Controller):
     @get("/setup")
     async def setup_settings(self) -> Template:
         """Create settings."""
-        with Session() as session:
-            settings = session.scalars(select(Settings)).first()
-            if settings is None:
-                settings = Settings()
+        settings = await settings_cache.get()
+        if settings is None:
+            settings = Settings()
 
-            return Template(
-                template_name="settings.html",
-                context={"settings": settings},
-            )
+        return Template(
+            template_name="settings.html",
+            context={"settings": settings},
+        )
 
     @post("/setup")
     async def persist_settings(
         self,
         data: Annotated[SettingsForm, Body(media_type=RequestEncodingType.URL_ENCODED)],
+        db_session: AsyncSession,
     ) -> Redirect:
         """Create settings."""
-        with Session() as session:
-            settings = session.scalars(select(Settings)).first()
-            if settings is None:
-                settings = Settings()
-
-            settings.ship_from_company = data.ship_from_company
-            settings.ship_from_name = data.ship_from_name
-            settings.ship_from_phone = data.ship_from_phone
-            settings.ship_from_address_1 = data.ship_from_address_1
-            settings.ship_from_address_2 = data.ship_from_address_2
-            settings.ship_from_city = data.ship_from_city
-            settings.ship_from_state = data.ship_from_state
-            settings.ship_from_postal_code = data.ship_from_postal_code
-            settings.ship_from_country_code = data.ship_from_country_code
-            settings.fedex_label_size = data.fedex_label_size
-
-            session.add(settings)
-            session.commit()
-
-            return Redirect(path="/")
+        settings = (await db_session.scalars(select(Settings))).first()
+        if settings is None:
+            settings = Settings()
+
+        settings.ship_from_company = data.ship_from_company
+        settings.ship_from_name = data.ship_from_name
+        settings.ship_from_phone = data.ship_from_phone
+        settings.ship_from_address_1 = data.ship_from_address_1
+        settings.ship_from_address_2 = data.ship_from_address_2
+        settings.ship_from_city = data.ship_from_city
+        settings.ship_from_state = data.ship_from_state
+        settings.ship_from_postal_code = data.ship_from_postal_code
+        settings.ship_from_country_code = data.ship_from_country_code
+        settings.fedex_label_size = data.fedex_label_size
+
+        db_session.add(settings)
+        await notify(db_session, SETTINGS_CHANNEL)
+        await db_session.commit()
+        settings_cache.invalidate()
+
+        return Redirect(path="/")
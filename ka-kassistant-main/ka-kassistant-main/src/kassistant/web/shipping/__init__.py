@@ -2,9 +2,13 @@
 
 from litestar import Router
 
+from .cartons import CartonController
+from .failures import FailuresController
 from .fedex import FedExController
 from .history import HistoryController
+from .jobs import LabelJobController
 from .shipments import ShipmentController
+from .stations import StationController
 
 router = Router(
     path="/shipping",
@@ -12,5 +16,9 @@ router = Router(
         HistoryController,
         ShipmentController,
         FedExController,
+        LabelJobController,
+        StationController,
+        FailuresController,
+        CartonController,
     ],
 )
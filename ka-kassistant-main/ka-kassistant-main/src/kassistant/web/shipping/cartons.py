@@ -0,0 +1,34 @@
+"""Web K-ERP cartons."""
+
+import asyncio
+from typing import Any
+
+from litestar import Controller, post
+from litestar.exceptions import HTTPException
+
+from kassistant.carton_cache import carton_cache
+from kassistant.constants import KERP
+from kassistant.forms import CartonPrefetchForm
+
+
+class CartonController(Controller):
+    """Carton controller."""
+
+    path = "/cartons"
+
+    @post("/prefetch")
+    async def prefetch_cartons(self, data: CartonPrefetchForm) -> dict[str, Any]:
+        """Look cartons up in K-ERP ahead of time, such as when they're closed, so they're cached when scanned."""
+        carton_numbers = list(dict.fromkeys(number.strip() for number in data.carton_numbers if number.strip()))
+        if len(carton_numbers) > KERP.carton_prefetch_max:
+            msg = f"at most {KERP.carton_prefetch_max} cartons can be prefetched at once"
+            raise HTTPException(msg, status_code=400)
+
+        cartons = {}
+        for chunk in await asyncio.gather(*(lookup for _, lookup in carton_cache.lookup(carton_numbers))):
+            cartons.update(chunk)
+
+        return {
+            "cached": len(cartons),
+            "not_found": [carton_number for carton_number in carton_numbers if carton_number not in cartons],
+        }
@@ -0,0 +1,67 @@
+"""Web label failures."""
+
+from datetime import UTC, datetime, timedelta
+from typing import Annotated
+
+from litestar import Controller, get
+from litestar.params import Parameter
+from litestar.response import Template
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from kassistant.constants import App
+from kassistant.label_retries import group_failures
+from kassistant.orm import LabelRetry, Shipment, TrackingUpdate
+
+
+class FailuresController(Controller):
+    """Failures controller."""
+
+    path = "/failures"
+
+    @get("/")
+    async def failures(
+        self,
+        db_session: AsyncSession,
+        days: Annotated[int, Parameter(ge=1, le=App.failures_max_days)] = App.failures_days,
+    ) -> Template:
+        """Recent label failures.
+
+        FedEx errors are grouped by error code, alongside cartons retried after FedEx was down,
+        shipments left in flight, to be checked in FedEx and resolved,
+        and tracking numbers given up on writing back to K-ERP.
+        """
+        since = datetime.now(tz=UTC) - timedelta(days=days)
+        stale = datetime.now(tz=UTC) - timedelta(minutes=App.in_flight_stale_minutes)
+
+        shipments = await db_session.execute(
+            select(Shipment.id, Shipment.carton_number, Shipment.created, Shipment.fedex_create_label_response)
+            .where(Shipment.status == "fedex_error", Shipment.created >= since)
+            .order_by(Shipment.created.desc()),
+        )
+        retries = await db_session.scalars(
+            select(LabelRetry).where(LabelRetry.created >= since).order_by(LabelRetry.created.desc()),
+        )
+        in_flight = await db_session.scalars(
+            select(Shipment)
+            .where(Shipment.status == "in_flight", Shipment.created >= since, Shipment.created <= stale)
+            .order_by(Shipment.created.desc()),
+        )
+        abandoned = await db_session.execute(
+            select(TrackingUpdate, Shipment.carton_number)
+            .join(Shipment, Shipment.id == TrackingUpdate.shipment_id)
+            .where(TrackingUpdate.abandoned_at >= since)
+            .order_by(TrackingUpdate.abandoned_at.desc()),
+        )
+
+        return Template(
+            template_name="shipping/failures.html",
+            context={
+                "days": days,
+                "groups": group_failures(shipments.tuples()),
+                "retries": retries.all(),
+                "in_flight": in_flight.all(),
+                "in_flight_stale_minutes": App.in_flight_stale_minutes,
+                "abandoned": abandoned.tuples().all(),
+            },
+        )
@@ -2,15 +2,19 @@
 
 from typing import Annotated
 
-from litestar import Controller, get, post
+from litestar import Controller, MediaType, get, post
 from litestar.enums import RequestEncodingType
-from litestar.params import Body
-from litestar.response import Redirect, Template
-from sqlalchemy import select
+from litestar.exceptions import HTTPException
+from litestar.params import Body, Parameter
+from litestar.response import Redirect, Stream, Template
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from kassistant.forms import LabelRequestForm
-from kassistant.orm import Session, Settings
-from kassistant.run_labels import run_labels
+from kassistant.label_jobs import LABEL_JOBS_CHANNEL
+from kassistant.notifications import notify
+from kassistant.orm import LabelJob
+from kassistant.run_labels import build_label_request_context, detach_labels, run_labels, stream_labels
+from kassistant.settings_cache import settings_cache
 
 
 class FedExController(Controller):
@@ -21,16 +25,53 @@ class FedExController(Controller):
     @get("/form")
     async def ship_fedex(self) -> Template | Redirect:
         """FedEx shipping."""
-        with Session() as session:
-            settings = session.scalars(select(Settings)).first()
-            if settings is None:
-                return Redirect(path="/settings/setup")
+        if await settings_cache.get() is None:
+            return Redirect(path="/settings/setup")
         return Template(template_name="shipping/fedex/form.html")
 
-    @post("/process-cartons")
+    @post("/process-cartons", media_type=MediaType.TEXT)
     async def process_cartons(
         self,
         data: Annotated[LabelRequestForm, Body(media_type=RequestEncodingType.URL_ENCODED)],
-    ) -> str:
+        stream: Annotated[bool, Parameter(description="Send each label as soon as it is ready")] = False,  # noqa: FBT002
+    ) -> str | Stream | Redirect:
         """POST route to handle creating labels."""
-        return await run_labels(data)
+        if await settings_cache.get() is None:
+            return Redirect(path="/settings/setup")
+        # Checked before any label is created, since a stream's status has been sent by the time it fails
+        try:
+            context = await build_label_request_context(data)
+        except ValueError as exc:
+            raise HTTPException(str(exc), status_code=400) from exc
+
+        if stream:
+            # The wave runs on its own, so a client disconnecting can't cut its cleanup short
+            return Stream(
+                (f"{label_str}\n" async for label_str in detach_labels(stream_labels(data, context=context))),
+                media_type=MediaType.TEXT,
+            )
+        return await run_labels(data, context=context)
+
+    @post("/jobs")
+    async def submit_label_job(
+        self,
+        data: Annotated[LabelRequestForm, Body(media_type=RequestEncodingType.URL_ENCODED)],
+        db_session: AsyncSession,
+    ) -> dict[str, str]:
+        """Queue cartons to have their labels created in the background."""
+        # Checked before the job is queued, rather than when it runs, so the request is turned away like a wave
+        try:
+            await build_label_request_context(data)
+        except ValueError as exc:
+            raise HTTPException(str(exc), status_code=400) from exc
+
+        job = LabelJob(form_data=data.model_dump())
+        db_session.add(job)
+        await notify(db_session, LABEL_JOBS_CHANNEL)
+        await db_session.commit()
+
+        return {
+            "id": str(job.id),
+            "status": f"/shipping/jobs/{job.id}",
+            "zpl": f"/shipping/jobs/{job.id}/zpl",
+        }
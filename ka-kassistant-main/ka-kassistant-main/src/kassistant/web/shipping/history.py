@@ -5,14 +5,32 @@ from typing import Annotated
 
 from litestar import Controller, get, post
 from litestar.enums import RequestEncodingType
-from litestar.params import Body
+from litestar.exceptions import HTTPException
+from litestar.params import Body, Parameter
 from litestar.response import Redirect, Stream, Template
-from sqlalchemy import Date, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from kassistant.constants import App
 from kassistant.forms import HistoryForm
-from kassistant.orm import Session, Shipment
-from kassistant.run_labels import build_excel_export
+from kassistant.history import decode_cursor, encode_cursor, history_page
+from kassistant.run_labels import build_excel_export, stream_csv_export, stream_file
+
+
+def check_until(ship_date: date, until: date | None) -> date:
+    """Get the last ship date to include in a history range, which defaults to the first."""
+    if until is None:
+        return ship_date
+    if until < ship_date:
+        msg = "until must not be before the ship date"
+        raise HTTPException(msg, status_code=400)
+    return until
+
+
+def export_filename(ship_date: date, until: date, extension: str) -> str:
+    """Name an export of the shipment history."""
+    if until == ship_date:
+        return f"shipment_history_{ship_date}.{extension}"
+    return f"shipment_history_{ship_date}_{until}.{extension}"
 
 
 class HistoryController(Controller):
@@ -27,37 +45,76 @@ class HistoryController(Controller):
     ) -> Redirect:
         """History route to redirect to a date page."""
         path = f"/shipping/history/{data.ship_date}"
+        query = []
+        if data.until:
+            query.append(f"until={data.until}")
         if data.detailed:
-            path += "?detailed"
+            query.append("detailed")
+        if query:
+            path += "?" + "&".join(query)
         return Redirect(path=path)
 
     @get("/{ship_date: date}")
-    async def history(self, ship_date: date, detailed: str | None) -> Template:
-        """Shipment history."""
-        with Session() as session:
-            shipments = session.scalars(
-                select(Shipment)
-                .where(cast(func.timezone(App.time_zone, Shipment.created), Date) == ship_date)
-                .order_by(Shipment.created.desc()),
-            ).all()
-
-            return Template(
-                template_name="shipping/history.html",
-                context={"shipments": shipments, "detailed": detailed, "ship_date": ship_date},
-            )
+    async def history(  # noqa: PLR0913
+        self,
+        ship_date: date,
+        detailed: str | None,
+        db_session: AsyncSession,
+        until: Annotated[date | None, Parameter(description="Last ship date to include")] = None,
+        before: Annotated[str | None, Parameter(description="Show shipments after this page cursor")] = None,
+        page_size: Annotated[int, Parameter(ge=1, le=App.history_max_page_size)] = App.history_page_size,
+    ) -> Template:
+        """Shipment history, for a ship date or through `until`, one page at a time."""
+        until = check_until(ship_date, until)
+        try:
+            cursor = decode_cursor(before) if before else None
+        except ValueError as exc:
+            msg = "invalid page cursor"
+            raise HTTPException(msg, status_code=400) from exc
+
+        shipments = (await db_session.scalars(history_page(ship_date, until, page_size, cursor))).all()
+        next_cursor = encode_cursor(shipments[page_size - 1]) if len(shipments) > page_size else None
+
+        return Template(
+            template_name="shipping/history.html",
+            context={
+                "shipments": shipments[:page_size],
+                "detailed": detailed,
+                "ship_date": ship_date,
+                "until": until,
+                "before": before,
+                "next_cursor": next_cursor,
+                "page_size": page_size,
+            },
+        )
 
     @get("/{ship_date: date}/excel")
-    async def history_export(self, ship_date: date) -> Stream:
-        """Create an Excel export of the shipment history."""
-        with Session() as session:
-            shipments = session.scalars(
-                select(Shipment)
-                .where(cast(func.timezone(App.time_zone, Shipment.created), Date) == ship_date)
-                .order_by(Shipment.created.desc()),
-            ).all()
-
-            return Stream(
-                content=build_excel_export(shipments),
-                media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                headers={"Content-Disposition": f"attachment; filename=shipment_history_{ship_date}.xlsx"},
-            )
+    async def history_export(
+        self,
+        ship_date: date,
+        until: Annotated[date | None, Parameter(description="Last ship date to include")] = None,
+    ) -> Stream:
+        """Create an Excel export of the shipment history, for a ship date or through `until`."""
+        until = check_until(ship_date, until)
+        export_file = await build_excel_export(ship_date, until)
+
+        return Stream(
+            content=stream_file(export_file),
+            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            headers={"Content-Disposition": f"attachment; filename={export_filename(ship_date, until, 'xlsx')}"},
+        )
+
+    @get("/{ship_date: date}/csv")
+    async def history_csv_export(
+        self,
+        ship_date: date,
+        until: Annotated[date | None, Parameter(description="Last ship date to include")] = None,
+    ) -> Stream:
+        """Stream a CSV export of the shipment history, for a ship date or through `until`."""
+        until = check_until(ship_date, until)
+
+        return Stream(
+            content=stream_csv_export(ship_date, until),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={export_filename(ship_date, until, 'csv')}"},
+        )
@@ -0,0 +1,56 @@
+"""Web label jobs."""
+
+from typing import Any
+from uuid import UUID
+
+from litestar import Controller, get
+from litestar.exceptions import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from kassistant.orm import LabelJob, Shipment
+
+
+class LabelJobController(Controller):
+    """Label job controller."""
+
+    path = "/jobs"
+
+    @get("/{job_id: uuid}")
+    async def show_label_job(self, job_id: UUID, db_session: AsyncSession) -> dict[str, Any]:
+        """Show a label job's status, and how many of its cartons have reached each shipment status."""
+        job = await db_session.get(LabelJob, job_id)
+
+        if job is None:
+            msg = "job not found"
+            raise HTTPException(msg, status_code=404)
+
+        shipment_statuses = await db_session.execute(
+            select(Shipment.status, func.count()).where(Shipment.label_job_id == job_id).group_by(Shipment.status),
+        )
+
+        return {
+            "id": str(job.id),
+            "status": job.status,
+            "attempts": job.attempts,
+            "last_error": job.last_error,
+            "created": job.created.isoformat(),
+            "updated": job.updated.isoformat(),
+            "shipments": dict(shipment_statuses.tuples().all()),
+            "zpl": f"/shipping/jobs/{job.id}/zpl",
+        }
+
+    @get("/{job_id: uuid}/zpl")
+    async def label_job_zpl(self, job_id: UUID, db_session: AsyncSession) -> str:
+        """Download a finished label job's labels."""
+        job = await db_session.get(LabelJob, job_id)
+
+        if job is None:
+            msg = "job not found"
+            raise HTTPException(msg, status_code=404)
+
+        if job.result is None:
+            msg = f"job is {job.status}"
+            raise HTTPException(msg, status_code=409)
+
+        return job.result
@@ -1,15 +1,30 @@
 """Web shipping."""
 
-import json
-from base64 import b64decode
+from typing import Annotated, Literal
 from uuid import UUID
 
-from litestar import Controller, get
+from litestar import Controller, MediaType, Response, get, post
+from litestar.enums import RequestEncodingType
 from litestar.exceptions import HTTPException
-from litestar.response import Stream
+from litestar.params import Body, Parameter
+from litestar.response import Redirect, Stream
 from sqlalchemy import select
-
-from kassistant.orm import Session, Shipment
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from kassistant.constants import App
+from kassistant.forms import ShipmentResolutionForm
+from kassistant.labels import label_cache
+from kassistant.orm import Shipment
+from kassistant.run_labels import resolve_in_flight_shipment
+from kassistant.serialization import encode_json
+from kassistant.shipment_archive import load_payloads
+from kassistant.support_data import (
+    shipment_support_data,
+    stream_support_data_ndjson,
+    stream_support_data_zip,
+    support_data_filename,
+)
+from kassistant.tracking_outbox import tracking_outbox
 
 
 class ShipmentController(Controller):
@@ -18,78 +33,133 @@ class ShipmentController(Controller):
     path = "/shipment"
 
     @get("/{shipment_id: uuid}/fedex/create-label-request")
-    async def show_create_label_request_data(self, shipment_id: UUID) -> str:
+    async def show_create_label_request_data(
+        self,
+        shipment_id: UUID,
+        db_session: AsyncSession,
+        pretty: Annotated[bool, Parameter(description="Pretty print the JSON")] = True,  # noqa: FBT002
+    ) -> Response[bytes]:
         """Show label request data."""
-        with Session() as session:
-            shipment = session.scalars(select(Shipment).filter_by(id=shipment_id)).first()
+        shipment = (await db_session.scalars(select(Shipment).filter_by(id=shipment_id))).first()
 
-            if shipment is None:
-                msg = "shipment not found"
-                raise HTTPException(msg, status_code=404)
+        if shipment is None:
+            msg = "shipment not found"
+            raise HTTPException(msg, status_code=404)
 
-            if shipment.fedex_create_label_request is None:
-                msg = "label not created"
-                raise HTTPException(msg, status_code=404)
+        payloads = await load_payloads(db_session, shipment)
+        if payloads["fedex_create_label_request"] is None:
+            msg = "label not created"
+            raise HTTPException(msg, status_code=404)
 
-            return json.dumps(shipment.fedex_create_label_request, indent=4)
+        return Response(
+            content=encode_json(payloads["fedex_create_label_request"], indent=4 if pretty else 0),
+            media_type=MediaType.JSON,
+        )
 
     @get("/{shipment_id: uuid}/fedex/create-label-response")
-    async def show_create_label_response_data(self, shipment_id: UUID) -> str:
+    async def show_create_label_response_data(
+        self,
+        shipment_id: UUID,
+        db_session: AsyncSession,
+        pretty: Annotated[bool, Parameter(description="Pretty print the JSON")] = True,  # noqa: FBT002
+    ) -> Response[bytes]:
         """Show label response data."""
-        with Session() as session:
-            shipment = session.scalars(select(Shipment).filter_by(id=shipment_id)).first()
+        shipment = (await db_session.scalars(select(Shipment).filter_by(id=shipment_id))).first()
 
-            if shipment is None:
-                msg = "shipment not found"
-                raise HTTPException(msg, status_code=404)
+        if shipment is None:
+            msg = "shipment not found"
+            raise HTTPException(msg, status_code=404)
 
-            if shipment.fedex_create_label_response is None:
-                msg = "label not created"
-                raise HTTPException(msg, status_code=404)
+        payloads = await load_payloads(db_session, shipment)
+        if payloads["fedex_create_label_response"] is None:
+            msg = "label not created"
+            raise HTTPException(msg, status_code=404)
 
-            return json.dumps(shipment.fedex_create_label_response, indent=4)
+        return Response(
+            content=encode_json(payloads["fedex_create_label_response"], indent=4 if pretty else 0),
+            media_type=MediaType.JSON,
+        )
 
     @get("/{shipment_id: uuid}/zpl")
-    async def label(self, shipment_id: UUID) -> str:
+    async def label(self, shipment_id: UUID, db_session: AsyncSession) -> str:
         """Render label ZPL."""
-        with Session() as session:
-            shipment = session.scalars(select(Shipment).filter_by(id=shipment_id)).first()
+        label = await label_cache.get(shipment_id)
 
-            if shipment is None:
+        if label is None:
+            if await db_session.scalar(select(Shipment.id).filter_by(id=shipment_id)) is None:
                 msg = "shipment not found"
                 raise HTTPException(msg, status_code=404)
 
-            if shipment.fedex_create_label_response is None:
-                msg = "label not created"
-                raise HTTPException(msg, status_code=404)
+            msg = "label not created"
+            raise HTTPException(msg, status_code=404)
 
-            first_package = shipment.fedex_create_label_response["output"]["transactionShipments"][0]["pieceResponses"][
-                0
-            ]
-            return b64decode(first_package["packageDocuments"][0]["encodedLabel"]).decode("utf-8")
+        return label
 
     @get("/{shipment_id: uuid}/support-data")
-    async def support_data(self, shipment_id: UUID) -> Stream:
+    async def support_data(
+        self,
+        shipment_id: UUID,
+        db_session: AsyncSession,
+        pretty: Annotated[bool, Parameter(description="Pretty print the JSON")] = True,  # noqa: FBT002
+    ) -> Response[bytes]:
         """Render support data."""
-        with Session() as session:
-            shipment = session.scalars(select(Shipment).filter_by(id=shipment_id)).first()
-
-            if shipment is None:
-                msg = "shipment not found"
-                raise HTTPException(msg, status_code=404)
-
-            data = {
-                "id": str(shipment.id),
-                "carton_number": shipment.carton_number,
-                "tracking_number": shipment.tracking_number,
-                "status": shipment.status,
-                "fedex_create_label_request": shipment.fedex_create_label_request,
-                "fedex_create_label_response": shipment.fedex_create_label_response,
-                "kerp_tracking_upload_response": shipment.kerp_tracking_upload_response,
-            }
-
+        shipment = (await db_session.scalars(select(Shipment).filter_by(id=shipment_id))).first()
+
+        if shipment is None:
+            msg = "shipment not found"
+            raise HTTPException(msg, status_code=404)
+
+        data = shipment_support_data(shipment, await load_payloads(db_session, shipment))
+
+        return Response(
+            content=encode_json(data, indent=4 if pretty else 0),
+            media_type=MediaType.JSON,
+            headers={"Content-Disposition": f"attachment; filename={support_data_filename(shipment.id)}"},
+        )
+
+    @post("/{shipment_id: uuid}/resolve")
+    async def resolve_shipment(
+        self,
+        shipment_id: UUID,
+        data: Annotated[ShipmentResolutionForm, Body(media_type=RequestEncodingType.URL_ENCODED)],
+        db_session: AsyncSession,
+    ) -> Redirect:
+        """Record what became of a shipment left in flight, once FedEx has been checked."""
+        tracking_number = data.tracking_number.strip() or None
+        if data.outcome == "shipped" and tracking_number is None:
+            msg = "a shipped carton needs its tracking number"
+            raise HTTPException(msg, status_code=400)
+        if data.outcome == "not_shipped":
+            tracking_number = None
+
+        if not await resolve_in_flight_shipment(db_session, shipment_id, tracking_number):
+            msg = f"shipment not found, or not in flight for over {App.in_flight_stale_minutes} minutes"
+            raise HTTPException(msg, status_code=409)
+        await db_session.commit()
+
+        if tracking_number is not None:
+            tracking_outbox.wake()
+        return Redirect(path="/shipping/failures")
+
+    @get("/support-data")
+    async def bulk_support_data(
+        self,
+        shipment_ids: Annotated[
+            list[UUID],
+            Parameter(query="id", min_items=1, max_items=App.support_data_max_shipments),
+        ],
+        archive_format: Annotated[Literal["ndjson", "zip"], Parameter(query="format")] = "ndjson",
+    ) -> Stream:
+        """Stream the support data of many shipments, as NDJSON with a line per shipment, or as a zip file."""
+        if archive_format == "zip":
             return Stream(
-                content=json.dumps(data, indent=4),
-                media_type="application/json",
-                headers={"Content-Disposition": f"attachment; filename=kassistant-shipment-{shipment.id}.json"},
+                content=stream_support_data_zip(shipment_ids),
+                media_type="application/zip",
+                headers={"Content-Disposition": "attachment; filename=kassistant-shipments.zip"},
             )
+
+        return Stream(
+            content=stream_support_data_ndjson(shipment_ids),
+            media_type="application/x-ndjson",
+            headers={"Content-Disposition": "attachment; filename=kassistant-shipments.ndjson"},
+        )
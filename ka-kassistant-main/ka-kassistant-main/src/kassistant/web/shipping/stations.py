@@ -0,0 +1,51 @@
+"""Web packing station label queues."""
+
+from typing import Annotated, Any
+
+from litestar import Controller, MediaType, get, post
+from litestar.enums import RequestEncodingType
+from litestar.params import Body
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from kassistant.forms import StationForm
+from kassistant.label_retries import claim_station_labels
+from kassistant.orm import LabelRetry
+
+
+class StationController(Controller):
+    """Station controller."""
+
+    path = "/stations"
+
+    @get("/{station: str}")
+    async def show_station(self, station: str, db_session: AsyncSession) -> dict[str, Any]:
+        """Show how many recovered labels are waiting to be printed at a station, and how many are still retrying."""
+        retry_statuses = await db_session.execute(
+            select(LabelRetry.status, func.count())
+            .where(
+                LabelRetry.station == station,
+                (LabelRetry.status == "pending")
+                | ((LabelRetry.status == "recovered") & LabelRetry.printed_at.is_(None)),
+            )
+            .group_by(LabelRetry.status),
+        )
+        counts = dict(retry_statuses.tuples().all())
+
+        return {
+            "station": station,
+            "waiting": counts.get("recovered", 0),
+            "retrying": counts.get("pending", 0),
+        }
+
+    @post("/labels", media_type=MediaType.TEXT)
+    async def print_station_labels(
+        self,
+        data: Annotated[StationForm, Body(media_type=RequestEncodingType.URL_ENCODED)],
+        db_session: AsyncSession,
+    ) -> str:
+        """Take the recovered labels waiting to be printed at a station."""
+        label_strs = await claim_station_labels(db_session, data.station)
+        await db_session.commit()
+
+        return "\n".join(label_strs)
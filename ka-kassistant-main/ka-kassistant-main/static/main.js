@@ -9,3 +9,18 @@ function format_datetime_detailed(datetime) {
     const event = new Date(datetime);
     return event.toString()
 }
+
+function remember_station() {
+    "use strict";
+    // Every station field on the page shows the station this browser last entered
+    const fields = document.querySelectorAll("input.station");
+    for (const field of fields) {
+        field.value = localStorage.getItem("station") || "";
+        field.addEventListener("change", function () {
+            localStorage.setItem("station", field.value);
+            for (const other of fields) {
+                other.value = field.value;
+            }
+        });
+    }
+}
@@ -0,0 +1,78 @@
+"""Test checking recipients' addresses before labels are bought."""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+
+import httpx
+
+from kassistant.address_cache import (
+    AddressCache,
+    AddressVerdict,
+    FedExAddressValidator,
+    StaticAddressValidator,
+    address_key,
+)
+from kassistant.fedex import Address
+
+
+def make_carton(**fields: str) -> Any:  # noqa: ANN401
+    """Make something with a carton's address, without the rest of a K-ERP carton."""
+    address = {"address1": "1 Main St", "address2": "", "city": "Austin", "state": "TX", "postal_code": "78701"}
+    return SimpleNamespace(carton_number="C1", **{**address, **fields})
+
+
+def make_address(state: str) -> Address:
+    """Make an address in a state."""
+    return Address(
+        streetLines=["1 Main St"],
+        city="Austin",
+        stateOrProvinceCode=state,
+        postalCode="78701",
+        countryCode="US",
+    )
+
+
+def test_address_key_ignores_case_and_spacing() -> None:
+    """The same address, however K-ERP spaces or capitalizes it, has the same key."""
+    assert address_key(make_carton()) == address_key(make_carton(address1="  1  MAIN st ", city="AUSTIN"))
+    assert address_key(make_carton()) != address_key(make_carton(postal_code="78702"))
+
+
+def test_fedex_validator_rejects_only_addresses_labels_would_fail_for() -> None:
+    """Malformed addresses and postal codes in another state are rejected, and unmatched streets aren't."""
+    resolved_addresses = [
+        {"stateOrProvinceCode": "TX", "attributes": {"Resolved": "false", "ValidlyFormed": "true"}},
+        {"stateOrProvinceCode": "TX", "attributes": {"ValidlyFormed": "false"}},
+        {"stateOrProvinceCode": "TX", "attributes": {"Resolved": "true", "ValidlyFormed": "true"}},
+    ]
+
+    class FakeClient:
+        async def validate_addresses(self, addresses: list[Address]) -> httpx.Response:
+            assert len(addresses) == len(resolved_addresses)
+            return httpx.Response(200, json={"output": {"resolvedAddresses": resolved_addresses}})
+
+    validator = FedExAddressValidator(FakeClient())  # type: ignore[arg-type]
+    verdicts = asyncio.run(
+        validator.validate(
+            {"unmatched": make_address("TX"), "malformed": make_address("TX"), "moved": make_address("OK")},
+        ),
+    )
+
+    assert verdicts["unmatched"] == AddressVerdict(valid=True)
+    assert not verdicts["malformed"].valid
+    assert verdicts["moved"] == AddressVerdict(valid=False, message="FedEx puts postal code 78701 in TX, not OK")
+
+
+def test_failed_validation_assumes_addresses_are_good() -> None:
+    """If the validator fails, nothing is rejected or remembered, so labels are bought as before."""
+
+    class BrokenValidator(StaticAddressValidator):
+        async def validate(self, addresses: Any) -> dict[str, AddressVerdict]:  # noqa: ANN401, ARG002
+            msg = "FedEx is down"
+            raise RuntimeError(msg)
+
+    assert asyncio.run(AddressCache(BrokenValidator()).validate({"key": make_address("TX")})) == {}
+    assert asyncio.run(StaticAddressValidator({"bad": "No such street"}).validate({"bad": make_address("TX")})) == {
+        "bad": AddressVerdict(valid=False, message="No such street"),
+    }
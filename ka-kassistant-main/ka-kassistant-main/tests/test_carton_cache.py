@@ -0,0 +1,40 @@
+"""Test the K-ERP carton cache."""
+
+import asyncio
+from collections.abc import Sequence
+from typing import Any
+
+from kassistant.carton_cache import CartonCache
+
+
+class FakeCartonCache(CartonCache):
+    """Look cartons up without K-ERP or the database, recording how many chunks are looked up at once."""
+
+    def __init__(self, **kwargs: Any) -> None:  # noqa: ANN401
+        """Initialize the FakeCartonCache class."""
+        super().__init__(**kwargs)
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    async def get_cartons(self, carton_numbers: Sequence[str]) -> dict[str, Any]:  # type: ignore[override]
+        """Find every carton but the missing ones."""
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        return {carton_number: carton_number for carton_number in carton_numbers if carton_number != "missing"}
+
+
+def test_lookup_in_chunks_a_few_at_a_time() -> None:
+    """Cartons are looked up in chunks, in scan order, with a bounded number of chunks at once."""
+    cache = FakeCartonCache(chunk_size=2, concurrency=2)
+    carton_numbers = ["1", "2", "3", "missing", "5", "6", "7"]
+
+    async def lookup_all() -> list[tuple[Sequence[str], dict[str, Any]]]:
+        return [(chunk, await lookup) for chunk, lookup in cache.lookup(carton_numbers)]
+
+    chunks = asyncio.run(lookup_all())
+
+    assert [list(chunk) for chunk, _ in chunks] == [["1", "2"], ["3", "missing"], ["5", "6"], ["7"]]
+    assert chunks[1][1] == {"3": "3"}
+    assert cache.most_in_flight == 2  # noqa: PLR2004
@@ -1,11 +1,181 @@
 """Test FedEx."""
 
+import asyncio
+import json
+from base64 import b64encode
+from datetime import UTC, datetime, timedelta
+
+import httpx
 import pytest
 
-from kassistant.fedex import FedExServices
+from kassistant.fedex import (
+    AdaptiveConcurrencyLimiter,
+    CallGovernor,
+    CircuitBreaker,
+    FedExServices,
+    FedExShipmentResponse,
+    FedExUnavailableError,
+    TokenBucket,
+)
+from kassistant.fedex.auth import AccessToken, TokenManager
 
 
 def test_fedex_client_needs_args() -> None:
     """Temp smoke test."""
     with pytest.raises(TypeError):
         FedExServices()
+
+
+def test_token_manager_coalesces_concurrent_refreshes() -> None:
+    """Concurrent callers share a single token fetch."""
+    fetches = 0
+
+    async def fetch() -> AccessToken:
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(0.01)
+        return AccessToken(value=f"token-{fetches}", expires_at=datetime.now(tz=UTC) + timedelta(hours=1))
+
+    async def get_tokens() -> list[str]:
+        manager = TokenManager(fetch)
+        return await asyncio.gather(*(manager.get_token() for _ in range(10)))
+
+    assert asyncio.run(get_tokens()) == ["token-1"] * 10
+    assert fetches == 1
+
+
+def test_token_manager_refreshes_early_in_background() -> None:
+    """A token inside the refresh margin is still handed out while it is replaced."""
+
+    async def fetch() -> AccessToken:
+        return AccessToken(value="new", expires_at=datetime.now(tz=UTC) + timedelta(hours=1))
+
+    async def get_tokens() -> tuple[str, str]:
+        manager = TokenManager(fetch, refresh_margin=timedelta(minutes=5))
+        manager.token = AccessToken(value="old", expires_at=datetime.now(tz=UTC) + timedelta(minutes=1))
+        first = await manager.get_token()
+        await asyncio.sleep(0)
+        return first, await manager.get_token()
+
+    assert asyncio.run(get_tokens()) == ("old", "new")
+
+
+def test_shipment_response_keeps_everything_but_the_label() -> None:
+    """The stored response has every field FedEx sent, including unmodelled ones, but not the label."""
+    response = {
+        "transactionId": "1",
+        "output": {
+            "transactionShipments": [
+                {
+                    "pieceResponses": [
+                        {
+                            "trackingNumber": "794600000000",
+                            "netRateAmount": 12.5,
+                            "packageDocuments": [{"docType": "ZPLII", "encodedLabel": b64encode(b"^XA^XZ").decode()}],
+                        },
+                    ],
+                },
+            ],
+        },
+    }
+
+    parsed = FedExShipmentResponse.model_validate_json(json.dumps(response))
+
+    assert parsed.pieces()[1].packageDocuments[0].label() == "^XA^XZ"
+    del response["output"]["transactionShipments"][0]["pieceResponses"][0]["packageDocuments"][0]["encodedLabel"]
+    assert parsed.payload() == response
+
+
+def make_governor(breaker: CircuitBreaker, sleeps: list[float]) -> CallGovernor:
+    """Make a governor that records its retry delays, and skips ahead instead of sleeping."""
+    elapsed = 0.0
+
+    async def sleep(delay: float) -> None:
+        nonlocal elapsed
+        sleeps.append(delay)
+        elapsed += delay
+
+    return CallGovernor(
+        TokenBucket(rate=1000, capacity=1000, clock=lambda: elapsed),
+        AdaptiveConcurrencyLimiter(4, 1, 8, latency_target=5),
+        breaker,
+        max_attempts=3,
+        sleep=sleep,
+    )
+
+
+def test_governor_retries_rate_limited_requests_after_retry_after() -> None:
+    """A 429 is retried after the delay FedEx asks for, and the concurrency limit is cut."""
+    responses = [httpx.Response(429, headers={"Retry-After": "2"}), httpx.Response(200)]
+    sleeps: list[float] = []
+    governor = make_governor(CircuitBreaker(failure_threshold=5, reset_timeout=30), sleeps)
+
+    async def send() -> httpx.Response:
+        return responses.pop(0)
+
+    response = asyncio.run(governor.call(send))
+
+    assert response.status_code == 200  # noqa: PLR2004
+    assert sleeps == [2.0]
+    assert governor.limiter.limit < 4  # noqa: PLR2004
+
+
+def test_governor_does_not_retry_other_failures() -> None:
+    """Errors FedEx may have acted on, like a timeout waiting for the response, are never sent again."""
+    sends = 0
+    governor = make_governor(CircuitBreaker(failure_threshold=5, reset_timeout=30), [])
+
+    async def send() -> httpx.Response:
+        nonlocal sends
+        sends += 1
+        msg = "timed out"
+        raise httpx.ReadTimeout(msg)
+
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(governor.call(send))
+    assert sends == 1
+
+
+def test_circuit_breaker_fails_fast_until_a_trial_succeeds() -> None:
+    """Once FedEx keeps failing, calls fail at once, until a trial call after the timeout succeeds."""
+    now = 0.0
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=lambda: now)
+    sleeps: list[float] = []
+    governor = make_governor(breaker, sleeps)
+
+    async def unavailable() -> httpx.Response:
+        return httpx.Response(503)
+
+    async def available() -> httpx.Response:
+        return httpx.Response(200)
+
+    with pytest.raises(FedExUnavailableError):
+        asyncio.run(governor.call(unavailable))
+    assert len(sleeps) == 2  # noqa: PLR2004
+
+    with pytest.raises(FedExUnavailableError):
+        asyncio.run(governor.call(available))
+
+    now = 31.0
+    assert asyncio.run(governor.call(available)).status_code == 200  # noqa: PLR2004
+    assert breaker.opened_at is None
+
+
+def test_circuit_breaker_opens_on_server_errors() -> None:
+    """A run of 5xx responses that can't be retried, like a 502 from a gateway, still opens the circuit."""
+    sends = 0
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=lambda: 0.0)
+    governor = make_governor(breaker, [])
+
+    async def bad_gateway() -> httpx.Response:
+        nonlocal sends
+        sends += 1
+        return httpx.Response(502)
+
+    for _ in range(3):
+        assert asyncio.run(governor.call(bad_gateway)).status_code == 502  # noqa: PLR2004
+
+    with pytest.raises(FedExUnavailableError):
+        asyncio.run(governor.call(bad_gateway))
+    assert sends == 3  # noqa: PLR2004
+    assert governor.limiter.limit < 4  # noqa: PLR2004
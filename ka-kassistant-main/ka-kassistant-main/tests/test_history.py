@@ -0,0 +1,69 @@
+"""Test shipment history."""
+
+import asyncio
+import xml.etree.ElementTree as ET
+import zipfile
+from collections.abc import AsyncIterator, Sequence
+from datetime import UTC, date, datetime
+from typing import Any
+
+import pytest
+
+from kassistant import run_labels
+from kassistant.history import local_date_range
+
+
+def test_local_date_range_covers_whole_local_days() -> None:
+    """A range runs from local midnight on the first day to local midnight after the last."""
+    assert local_date_range(date(2026, 7, 1), date(2026, 7, 1), "America/Chicago") == (
+        datetime(2026, 7, 1, 5, tzinfo=UTC),
+        datetime(2026, 7, 2, 5, tzinfo=UTC),
+    )
+
+
+def test_local_date_range_across_daylight_saving_time() -> None:
+    """The UTC offset of each end follows its own date."""
+    assert local_date_range(date(2026, 10, 31), date(2026, 11, 1), "America/Chicago") == (
+        datetime(2026, 10, 31, 5, tzinfo=UTC),
+        datetime(2026, 11, 2, 6, tzinfo=UTC),
+    )
+
+
+def test_excel_export_formats_ship_dates_as_dates(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ship dates are written as dates, not as bare serial numbers, and missing ones are left blank."""
+
+    async def export_rows(start: date, end: date) -> AsyncIterator[Sequence[Sequence[Any]]]:  # noqa: ARG001
+        # Creation times are local, without a time zone, as the export writes them
+        yield [
+            (
+                "C1",
+                "794600000001",
+                "shipped",
+                "FEDEX_GROUND",
+                date(2026, 10, 19),
+                datetime.fromisoformat("2026-10-18 09:30"),
+            ),
+            ("C2", None, "fedex_error", "FEDEX_GROUND", None, datetime.fromisoformat("2026-10-18 09:31")),
+        ]
+
+    monkeypatch.setattr(run_labels, "export_rows", export_rows)
+    export_file = asyncio.run(run_labels.build_excel_export(date(2026, 10, 18), date(2026, 10, 18)))
+    with export_file, zipfile.ZipFile(export_file) as workbook:
+        sheet = ET.fromstring(workbook.read("xl/worksheets/sheet1.xml"))  # noqa: S314
+        styles = ET.fromstring(workbook.read("xl/styles.xml"))  # noqa: S314
+
+    namespace = {"main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+    number_formats = {
+        number_format.get("numFmtId"): number_format.get("formatCode")
+        for number_format in styles.iterfind("main:numFmts/main:numFmt", namespace)
+    }
+    cell_formats = [cell_format.get("numFmtId") for cell_format in styles.iterfind("main:cellXfs/main:xf", namespace)]
+
+    def cell_format(reference: str) -> str | None:
+        cell = sheet.find(f".//main:c[@r='{reference}']", namespace)
+        assert cell is not None
+        return number_formats.get(cell_formats[int(cell.get("s", "0"))])
+
+    assert cell_format("E2") == "yyyy-mm-dd"
+    assert cell_format("F2") == "yyyy-mm-dd hh:mm:ss"
+    assert sheet.find(".//main:c[@r='E3']/main:v", namespace) is None
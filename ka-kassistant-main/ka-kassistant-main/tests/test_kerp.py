@@ -0,0 +1,59 @@
+"""Test the non-blocking K-ERP client."""
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from kassistant.kerp import AsyncKERPClient
+
+
+class FakeShipping:
+    """Answer like K-ERP's shipping API, slowly, from whichever thread calls it."""
+
+    def __init__(self) -> None:
+        """Initialize the FakeShipping class."""
+        self.threads: set[str] = set()
+
+    def get_cartons(self, carton_numbers: list[str]) -> SimpleNamespace:
+        """Find every carton but the missing ones."""
+        self.threads.add(threading.current_thread().name)
+        time.sleep(0.05)
+        return SimpleNamespace(data=[number for number in carton_numbers if number != "missing"])
+
+
+def test_calls_run_off_the_event_loop_and_time_out() -> None:
+    """Calls run on the client's own threads without blocking the loop, and slow ones time out and are counted."""
+    shipping = FakeShipping()
+    client = AsyncKERPClient(SimpleNamespace(shipping=shipping), max_workers=2, get_cartons_timeout=1.0)  # type: ignore[arg-type]
+
+    async def main() -> Any:  # noqa: ANN401
+        ticks = 0
+
+        async def tick() -> None:
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.005)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        found = await asyncio.gather(*(client.get_cartons(["a", "missing"]) for _ in range(4)))
+        ticker.cancel()
+        assert ticks > 0
+
+        client.get_cartons_timeout = 0.01
+        with pytest.raises(TimeoutError):
+            await client.get_cartons(["a"])
+        return found
+
+    try:
+        assert asyncio.run(main()) == [["a"]] * 4
+    finally:
+        client.close()
+
+    assert {name.split("_")[0] for name in shipping.threads} == {"kerp"}
+    metrics = client.snapshot()["get_cartons"]
+    assert (metrics["calls"], metrics["errors"], metrics["timeouts"], metrics["in_flight"]) == (5, 0, 1, 0)
@@ -0,0 +1,228 @@
+"""Test label request templating."""
+
+import asyncio
+import json
+from collections.abc import AsyncGenerator
+
+import anyio
+import httpx
+import pytest
+from kerp_sdk.api_models import Carton
+
+from kassistant import run_labels
+from kassistant.fedex import FedExShipmentRequest
+from kassistant.forms import LabelRequestForm
+from kassistant.orm import Settings
+from kassistant.run_labels import (
+    build_label_request_template,
+    create_shipment_labels,
+    detach_labels,
+    find_cartons,
+    group_shipments,
+    resolved_tracking_update,
+)
+
+
+def test_rendered_label_request_is_a_complete_request() -> None:
+    """A carton's request is valid, with nothing missing, and exactly what validating it would send."""
+    form_data = LabelRequestForm(
+        ship_date="2026-10-19",
+        service="FEDEX_GROUND",
+        billing="THIRD_PARTY",
+        third_party_account_number="123456789",
+        air_auth=None,
+        carton_numbers="C1",
+        saturday_delivery=True,
+    )
+    settings = Settings(
+        ship_from_company="Knights Apparel",
+        ship_from_name="Shipping",
+        ship_from_phone="5555550100",
+        ship_from_address_1="1 Main St",
+        ship_from_address_2="",
+        ship_from_city="Spartanburg",
+        ship_from_state="SC",
+        ship_from_postal_code="29301",
+        ship_from_country_code="US",
+        fedex_label_size="STOCK_4X6",
+    )
+    carton = Carton.model_construct(
+        carton_number="C1",
+        company="Bookstore",
+        address1="2 College Ave",
+        address2="Suite 3",
+        city="Athens",
+        state="GA",
+        postal_code="30602",
+        weight=12.5,
+        control_number="1001",
+        ps_line="2",
+        customer_purchase_order="PO-7",
+    )
+
+    request_body = build_label_request_template(form_data, settings).render([carton])
+
+    request = FedExShipmentRequest.model_validate_json(request_body)
+    assert json.loads(request_body) == request.model_dump()
+    assert request.requestedShipment.requestedPackageLineItems[0].customerReferences[0].value == "C1"
+
+    tracking_update = resolved_tracking_update("C1", json.loads(request_body), "794600000001")
+    assert tracking_update["tracking_number"] == "794600000001"
+    assert tracking_update["department"] == "C1"
+    assert tracking_update["ship_date"] == "2026-10-19"
+
+
+def test_group_shipments_by_recipient() -> None:
+    """Shippable cartons to the same recipient are grouped up to the piece limit, in order of their first carton."""
+    cartons = [
+        Carton.model_construct(
+            carton_number=carton_number,
+            company=company,
+            address1="2 College Ave",
+            address2="",
+            city="Athens",
+            state="GA",
+            postal_code="30602",
+        )
+        for carton_number, company in [
+            ("C1", "Bookstore"),
+            ("C2", "Outlet"),
+            ("C3", "BOOKSTORE "),
+            ("C4", "Bookstore"),
+            ("C5", "Bookstore"),
+        ]
+    ]
+
+    shipments = group_shipments(cartons, {"C1", "C2", "C3", "C5"}, max_pieces=2)
+
+    assert [[carton.carton_number for carton in shipment] for shipment in shipments] == [
+        ["C1", "C3"],
+        ["C2"],
+        ["C4"],
+        ["C5"],
+    ]
+
+
+def test_detached_wave_cleans_up_when_its_stream_is_cancelled() -> None:
+    """A streamed wave still finishes its cleanup when a disconnect cancels the stream through an anyio scope."""
+    cleanup: list[str] = []
+
+    async def wave() -> AsyncGenerator[str]:
+        try:
+            for label_str in ("first", "second"):
+                await asyncio.sleep(0.01)
+                yield label_str
+        finally:
+            # Like recording unstarted cartons and releasing their locks
+            await asyncio.sleep(0.01)
+            cleanup.append("recorded")
+            await asyncio.sleep(0.01)
+            cleanup.append("unlocked")
+
+    async def main() -> list[str]:
+        sent = []
+        with anyio.CancelScope() as scope:
+            async for label_str in detach_labels(wave()):
+                sent.append(label_str)
+                scope.cancel()
+        await asyncio.sleep(0.1)
+        return sent
+
+    assert asyncio.run(main()) == ["first"]
+    assert cleanup == ["recorded", "unlocked"]
+
+
+def test_detached_wave_waits_for_a_slow_client() -> None:
+    """A wave holds no more than its buffer of labels for a client that isn't reading them, and loses none."""
+    produced = 0
+
+    async def wave() -> AsyncGenerator[str]:
+        nonlocal produced
+        for number in range(100):
+            produced += 1
+            yield f"label {number}"
+
+    async def main() -> tuple[int, list[str]]:
+        labels = detach_labels(wave(), buffer_size=4)
+        first = await anext(labels)
+        # The client stalls, and the wave can only get a buffer ahead of it
+        await asyncio.sleep(0.05)
+        produced_while_stalled = produced
+        return produced_while_stalled, [first, *[label_str async for label_str in labels]]
+
+    produced_while_stalled, labels = asyncio.run(main())
+    # The label read, a full buffer, and one waiting to go into it
+    assert produced_while_stalled <= 1 + 4 + 1
+    assert labels == [f"label {number}" for number in range(100)]
+
+
+def test_failed_carton_chunk_does_not_stop_the_others(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Cartons in a chunk K-ERP couldn't look up are reported, and the chunks after it are still yielded."""
+
+    class FailingChunkCache:
+        def lookup(self, carton_numbers: list[str]) -> list[tuple[list[str], asyncio.Task[dict[str, Carton]]]]:
+            async def get_chunk(chunk: list[str]) -> dict[str, Carton]:
+                if "C3" in chunk:
+                    msg = "K-ERP is down"
+                    raise TimeoutError(msg)
+                return {number: Carton.model_construct(carton_number=number) for number in chunk if number != "C2"}
+
+            chunks = [carton_numbers[start : start + 2] for start in range(0, len(carton_numbers), 2)]
+            return [(chunk, asyncio.create_task(get_chunk(chunk))) for chunk in chunks]
+
+    monkeypatch.setattr(run_labels, "carton_cache", FailingChunkCache())
+    form_data = LabelRequestForm(
+        ship_date="2026-10-19",
+        service="FEDEX_GROUND",
+        billing="SENDER",
+        third_party_account_number="",
+        air_auth=None,
+        carton_numbers="C1\nC2\nC3\nC4\nC5",
+    )
+
+    async def main() -> list[tuple[list[str], list[str], list[str]]]:
+        return [
+            ([carton.carton_number for carton in cartons], not_found, failed)
+            async for cartons, not_found, failed in find_cartons(form_data)
+        ]
+
+    assert asyncio.run(main()) == [
+        (["C1"], ["C2"], []),
+        ([], [], ["C3", "C4"]),
+        (["C5"], [], []),
+    ]
+
+
+@pytest.mark.parametrize(
+    ("response", "stored_response"),
+    [
+        (
+            httpx.Response(502, text="<html>Bad Gateway</html>"),
+            {"status_code": 502, "text": "<html>Bad Gateway</html>"},
+        ),
+        (
+            httpx.Response(400, json={"errors": [{"code": "SHIPMENT.VALIDATION.ERROR"}]}),
+            {"errors": [{"code": "SHIPMENT.VALIDATION.ERROR"}]},
+        ),
+    ],
+)
+def test_rejected_label_with_an_odd_response_is_a_fedex_error(
+    monkeypatch: pytest.MonkeyPatch,
+    response: httpx.Response,
+    stored_response: dict[str, object],
+) -> None:
+    """FedEx rejecting a label with a page that isn't JSON, or an error without a message, is still a rejection."""
+
+    class RejectingFedEx:
+        async def create_label(self, request_body: bytes) -> httpx.Response:  # noqa: ARG002
+            return response
+
+    monkeypatch.setattr(run_labels, "fedex_client", RejectingFedEx())
+
+    results = asyncio.run(create_shipment_labels(["C1"], b"{}", [{}]))
+
+    [(label_str, outcome)] = results
+    assert label_str is not None
+    assert "C1" in label_str
+    assert outcome["status"] == "fedex_error"
+    assert outcome["fedex_create_label_response"] == stored_response
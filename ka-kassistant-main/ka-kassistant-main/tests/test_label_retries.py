@@ -0,0 +1,43 @@
+"""Test label retries."""
+
+from datetime import UTC, datetime, timedelta
+from uuid import uuid4
+
+from kassistant.label_retries import LabelRetrier, group_failures
+
+
+def test_group_failures_by_error_code() -> None:
+    """FedEx errors are grouped by code, most common first, leaving out failures because FedEx was down."""
+    created = datetime(2026, 10, 18, tzinfo=UTC)
+
+    def failure(carton_number: str, code: str) -> tuple[object, ...]:
+        return (uuid4(), carton_number, created, {"errors": [{"code": code, "message": f"{code} message"}]})
+
+    groups = group_failures(
+        [
+            failure("1", "RECIPIENTS.POSTALCODE.INVALID"),
+            failure("2", "SERVICE.UNAVAILABLE.ERROR"),
+            failure("3", "WEIGHT.VALUE.INVALID"),
+            failure("4", "WEIGHT.VALUE.INVALID"),
+            (uuid4(), "5", created, None),
+        ],  # type: ignore[arg-type]
+    )
+
+    assert [(group.code, [carton for _, carton, _ in group.shipments]) for group in groups] == [
+        ("WEIGHT.VALUE.INVALID", ["3", "4"]),
+        ("RECIPIENTS.POSTALCODE.INVALID", ["1"]),
+        ("UNKNOWN", ["5"]),
+    ]
+    assert groups[0].message == "WEIGHT.VALUE.INVALID message"
+
+
+def test_retry_delay_doubles_up_to_the_most() -> None:
+    """Each retry waits twice as long as the last, up to the longest delay."""
+    retrier = LabelRetrier(base_delay=30.0, max_delay=300.0)
+
+    assert [retrier.retry_delay(attempts) for attempts in range(1, 5)] == [
+        timedelta(seconds=60),
+        timedelta(seconds=120),
+        timedelta(seconds=240),
+        timedelta(seconds=300),
+    ]
@@ -0,0 +1,25 @@
+"""Test label storage."""
+
+import asyncio
+from uuid import uuid4
+
+from kassistant.labels import LabelCache, compress_label, decompress_label
+
+
+def test_label_compression_round_trips() -> None:
+    """Labels come back exactly as they were stored."""
+    label = "^XA^FO50,50^FDHello^FS^XZ" * 100
+    assert decompress_label(compress_label(label)) == label
+
+
+def test_label_cache_evicts_least_recently_used() -> None:
+    """Reading a label keeps it cached over labels that haven't been used since."""
+    cache = LabelCache(max_size=2)
+    first, second, third = uuid4(), uuid4(), uuid4()
+    cache.put(first, "first")
+    cache.put(second, "second")
+
+    assert asyncio.run(cache.get(first)) == "first"
+    cache.put(third, "third")
+
+    assert list(cache._labels) == [first, third]  # noqa: SLF001
@@ -0,0 +1,25 @@
+"""Test JSON serialization."""
+
+import json
+from uuid import UUID
+
+from kassistant.orm.base import RawJSON, serialize_json
+from kassistant.serialization import encode_json
+
+
+def test_encode_json_pretty_prints_the_same_data() -> None:
+    """Pretty printed JSON holds the same data as compact JSON, with UUIDs as strings."""
+    data = {"id": UUID(int=1), "payload": {"lines": ["a", "b"], "weight": 12.5, "label": None}}
+
+    compact = encode_json(data)
+    pretty = encode_json(data, indent=4)
+
+    assert b"\n" not in compact
+    assert pretty.startswith(b'{\n    "id": "00000000-0000-0000-0000-000000000001"')
+    assert json.loads(compact) == json.loads(pretty)
+
+
+def test_serialize_json_passes_raw_json_through() -> None:
+    """JSON that was already serialized is stored exactly as it was sent."""
+    raw = RawJSON(b'{"b": 1, "a": 2}')
+    assert serialize_json(raw) is raw
@@ -0,0 +1,14 @@
+"""Test shipment partitioning."""
+
+from datetime import UTC, date, datetime
+
+from kassistant.shipment_archive import month_partitions
+
+
+def test_month_partitions_cross_year_end() -> None:
+    """Partitions cover whole UTC months, in order, into the next year."""
+    assert month_partitions(date(2026, 11, 18), 3) == [
+        ("shipments_2026_11", datetime(2026, 11, 1, tzinfo=UTC), datetime(2026, 12, 1, tzinfo=UTC)),
+        ("shipments_2026_12", datetime(2026, 12, 1, tzinfo=UTC), datetime(2027, 1, 1, tzinfo=UTC)),
+        ("shipments_2027_01", datetime(2027, 1, 1, tzinfo=UTC), datetime(2027, 2, 1, tzinfo=UTC)),
+    ]
@@ -0,0 +1,75 @@
+"""Test sending the K-ERP tracking outbox."""
+
+import asyncio
+import time
+import uuid
+from collections.abc import Sequence
+from typing import Any
+
+import pytest
+from kerp_sdk.api_models import TrackingUpdateRequest
+
+from kassistant import tracking_outbox as tracking_outbox_module
+from kassistant.tracking_outbox import TrackingOutboxDrainer, item_responses
+
+
+class FakeKERP:
+    """Reject any batch holding a bad tracking number, answering the rest with one result per update."""
+
+    publish_tracking_timeout = 1.0
+
+    def __init__(self, bad: set[str]) -> None:
+        """Initialize the FakeKERP class."""
+        self.bad = bad
+        self.batches: list[int] = []
+
+    async def publish_tracking(self, tracking_updates: Sequence[Any]) -> dict[str, Any]:
+        """Write tracking numbers back, unless one of them is bad."""
+        self.batches.append(len(tracking_updates))
+        numbers = [tracking_update.tracking_number for tracking_update in tracking_updates]
+        if self.bad.intersection(numbers):
+            msg = "bad tracking number"
+            raise ValueError(msg)
+        return {"status": "ok", "data": numbers}
+
+
+def test_item_responses_split_per_update() -> None:
+    """A batch's results are split per update, and a response without them is kept whole."""
+    assert item_responses({"status": "ok", "data": ["a", "b"]}, 2) == [
+        {"status": "ok", "data": "a"},
+        {"status": "ok", "data": "b"},
+    ]
+    assert item_responses({"status": "ok"}, 2) == [{"status": "ok"}, {"status": "ok"}]
+
+
+def test_rejected_batch_is_split_until_the_bad_update_is_found(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Only the update K-ERP rejects fails, and every other update gets its own response."""
+    kerp = FakeKERP(bad={"T3"})
+    monkeypatch.setattr(tracking_outbox_module, "async_kerp_client", kerp)
+    requests = [
+        (uuid.uuid4(), TrackingUpdateRequest.model_construct(tracking_number=f"T{number}")) for number in range(8)
+    ]
+
+    results = asyncio.run(TrackingOutboxDrainer().send(requests, deadline=time.monotonic() + 60))
+
+    assert isinstance(results[requests[3][0]], ValueError)
+    assert {
+        tracking_update_id: results[tracking_update_id]["data"]
+        for tracking_update_id, _ in requests
+        if tracking_update_id != requests[3][0]
+    } == {
+        tracking_update_id: request.tracking_number
+        for tracking_update_id, request in requests
+        if request.tracking_number != "T3"
+    }
+    assert kerp.batches == [8, 4, 2, 2, 1, 1, 4]
+
+
+def test_updates_past_the_lease_are_left_unsent(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Nothing is sent once K-ERP might not answer before the claim lapses."""
+    kerp = FakeKERP(bad=set())
+    monkeypatch.setattr(tracking_outbox_module, "async_kerp_client", kerp)
+    requests = [(uuid.uuid4(), TrackingUpdateRequest.model_construct(tracking_number="T1"))]
+
+    assert asyncio.run(TrackingOutboxDrainer().send(requests, deadline=time.monotonic())) == {}
+    assert kerp.batches == []